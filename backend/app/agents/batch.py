@@ -0,0 +1,172 @@
+import asyncio
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from backend.app.database import models
+from backend.app.database.valores import normalizar_valor
+from .context import CriterioContext
+from .criteria_index import criteria_index
+from .orchestrator import MAX_CONCURRENCY, consolidate_verdicts, evaluate_test, failed_verdict, format_test_results
+from .rules import numero_comparable
+
+# Clave de agrupacion de las pruebas sin resultado: distinta de la de cualquier valor
+SIN_RESULTADO = ("sin_resultado",)
+
+# Tope de evaluaciones simultaneas que puede pedir una evaluacion masiva
+MAX_CONCURRENCIA_LOTE = int(os.getenv("MAX_CONCURRENCIA_LOTE", "32"))
+
+
+def clave_criterios(paciente: models.Paciente) -> Tuple[str, str, str]:
+    return (paciente.empresa, paciente.perfil, paciente.tipo_examen or models.TIPO_EXAMEN_POR_DEFECTO)
+
+
+def clave_valor(valor: Optional[str], token: Optional[str]):
+    """
+    Parte de la clave de agrupacion que depende del valor: su token canonico o, si
+    la ingesta no pudo tokenizarlo, su texto normalizado. Las pruebas sin
+    resultado usan `SIN_RESULTADO`, que nunca coincide con un valor.
+    """
+    if valor is None:
+        return SIN_RESULTADO
+    return token or normalizar_valor(valor)
+
+
+@dataclass
+class Lote:
+    """
+    Pacientes y criterios de una evaluacion masiva, cargados de una sola vez.
+    Los criterios se comparten entre todos los pacientes del mismo (empresa, perfil, tipo de examen).
+    """
+    pacientes: List[models.Paciente]
+    criterios: Dict[Tuple[str, str, str], Dict[str, CriterioContext]]
+    no_encontrados: List[str] = field(default_factory=list)
+    resumen: Counter = field(default_factory=Counter)
+
+
+async def cargar_lote(
+    db: AsyncSession,
+    empresa: Optional[str] = None,
+    perfil: Optional[str] = None,
+    paciente_ids: Optional[List[str]] = None,
+) -> Lote:
+    """
+    Busca los pacientes del lote (con sus resultados) y los criterios de todos
+    los perfiles involucrados: a lo sumo dos consultas, sin importar el tamaño.
+    """
+    consulta = select(models.Paciente).options(selectinload(models.Paciente.resultados))
+    if empresa:
+        consulta = consulta.filter(models.Paciente.empresa == empresa)
+    if perfil:
+        consulta = consulta.filter(models.Paciente.perfil == perfil)
+    if paciente_ids:
+        consulta = consulta.filter(models.Paciente.paciente_id.in_(paciente_ids))
+
+    pacientes = (await db.execute(consulta.order_by(models.Paciente.paciente_id))).scalars().all()
+
+    perfiles = {clave_criterios(p) for p in pacientes}
+    criterios: Dict[Tuple[str, str, str], Dict[str, CriterioContext]] = {clave: {} for clave in perfiles}
+    if criteria_index.loaded:
+        for clave in perfiles:
+            criterios[clave] = dict(criteria_index.get(*clave) or {})
+    elif perfiles:
+        filas = (await db.execute(
+            select(models.Criterio).filter(
+                tuple_(models.Criterio.empresa, models.Criterio.perfil, models.Criterio.tipo_examen).in_(list(perfiles))
+            )
+        )).scalars().all()
+        for criterio in filas:
+            criterios[(criterio.empresa, criterio.perfil, criterio.tipo_examen)][criterio.nombre_prueba] = CriterioContext.from_model(criterio)
+
+    encontrados = {p.paciente_id for p in pacientes}
+    no_encontrados = [pid for pid in (paciente_ids or []) if pid not in encontrados]
+
+    return Lote(pacientes=list(pacientes), criterios=criterios, no_encontrados=no_encontrados)
+
+
+async def ejecutar_lote(lote: Lote, max_concurrency: int = MAX_CONCURRENCY) -> AsyncIterator[Dict]:
+    """
+    Evalua todos los pacientes del lote y devuelve cada resultado apenas termina.
+    Las evaluaciones identicas (mismo criterio, prueba y valor) se hacen una sola vez.
+    """
+    semaforo = asyncio.Semaphore(max_concurrency)
+    evaluaciones: Dict[Tuple[int, str, str], asyncio.Task] = {}
+
+    async def evaluar_una_vez(criterio, nombre_prueba, valor, numero):
+        async with semaforo:
+            try:
+                resultado = await evaluate_test(criterio, nombre_prueba, valor, numero)
+            except Exception as error:
+                # Como en el grafo: la prueba queda 'Pendiente' y el resto del paciente se evalua igual
+                resultado = failed_verdict(nombre_prueba, error)
+        # Sumamos el consumo del LLM una vez por evaluacion unica, no por paciente
+        metricas = resultado.get("metrics") or {}
+        for clave in ("tokens_entrada", "tokens_salida", "costo_usd"):
+            lote.resumen[clave] += metricas.get(clave, 0)
+        return resultado
+
+    def evaluacion_compartida(criterio, nombre_prueba, resultado: Optional[models.Resultado]) -> asyncio.Task:
+        # Valor, numero y token canonico ya vienen interpretados desde la ingesta
+        valor, numero, token = (None, None, None) if resultado is None else (
+            resultado.valor,
+            numero_comparable(criterio, resultado.valor, resultado.valor_numero, resultado.valor_unidad),
+            resultado.valor_token,
+        )
+        clave = (criterio.id, nombre_prueba, clave_valor(valor, token))
+        if clave not in evaluaciones:
+            evaluaciones[clave] = asyncio.ensure_future(evaluar_una_vez(criterio, nombre_prueba, valor, numero))
+        else:
+            lote.resumen["evaluaciones_agrupadas"] += 1
+        return evaluaciones[clave]
+
+    async def evaluar_paciente(paciente) -> Dict:
+        try:
+            criterios = lote.criterios.get(clave_criterios(paciente), {})
+            if not criterios:
+                raise ValueError(f"No se encontraron criterios para el perfil {paciente.perfil}")
+
+            resultados = {r.nombre_prueba: r for r in paciente.resultados}
+            pendientes = {}
+            for nombre_prueba, criterio in criterios.items():
+                pendientes[nombre_prueba] = evaluacion_compartida(criterio, nombre_prueba, resultados.get(nombre_prueba))
+
+            test_results = {prueba: await tarea for prueba, tarea in pendientes.items()}
+            return {
+                "paciente_id": paciente.paciente_id,
+                "veredicto_general": consolidate_verdicts([r["verdict"] for r in test_results.values()]),
+                "evaluaciones": format_test_results(test_results),
+            }
+        except Exception as error:
+            # Un paciente con error no debe detener al resto del lote
+            return {"paciente_id": paciente.paciente_id, "error": str(error)}
+
+    for paciente_id in lote.no_encontrados:
+        lote.resumen["pacientes"] += 1
+        lote.resumen["errores"] += 1
+        yield {"paciente_id": paciente_id, "error": f"No se encontro al paciente con ID {paciente_id}"}
+
+    inicio = time.perf_counter()
+    tareas = [asyncio.ensure_future(evaluar_paciente(p)) for p in lote.pacientes]
+    try:
+        for siguiente in asyncio.as_completed(tareas):
+            resultado = await siguiente
+            lote.resumen["pacientes"] += 1
+            if "error" in resultado:
+                lote.resumen["errores"] += 1
+            else:
+                lote.resumen[resultado["veredicto_general"]] += 1
+                for evaluacion in resultado["evaluaciones"]:
+                    lote.resumen[f"origen_{evaluacion['origen']}"] += 1
+            yield resultado
+    finally:
+        # Si el cliente corta el stream, no dejamos tareas huerfanas
+        for tarea in tareas + list(evaluaciones.values()):
+            tarea.cancel()
+        lote.resumen["evaluaciones_unicas"] = len(evaluaciones)
+        lote.resumen["segundos"] = round(time.perf_counter() - inicio, 3)
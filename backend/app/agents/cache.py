@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from sqlalchemy import event
+
+from backend.app.database import models
+from backend.app.database.valores import normalizar_valor
+
+# Usos pendientes de guardar que fuerzan una escritura aunque no haya veredictos nuevos
+USOS_POR_ESCRITURA = int(os.getenv("VERDICT_CACHE_USOS_POR_ESCRITURA", "256"))
+
+
+def hash_criterio(criterio) -> str:
+    """
+    Huella del contenido de un criterio. Si se edita cualquier regla cambia la
+    huella, y las entradas guardadas con la version anterior dejan de usarse.
+    """
+    contenido = json.dumps(
+        [criterio.empresa, criterio.perfil, criterio.nombre_prueba,
+         criterio.apto, criterio.observado, criterio.no_apto],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+
+class VerdictCache:
+    """
+    Cache de veredictos del agente en dos niveles: un LRU en memoria y una
+    tabla SQLite local que sobrevive a reinicios, con TTL y tamaño maximo.
+    La clave es (huella del criterio, prueba, valor normalizado).
+    """
+
+    def __init__(self, path: str, ttl_seconds: int, max_entries: int, memory_size: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.memory_size = memory_size
+
+        self._memoria: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conexion: Optional[sqlite3.Connection] = None
+        self._escrituras_desde_poda = 0
+        # Ultimo uso de las entradas leidas de la tabla, pendiente de guardar (ver `get`)
+        self._usos: Dict[str, float] = {}
+
+        self.hits_memoria = 0
+        self.hits_sqlite = 0
+        self.misses = 0
+        self.escrituras = 0
+
+    @classmethod
+    def from_env(cls) -> "VerdictCache":
+        return cls(
+            path=os.getenv("VERDICT_CACHE_PATH", "./verdict_cache.db"),
+            ttl_seconds=int(os.getenv("VERDICT_CACHE_TTL", str(7 * 24 * 3600))),
+            max_entries=int(os.getenv("VERDICT_CACHE_MAX_ENTRIES", "100000")),
+            memory_size=int(os.getenv("VERDICT_CACHE_MEMORY_SIZE", "4096")),
+        )
+
+    def _db(self) -> sqlite3.Connection:
+        # Abrimos el archivo recien en el primer uso, no al importar
+        if self._conexion is None:
+            self._conexion = sqlite3.connect(self.path, check_same_thread=False)
+            self._conexion.execute("PRAGMA journal_mode=WAL")
+            self._conexion.execute(
+                """
+                CREATE TABLE IF NOT EXISTS veredictos (
+                    clave TEXT PRIMARY KEY,
+                    criterio_id INTEGER,
+                    resultado TEXT NOT NULL,
+                    creado_en REAL NOT NULL,
+                    usado_en REAL NOT NULL
+                )
+                """
+            )
+            self._conexion.execute("CREATE INDEX IF NOT EXISTS ix_veredictos_criterio ON veredictos (criterio_id)")
+            self._conexion.execute("CREATE INDEX IF NOT EXISTS ix_veredictos_usado ON veredictos (usado_en)")
+        return self._conexion
+
+    @staticmethod
+    def clave(criterio, nombre_prueba: str, valor) -> str:
+        partes = f"{hash_criterio(criterio)}|{nombre_prueba}|{normalizar_valor(valor)}"
+        return hashlib.sha256(partes.encode("utf-8")).hexdigest()
+
+    def _recordar(self, clave: str, resultado: Dict[str, str]):
+        self._memoria[clave] = resultado
+        self._memoria.move_to_end(clave)
+        while len(self._memoria) > self.memory_size:
+            self._memoria.popitem(last=False)
+
+    def get(self, criterio, nombre_prueba: str, valor) -> Optional[Dict[str, str]]:
+        clave = self.clave(criterio, nombre_prueba, valor)
+        ahora = time.time()
+
+        with self._lock:
+            if clave in self._memoria:
+                self._memoria.move_to_end(clave)
+                self.hits_memoria += 1
+                return dict(self._memoria[clave])
+
+            # Solo una lectura por clave primaria: esto corre en el event loop, en el camino de cada prueba.
+            # Las entradas vencidas las borra `_podar`
+            fila = self._db().execute(
+                "SELECT resultado, creado_en FROM veredictos WHERE clave = ?", (clave,)
+            ).fetchone()
+
+            if fila is None or ahora - fila[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+
+            # El ultimo uso solo ordena la poda: se guarda en lote, con la siguiente escritura
+            self._usos[clave] = ahora
+            if len(self._usos) >= USOS_POR_ESCRITURA:
+                self._guardar_usos()
+                self._db().commit()
+            resultado = json.loads(fila[0])
+            self._recordar(clave, resultado)
+            self.hits_sqlite += 1
+            return dict(resultado)
+
+    def put(self, criterio, nombre_prueba: str, valor, resultado: Dict[str, str]):
+        clave = self.clave(criterio, nombre_prueba, valor)
+        ahora = time.time()
+
+        with self._lock:
+            self._recordar(clave, resultado)
+            self._guardar_usos()
+            self._db().execute(
+                "INSERT OR REPLACE INTO veredictos (clave, criterio_id, resultado, creado_en, usado_en) VALUES (?, ?, ?, ?, ?)",
+                (clave, getattr(criterio, "id", None), json.dumps(resultado, ensure_ascii=False), ahora, ahora),
+            )
+            self.escrituras += 1
+            self._escrituras_desde_poda += 1
+
+            # Podamos cada cierto numero de escrituras para no contar filas en cada una
+            if self._escrituras_desde_poda >= max(1, self.max_entries // 100):
+                self._podar(ahora)
+            self._db().commit()
+
+    def _guardar_usos(self):
+        if self._usos:
+            self._db().executemany(
+                "UPDATE veredictos SET usado_en = ? WHERE clave = ?", [(usado, clave) for clave, usado in self._usos.items()]
+            )
+            self._usos.clear()
+
+    def _podar(self, ahora: float):
+        """Borra lo vencido y, si sobran filas, las menos usadas recientemente."""
+        self._escrituras_desde_poda = 0
+        self._guardar_usos()
+        db = self._db()
+        db.execute("DELETE FROM veredictos WHERE creado_en < ?", (ahora - self.ttl_seconds,))
+        total = db.execute("SELECT COUNT(*) FROM veredictos").fetchone()[0]
+        if total > self.max_entries:
+            db.execute(
+                "DELETE FROM veredictos WHERE clave IN (SELECT clave FROM veredictos ORDER BY usado_en LIMIT ?)",
+                (total - self.max_entries,),
+            )
+
+    def invalidar_criterio(self, criterio_id: int):
+        """Borra todas las entradas de un criterio (se llama al editarlo o borrarlo)."""
+        with self._lock:
+            self._memoria.clear()
+            self._db().execute("DELETE FROM veredictos WHERE criterio_id = ?", (criterio_id,))
+            self._db().commit()
+
+    def clear(self):
+        with self._lock:
+            self._memoria.clear()
+            self._usos.clear()
+            self._db().execute("DELETE FROM veredictos")
+            self._db().commit()
+
+    def stats(self) -> Dict[str, float]:
+        consultas = self.hits_memoria + self.hits_sqlite + self.misses
+        return {
+            "hits_memoria": self.hits_memoria,
+            "hits_sqlite": self.hits_sqlite,
+            "misses": self.misses,
+            "escrituras": self.escrituras,
+            "hit_rate": (self.hits_memoria + self.hits_sqlite) / consultas if consultas else 0.0,
+            "entradas_memoria": len(self._memoria),
+        }
+
+
+verdict_cache = VerdictCache.from_env()
+
+
+@event.listens_for(models.Criterio, "after_update")
+@event.listens_for(models.Criterio, "after_delete")
+def _invalidar_al_editar(mapper, connection, target):
+    # La huella ya evita usar veredictos viejos; ademas liberamos su espacio
+    verdict_cache.invalidar_criterio(target.id)
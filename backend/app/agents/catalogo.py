@@ -0,0 +1,68 @@
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.app.database import models
+
+TAMANO_PAGINA = 50
+MAX_TAMANO_PAGINA = 500
+
+CAMPOS_CATALOGO = ("paciente_id", "empresa", "perfil", "tipo_examen", "puesto_ocupacional", "sexo")
+
+
+@dataclass(frozen=True)
+class PaginaPacientes:
+    pacientes: List[Dict]
+    siguiente: Optional[str] # paciente_id desde el que pedir la pagina siguiente (None si es la ultima)
+    etag: str # Cambia si cambia algun paciente de la pagina o el final de la pagina
+    ultima_modificacion: Optional[float] # El cambio mas reciente entre los pacientes de la pagina
+    limite: int # Tamaño de pagina aplicado (acotado a MAX_TAMANO_PAGINA)
+
+
+async def listar_pacientes(
+    db: AsyncSession,
+    empresa: Optional[str] = None,
+    perfil: Optional[str] = None,
+    tipo_examen: Optional[str] = None,
+    buscar: Optional[str] = None,
+    despues: Optional[str] = None,
+    limite: int = TAMANO_PAGINA,
+) -> PaginaPacientes:
+    """
+    Una pagina del catalogo ordenada por paciente_id. La paginacion es por
+    clave (`paciente_id > despues`), no por OFFSET: cualquier pagina cuesta lo
+    mismo que la primera. `buscar` es un prefijo del paciente_id.
+    """
+    limite = max(1, min(limite, MAX_TAMANO_PAGINA))
+    paciente = models.Paciente
+    consulta = select(*(getattr(paciente, campo) for campo in CAMPOS_CATALOGO), paciente.huella_datos, paciente.actualizado_en)
+
+    for columna, valor in ((paciente.empresa, empresa), (paciente.perfil, perfil), (paciente.tipo_examen, tipo_examen)):
+        if valor:
+            consulta = consulta.where(columna == valor)
+    if buscar:
+        # Prefijo como rango sobre el indice (LIKE no lo usa en SQLite)
+        consulta = consulta.where(paciente.paciente_id >= buscar, paciente.paciente_id < buscar + "\U0010ffff")
+    if despues:
+        consulta = consulta.where(paciente.paciente_id > despues)
+
+    # Una fila de mas para saber si hay pagina siguiente sin contar la tabla
+    filas = (await db.execute(consulta.order_by(paciente.paciente_id).limit(limite + 1))).all()
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+
+    siguiente = filas[-1].paciente_id if hay_mas else None
+    contenido = json.dumps([[f.paciente_id, f.huella_datos, f.tipo_examen] for f in filas] + [siguiente], ensure_ascii=False)
+    modificaciones = [f.actualizado_en for f in filas if f.actualizado_en is not None]
+
+    return PaginaPacientes(
+        pacientes=[{campo: getattr(f, campo) for campo in CAMPOS_CATALOGO} for f in filas],
+        siguiente=siguiente,
+        etag=hashlib.sha256(contenido.encode("utf-8")).hexdigest()[:32],
+        ultima_modificacion=max(modificaciones) if modificaciones else None,
+        limite=limite,
+    )
@@ -0,0 +1,282 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from .orchestrator import SOURCES_TO_RETRY
+
+logger = logging.getLogger(__name__)
+
+# Guardar el estado del grafo despues de cada paso para reanudar las evaluaciones que fallan
+USAR_CHECKPOINTS = os.getenv("USAR_CHECKPOINTS", "1") == "1"
+CHECKPOINTS_PATH = os.getenv("CHECKPOINTS_PATH", "./checkpoints.db")
+# Una ejecucion `en_proceso` sin novedades en este plazo se considera interrumpida (su proceso murio)
+EJECUCION_PLAZO_SEGUNDOS = int(os.getenv("EJECUCION_PLAZO_SEGUNDOS", "300"))
+# Las ejecuciones sin terminar mas viejas que esto se borran al arrancar
+CHECKPOINTS_TTL_HORAS = float(os.getenv("CHECKPOINTS_TTL_HORAS", "72"))
+
+EN_PROCESO = "en_proceso"
+PARCIAL = "parcial" # Termino con pruebas fallidas (o resueltas sin LLM)
+INTERRUMPIDA = "interrumpida" # Una excepcion corto el grafo a mitad de camino
+COMPLETADA = "completada"
+
+
+class EjecucionEnCurso(Exception):
+    """Otra peticion (o un worker) esta corriendo esa ejecucion."""
+
+
+def thread_id(paciente_id: str, ejecucion: str) -> str:
+    """Clave del checkpointer: cada ejecucion de un paciente es un hilo distinto."""
+    return f"{paciente_id}:{ejecucion}"
+
+
+def pruebas_fallidas(test_results: Dict[str, Dict]) -> List[str]:
+    return [test for test, res in test_results.items() if res.get("source") in SOURCES_TO_RETRY]
+
+
+class Ejecuciones:
+    """
+    Ejecuciones del grafo con checkpoints en una base SQLite local. El estado
+    se guarda despues de cada paso, asi un reintento retoma la ejecucion en
+    vez de empezar de cero: si una excepcion corto el grafo, solo corren los
+    pasos que faltaban (las ramas de `run_agent` que terminaron no se repiten);
+    si termino con pruebas fallidas, solo se re-evaluan esas.
+    La tabla `ejecuciones` registra cada una para reanudarla o inspeccionarla.
+    Las completadas se borran del checkpointer: solo ocupan lugar las parciales.
+    """
+
+    def __init__(self, path: str, activo: bool = True):
+        self.path = path
+        self.activo = activo
+        self.checkpointer = None
+        self._conexion = None
+        # Tareas que renuevan `actualizado_en` de las ejecuciones en curso (de `preparar` a `terminar`)
+        self._latidos: Dict[str, asyncio.Task] = {}
+
+    @classmethod
+    def from_env(cls) -> "Ejecuciones":
+        return cls(CHECKPOINTS_PATH, USAR_CHECKPOINTS)
+
+    async def abrir(self):
+        if not self.activo:
+            return
+        # Se importa aqui: sin checkpoints no hace falta cargarlo
+        import aiosqlite
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+        self._conexion = await aiosqlite.connect(self.path)
+        try:
+            await self._crear_tablas(AsyncSqliteSaver)
+        except BaseException:
+            # Si no, el hilo de aiosqlite queda vivo y el proceso no termina
+            await self.cerrar()
+            raise
+        await self.purgar(CHECKPOINTS_TTL_HORAS * 3600)
+
+    async def _crear_tablas(self, AsyncSqliteSaver):
+        await self._conexion.execute("PRAGMA journal_mode=WAL")
+        self.checkpointer = AsyncSqliteSaver(self._conexion)
+        await self.checkpointer.setup()
+        await self._conexion.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ejecuciones (
+                thread_id TEXT PRIMARY KEY,
+                paciente_id TEXT NOT NULL,
+                ejecucion TEXT NOT NULL,
+                estado TEXT NOT NULL,
+                pruebas_fallidas TEXT,
+                error TEXT,
+                intentos INTEGER NOT NULL DEFAULT 0,
+                creado_en REAL NOT NULL,
+                actualizado_en REAL NOT NULL
+            )
+            """
+        )
+        await self._conexion.execute("CREATE INDEX IF NOT EXISTS ix_ejecuciones_paciente ON ejecuciones (paciente_id, actualizado_en)")
+        await self._conexion.commit()
+
+    async def cerrar(self):
+        for latido in self._latidos.values():
+            latido.cancel()
+        self._latidos.clear()
+        if self._conexion is not None:
+            await self._conexion.close()
+            self._conexion = None
+            self.checkpointer = None
+
+    @staticmethod
+    def _a_dict(cursor, fila) -> Optional[Dict]:
+        if fila is None:
+            return None
+        ejecucion = dict(zip((c[0] for c in cursor.description), fila))
+        ejecucion["pruebas_fallidas"] = json.loads(ejecucion["pruebas_fallidas"] or "[]")
+        return ejecucion
+
+    async def _reclamar(self, paciente_id: str, ejecucion: str) -> bool:
+        """
+        Marca la ejecucion `en_proceso` (o la crea) si nadie la esta corriendo.
+        Es una sola sentencia: de dos peticiones que quieren retomar la misma
+        ejecucion, solo una la reclama. Devuelve si se pudo reclamar.
+        """
+        ahora = time.time()
+        cursor = await self._conexion.execute(
+            """
+            INSERT INTO ejecuciones (thread_id, paciente_id, ejecucion, estado, pruebas_fallidas, error, intentos, creado_en, actualizado_en)
+            VALUES (?, ?, ?, ?, '[]', NULL, 1, ?, ?)
+            ON CONFLICT (thread_id) DO UPDATE SET
+                estado = excluded.estado, error = NULL, intentos = intentos + 1, actualizado_en = excluded.actualizado_en
+            WHERE estado != ? OR actualizado_en < ?
+            """,
+            (
+                thread_id(paciente_id, ejecucion), paciente_id, ejecucion, EN_PROCESO, ahora, ahora,
+                EN_PROCESO, ahora - EJECUCION_PLAZO_SEGUNDOS,
+            ),
+        )
+        await self._conexion.commit()
+        return cursor.rowcount == 1
+
+    async def _latido(self, thread: str):
+        """Mientras corre el grafo: una ejecucion larga no debe parecer abandonada y reclamarse de nuevo."""
+        while True:
+            await asyncio.sleep(EJECUCION_PLAZO_SEGUNDOS / 3)
+            await self._conexion.execute(
+                "UPDATE ejecuciones SET actualizado_en = ? WHERE thread_id = ? AND estado = ?", (time.time(), thread, EN_PROCESO)
+            )
+            await self._conexion.commit()
+
+    async def _registrar(self, paciente_id: str, ejecucion: str, estado: str,
+                         fallidas: Optional[List[str]] = None, error: Optional[str] = None):
+        await self._conexion.execute(
+            "UPDATE ejecuciones SET estado = ?, pruebas_fallidas = ?, error = ?, actualizado_en = ? WHERE thread_id = ?",
+            (estado, json.dumps(fallidas or [], ensure_ascii=False), error, time.time(), thread_id(paciente_id, ejecucion)),
+        )
+        await self._conexion.commit()
+
+    async def obtener(self, paciente_id: str, ejecucion: str) -> Optional[Dict]:
+        cursor = await self._conexion.execute(
+            "SELECT * FROM ejecuciones WHERE thread_id = ?", (thread_id(paciente_id, ejecucion),)
+        )
+        return self._a_dict(cursor, await cursor.fetchone())
+
+    async def listar(self, paciente_id: str, limite: int = 20) -> List[Dict]:
+        cursor = await self._conexion.execute(
+            "SELECT * FROM ejecuciones WHERE paciente_id = ? ORDER BY actualizado_en DESC LIMIT ?", (paciente_id, limite)
+        )
+        return [self._a_dict(cursor, fila) for fila in await cursor.fetchall()]
+
+    async def pendiente(self, paciente_id: str) -> Optional[str]:
+        """La ultima ejecucion del paciente que quedo sin terminar (y que nadie esta corriendo)."""
+        cursor = await self._conexion.execute(
+            "SELECT ejecucion FROM ejecuciones WHERE paciente_id = ? AND (estado IN (?, ?) OR (estado = ? AND actualizado_en < ?)) "
+            "ORDER BY actualizado_en DESC LIMIT 1",
+            (paciente_id, PARCIAL, INTERRUMPIDA, EN_PROCESO, time.time() - EJECUCION_PLAZO_SEGUNDOS),
+        )
+        fila = await cursor.fetchone()
+        return fila[0] if fila else None
+
+    async def purgar(self, antiguedad_segundos: float):
+        cursor = await self._conexion.execute(
+            "SELECT thread_id FROM ejecuciones WHERE actualizado_en < ?", (time.time() - antiguedad_segundos,)
+        )
+        viejas = [fila[0] for fila in await cursor.fetchall()]
+        for thread in viejas:
+            await self.checkpointer.adelete_thread(thread)
+        await self._conexion.execute("DELETE FROM ejecuciones WHERE actualizado_en < ?", (time.time() - antiguedad_segundos,))
+        await self._conexion.commit()
+        if viejas:
+            logger.info("Se borraron %d ejecuciones de mas de %.0f horas", len(viejas), antiguedad_segundos / 3600)
+
+    async def estado(self, graph, paciente_id: str, ejecucion: str) -> Optional[Dict]:
+        """
+        Lo guardado de una ejecucion: su registro, los resultados de las pruebas
+        que ya terminaron y los pasos del grafo que le faltan.
+        """
+        registro = await self.obtener(paciente_id, ejecucion)
+        if registro is None:
+            return None
+        snapshot = await graph.aget_state({"configurable": {"thread_id": thread_id(paciente_id, ejecucion)}})
+        valores = snapshot.values or {}
+        # Los resultados de las ramas que terminaron antes de un corte quedan como escrituras pendientes
+        test_results = dict(valores.get("test_results") or {})
+        for tarea in snapshot.tasks:
+            if tarea.name == "run_agent" and isinstance(tarea.result, dict):
+                test_results.update(tarea.result.get("test_results") or {})
+        return {
+            **registro,
+            "pruebas": list(valores["context"].nombres_pruebas) if valores.get("context") is not None else [],
+            "test_results": test_results,
+            "siguientes_pasos": list(snapshot.next),
+            "veredicto_general": valores.get("final_veredict") if not snapshot.next else None,
+        }
+
+    async def preparar(self, graph, paciente_id: str, config: Dict, ejecucion: Optional[str] = None,
+                       nueva: bool = False) -> Tuple[Optional[str], Dict, Optional[Dict]]:
+        """
+        Elige la ejecucion: `ejecucion`, o si no se indica y `nueva` es False, la
+        ultima del paciente que quedo sin terminar, o una nueva. La reclama antes
+        de usarla (ver `_reclamar`): si la pendiente ya la tomo otro, empieza una
+        nueva; si la indicada esta en curso, lanza `EjecucionEnCurso`. Devuelve la
+        ejecucion, la config con su `thread_id` y la entrada para el grafo.
+        """
+        if not self.activo:
+            return None, config, {"patient_id": paciente_id}
+
+        if ejecucion is not None:
+            if not await self._reclamar(paciente_id, ejecucion):
+                raise EjecucionEnCurso(f"La ejecucion {ejecucion} del paciente {paciente_id} esta en curso")
+        else:
+            pendiente = None if nueva else await self.pendiente(paciente_id)
+            if pendiente is not None and await self._reclamar(paciente_id, pendiente):
+                ejecucion = pendiente
+            else:
+                ejecucion = uuid.uuid4().hex[:16]
+                await self._reclamar(paciente_id, ejecucion)
+        config = {**config, "configurable": {**config.get("configurable", {}), "thread_id": thread_id(paciente_id, ejecucion)}}
+
+        # Cortada a mitad del grafo: se sigue desde los pasos que faltan. Terminada (o nueva):
+        # el grafo corre de nuevo y `fetch_tests` conserva las pruebas que ya estaban bien
+        snapshot = await graph.aget_state(config)
+        if snapshot.next:
+            logger.info("Reanudando la ejecucion %s desde %s", thread_id(paciente_id, ejecucion), list(snapshot.next))
+
+        thread = thread_id(paciente_id, ejecucion)
+        self._latidos[thread] = asyncio.create_task(self._latido(thread))
+        return ejecucion, config, None if snapshot.next else {"patient_id": paciente_id}
+
+    async def terminar(self, paciente_id: str, ejecucion: Optional[str], final_state: Optional[Dict] = None,
+                       error: Optional[BaseException] = None):
+        """Registra como termino la ejecucion; las completadas se borran del checkpointer."""
+        if not self.activo or ejecucion is None:
+            return
+        latido = self._latidos.pop(thread_id(paciente_id, ejecucion), None)
+        if latido is not None:
+            latido.cancel()
+        if error is not None:
+            # Protegido: si la tarea se cancelo, la cancelacion no debe cortar tambien el registro
+            await asyncio.shield(self._registrar(paciente_id, ejecucion, INTERRUMPIDA, error=f"{type(error).__name__}: {error}"))
+            return
+        fallidas = pruebas_fallidas(final_state["test_results"])
+        if fallidas:
+            await self._registrar(paciente_id, ejecucion, PARCIAL, fallidas)
+        else:
+            await self._registrar(paciente_id, ejecucion, COMPLETADA)
+            await self.checkpointer.adelete_thread(thread_id(paciente_id, ejecucion))
+
+    async def ejecutar(self, graph, paciente_id: str, config: Dict, ejecucion: Optional[str] = None,
+                       nueva: bool = False) -> Tuple[Optional[str], Dict]:
+        """Evalua al paciente retomando o empezando una ejecucion (ver `preparar`). Devuelve la ejecucion y el estado final."""
+        ejecucion, config, entrada = await self.preparar(graph, paciente_id, config, ejecucion, nueva)
+        try:
+            final_state = await graph.ainvoke(entrada, config=config)
+        except BaseException as error:
+            # Tambien si la peticion se cancela: lo que termino queda en el checkpoint
+            await self.terminar(paciente_id, ejecucion, error=error)
+            raise
+        await self.terminar(paciente_id, ejecucion, final_state)
+        return ejecucion, final_state
+
+
+ejecuciones = Ejecuciones.from_env()
@@ -0,0 +1,330 @@
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, select
+from sqlalchemy.engine import Engine
+
+from backend.app.database import models
+from backend.app.database.valores import normalizar, normalizar_texto
+from backend.app.observability import CLASSIFIER_DECISIONS
+from .cache import hash_criterio
+from .history import hash_valor
+from .rules import ORDEN_VEREDICTOS
+
+logger = logging.getLogger(__name__)
+
+# "1": los hallazgos de texto pasan por el clasificador local antes de ir al agente
+USAR_CLASIFICADOR = os.getenv("USAR_CLASIFICADOR", "1") == "1"
+CLASIFICADOR_PATH = os.getenv("CLASIFICADOR_PATH", "./clasificador_veredictos.json")
+# Por debajo de esta confianza la prueba va al agente
+CLASIFICADOR_UMBRAL = float(os.getenv("CLASIFICADOR_UMBRAL", "0.9"))
+# Veredictos del agente que necesita un modelo para generalizar a textos que no vio
+CLASIFICADOR_MIN_EJEMPLOS = int(os.getenv("CLASIFICADOR_MIN_EJEMPLOS", "5"))
+
+VEREDICTOS = tuple(veredicto for _, veredicto in ORDEN_VEREDICTOS)
+
+# Fraccion minima de rasgos del texto que el modelo ya vio: si casi todo es
+# nuevo ('Otoscopia con tapon de cerumen'), una palabra suelta como 'de' no decide
+MIN_RASGOS_CONOCIDOS = 0.5
+
+_PALABRA = re.compile(r"[a-z0-9]+")
+
+
+def clave_modelo(empresa: str, perfil: str, tipo_examen: str, nombre_prueba: str) -> str:
+    # Un modelo por criterio: el mismo hallazgo puede ser apto en un perfil y no en otro
+    return "|".join((empresa, perfil, tipo_examen, nombre_prueba))
+
+
+def es_texto(valor) -> bool:
+    """Los numeros los decide el motor de reglas: el clasificador solo ve hallazgos de texto."""
+    normalizado = normalizar(str(valor))
+    return normalizado.numero is None and normalizado.componentes is None
+
+
+def rasgos(valor) -> List[str]:
+    """Palabras y pares de palabras: 'sin alteraciones' no es lo mismo que 'alteraciones'."""
+    palabras = _PALABRA.findall(normalizar_texto(str(valor)))
+    return palabras + [f"{a} {b}" for a, b in zip(palabras, palabras[1:])]
+
+
+@dataclass(frozen=True)
+class Ejemplo:
+    """Un veredicto del agente para un hallazgo de texto, con el criterio vigente."""
+    clave: str
+    version_criterio: str
+    valor: str
+    veredicto: str
+
+
+@dataclass
+class ModeloPrueba:
+    """
+    Clasificador de un criterio: busqueda exacta del texto normalizado y, para
+    textos que no vio, Naive Bayes multinomial sobre sus palabras. Solo son
+    diccionarios: predecir toma microsegundos.
+    """
+    version_criterio: str # hash_criterio con que se entreno: si se edita el criterio, el modelo no se usa
+    exactos: Dict[str, Dict[str, int]] = field(default_factory=dict) # token -> veredicto -> veces
+    clases: Dict[str, int] = field(default_factory=dict) # veredicto -> ejemplos
+    palabras: Dict[str, Dict[str, int]] = field(default_factory=dict) # veredicto -> rasgo -> veces
+    totales: Dict[str, int] = field(default_factory=dict) # veredicto -> rasgos en total
+    vocabulario: set = field(default_factory=set)
+    ejemplos: int = 0
+
+    def agregar(self, valor: str, veredicto: str):
+        token = normalizar(valor).token
+        conteo = self.exactos.setdefault(token, {})
+        conteo[veredicto] = conteo.get(veredicto, 0) + 1
+        self.clases[veredicto] = self.clases.get(veredicto, 0) + 1
+        palabras = self.palabras.setdefault(veredicto, {})
+        for rasgo in rasgos(valor):
+            palabras[rasgo] = palabras.get(rasgo, 0) + 1
+            self.totales[veredicto] = self.totales.get(veredicto, 0) + 1
+            self.vocabulario.add(rasgo)
+        self.ejemplos += 1
+
+    def predecir(self, valor: str, min_ejemplos: int = CLASIFICADOR_MIN_EJEMPLOS) -> Optional[Tuple[str, float, str]]:
+        """(veredicto, confianza, metodo) o None si no hay con que decidir."""
+        conteo = self.exactos.get(normalizar(valor).token)
+        if conteo:
+            # El agente ya vio este mismo texto con este mismo criterio
+            veredicto = max(conteo, key=conteo.get)
+            return veredicto, conteo[veredicto] / sum(conteo.values()), "exacto"
+
+        if self.ejemplos < min_ejemplos:
+            return None
+        todos = rasgos(valor)
+        conocidos = [r for r in todos if r in self.vocabulario]
+        if not conocidos or len(conocidos) < MIN_RASGOS_CONOCIDOS * len(todos):
+            return None
+
+        # Naive Bayes con suavizado de Laplace, en logaritmos
+        puntajes = {}
+        for veredicto, ejemplos in self.clases.items():
+            palabras = self.palabras.get(veredicto, {})
+            denominador = self.totales.get(veredicto, 0) + len(self.vocabulario)
+            puntajes[veredicto] = math.log(ejemplos / self.ejemplos) + sum(
+                math.log((palabras.get(r, 0) + 1) / denominador) for r in conocidos
+            )
+        maximo = max(puntajes.values())
+        exponenciales = {v: math.exp(p - maximo) for v, p in puntajes.items()}
+        veredicto = max(exponenciales, key=exponenciales.get)
+        return veredicto, exponenciales[veredicto] / sum(exponenciales.values()), "palabras"
+
+    def as_dict(self) -> Dict:
+        return {
+            "version_criterio": self.version_criterio, "exactos": self.exactos, "clases": self.clases,
+            "palabras": self.palabras, "totales": self.totales, "ejemplos": self.ejemplos,
+        }
+
+    @classmethod
+    def from_dict(cls, datos: Dict) -> "ModeloPrueba":
+        modelo = cls(**{**datos, "vocabulario": set()})
+        modelo.vocabulario = {r for palabras in modelo.palabras.values() for r in palabras}
+        return modelo
+
+
+def entrenar_modelos(ejemplos: Iterable[Ejemplo]) -> Dict[str, ModeloPrueba]:
+    modelos: Dict[str, ModeloPrueba] = {}
+    for ejemplo in ejemplos:
+        modelo = modelos.get(ejemplo.clave)
+        if modelo is None or modelo.version_criterio != ejemplo.version_criterio:
+            modelo = modelos[ejemplo.clave] = ModeloPrueba(ejemplo.version_criterio)
+        modelo.agregar(ejemplo.valor, ejemplo.veredicto)
+    return modelos
+
+
+def cargar_ejemplos(engine: Engine) -> List[Ejemplo]:
+    """
+    Veredictos del agente guardados en `evaluaciones_pruebas` para hallazgos de
+    texto, con el valor que tenia el paciente. Se descartan los de criterios
+    editados despues (otra version) y los de resultados que cambiaron desde
+    entonces (otro hash del valor). Las pruebas reutilizadas no cuentan dos veces.
+    """
+    prueba, evaluacion, criterio = models.EvaluacionPrueba, models.Evaluacion, models.Criterio
+    consulta = (
+        select(
+            criterio.empresa, criterio.perfil, criterio.tipo_examen, criterio.nombre_prueba,
+            criterio.apto, criterio.observado, criterio.no_apto,
+            prueba.version_criterio, prueba.hash_valor, prueba.veredicto, models.Resultado.valor,
+        )
+        .join(evaluacion, prueba.evaluacion_id == evaluacion.id)
+        .join(models.Paciente, models.Paciente.paciente_id == evaluacion.paciente_id)
+        .join(models.Resultado, and_(
+            models.Resultado.paciente_id == models.Paciente.id, models.Resultado.nombre_prueba == prueba.nombre_prueba,
+        ))
+        .join(criterio, criterio.id == prueba.criterio_id)
+        .where(prueba.origen == "agent", prueba.reutilizada.is_not(True), prueba.veredicto.in_(VEREDICTOS))
+        .order_by(prueba.id)
+    )
+
+    ejemplos = []
+    with engine.connect() as conexion:
+        for fila in conexion.execute(consulta):
+            version = hash_criterio(fila)
+            if fila.version_criterio != version or fila.hash_valor != hash_valor(fila.valor) or not es_texto(fila.valor):
+                continue
+            ejemplos.append(Ejemplo(
+                clave_modelo(fila.empresa, fila.perfil, fila.tipo_examen, fila.nombre_prueba),
+                version, fila.valor, fila.veredicto,
+            ))
+    return ejemplos
+
+
+def reporte(ejemplos: List[Ejemplo], umbral: float = CLASIFICADOR_UMBRAL, pliegues: int = 5,
+            min_ejemplos: int = CLASIFICADOR_MIN_EJEMPLOS) -> Dict:
+    """
+    Precision y cobertura con validacion cruzada agrupada por texto: un mismo
+    hallazgo nunca esta a la vez en entrenamiento y prueba, asi que mide lo que
+    el clasificador agrega sobre el cache de veredictos (textos nuevos).
+    Cobertura: casos que decide sin el agente; precision: aciertos entre esos.
+    """
+    por_modelo: Dict[str, Dict[str, int]] = defaultdict(lambda: {"ejemplos": 0, "decididos": 0, "aciertos": 0, "aciertos_sin_umbral": 0})
+    for pliegue in range(pliegues):
+        def en_prueba(ejemplo: Ejemplo) -> bool:
+            return zlib.crc32(normalizar(ejemplo.valor).token.encode("utf-8")) % pliegues == pliegue
+
+        modelos = entrenar_modelos(e for e in ejemplos if not en_prueba(e))
+        for ejemplo in filter(en_prueba, ejemplos):
+            cuenta = por_modelo[ejemplo.clave]
+            cuenta["ejemplos"] += 1
+            modelo = modelos.get(ejemplo.clave)
+            prediccion = modelo.predecir(ejemplo.valor, min_ejemplos) if modelo is not None else None
+            if prediccion is None:
+                continue
+            cuenta["aciertos_sin_umbral"] += prediccion[0] == ejemplo.veredicto
+            if prediccion[1] >= umbral:
+                cuenta["decididos"] += 1
+                cuenta["aciertos"] += prediccion[0] == ejemplo.veredicto
+
+    def resumen(cuenta: Dict[str, int]) -> Dict:
+        return {
+            **cuenta,
+            "cobertura": round(cuenta["decididos"] / cuenta["ejemplos"], 4) if cuenta["ejemplos"] else 0.0,
+            "precision": round(cuenta["aciertos"] / cuenta["decididos"], 4) if cuenta["decididos"] else None,
+        }
+
+    total = {campo: sum(c[campo] for c in por_modelo.values()) for campo in ("ejemplos", "decididos", "aciertos", "aciertos_sin_umbral")}
+
+    # Latencia de una prediccion con los modelos completos
+    modelos = entrenar_modelos(ejemplos)
+    duraciones = []
+    for ejemplo in ejemplos:
+        inicio = time.perf_counter()
+        modelos[ejemplo.clave].predecir(ejemplo.valor, min_ejemplos)
+        duraciones.append(time.perf_counter() - inicio)
+    duraciones.sort()
+
+    return {
+        "umbral": umbral,
+        "pliegues": pliegues,
+        "modelos": len(modelos),
+        **resumen(total),
+        "latencia_p50_ms": round(duraciones[len(duraciones) // 2] * 1000, 4) if duraciones else None,
+        "latencia_p99_ms": round(duraciones[int(len(duraciones) * 0.99)] * 1000, 4) if duraciones else None,
+        "por_modelo": {clave: resumen(cuenta) for clave, cuenta in sorted(por_modelo.items())},
+    }
+
+
+def guardar_modelos(modelos: Dict[str, ModeloPrueba], path: str = CLASIFICADOR_PATH):
+    # Escritura atomica: la API puede estar leyendo el archivo anterior
+    temporal = f"{path}.tmp"
+    with open(temporal, "w", encoding="utf-8") as archivo:
+        json.dump({clave: modelo.as_dict() for clave, modelo in modelos.items()}, archivo, ensure_ascii=False)
+    os.replace(temporal, path)
+
+
+class ClasificadorLocal:
+    """
+    Modelos entrenados con `entrenar_clasificador.py`, cargados del archivo en
+    el primer uso. Decide un hallazgo de texto si la confianza llega al umbral;
+    si no, devuelve None y la prueba sigue al agente.
+    """
+
+    def __init__(self, path: str, umbral: float, min_ejemplos: int, activo: bool = True):
+        self.path = path
+        self.umbral = umbral
+        self.min_ejemplos = min_ejemplos
+        self.activo = activo
+        self._modelos: Optional[Dict[str, ModeloPrueba]] = None
+        self._lock = threading.Lock()
+        self.decididas = 0
+        self.derivadas = 0
+
+    @classmethod
+    def from_env(cls) -> "ClasificadorLocal":
+        return cls(CLASIFICADOR_PATH, CLASIFICADOR_UMBRAL, CLASIFICADOR_MIN_EJEMPLOS, USAR_CLASIFICADOR)
+
+    def _cargados(self) -> Dict[str, ModeloPrueba]:
+        if self._modelos is None:
+            with self._lock:
+                if self._modelos is None:
+                    self._modelos = self._leer()
+        return self._modelos
+
+    def _leer(self) -> Dict[str, ModeloPrueba]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r", encoding="utf-8") as archivo:
+            modelos = {clave: ModeloPrueba.from_dict(datos) for clave, datos in json.load(archivo).items()}
+        logger.info("Clasificador local cargado: %d modelos desde %s", len(modelos), self.path)
+        return modelos
+
+    def recargar(self):
+        """Lee de nuevo el archivo (despues de re-entrenar) y lo reemplaza de una vez."""
+        modelos = self._leer()
+        self._modelos = modelos
+
+    def usar(self, modelos: Dict[str, ModeloPrueba]):
+        self._modelos = modelos
+
+    def predecir(self, criterio, nombre_prueba: str, valor: Optional[str]) -> Optional[Dict[str, str]]:
+        if not self.activo or valor is None or not es_texto(valor):
+            return None
+        modelo = self._cargados().get(clave_modelo(criterio.empresa, criterio.perfil, criterio.tipo_examen, nombre_prueba))
+        if modelo is None or modelo.version_criterio != hash_criterio(criterio):
+            return None
+
+        prediccion = modelo.predecir(valor, self.min_ejemplos)
+        if prediccion is None or prediccion[1] < self.umbral:
+            self.derivadas += 1
+            CLASSIFIER_DECISIONS.labels("derivada").inc()
+            return None
+
+        veredicto, confianza, metodo = prediccion
+        self.decididas += 1
+        CLASSIFIER_DECISIONS.labels("decidida").inc()
+        como = "el mismo texto" if metodo == "exacto" else "sus palabras"
+        return {
+            "verdict": veredicto,
+            "reasoning": (
+                f"Clasificador local: '{valor}' se decidio por {como}, con confianza {confianza:.2f}, "
+                f"a partir de {modelo.ejemplos} veredictos anteriores del agente para '{nombre_prueba}'."
+            ),
+            "source": "classifier",
+        }
+
+    def stats(self) -> Dict:
+        consultas = self.decididas + self.derivadas
+        modelos = self._cargados()
+        return {
+            "activo": self.activo,
+            "umbral": self.umbral,
+            "modelos": len(modelos),
+            "ejemplos": sum(m.ejemplos for m in modelos.values()),
+            "decididas": self.decididas,
+            "derivadas": self.derivadas,
+            "tasa_decididas": self.decididas / consultas if consultas else 0.0,
+        }
+
+
+clasificador = ClasificadorLocal.from_env()
@@ -0,0 +1,263 @@
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, tuple_
+from sqlalchemy.engine import Engine
+
+from backend.app.database import models
+from .cache import verdict_cache
+from .clasificador import clasificador
+from .context import CriterioContext
+from .rules import ORDEN_VEREDICTOS
+
+# Veredictos en orden de gravedad: su posicion es la que se compara al consolidar
+VEREDICTOS = [veredicto for _, veredicto in ORDEN_VEREDICTOS]
+
+# Veredicto general de un paciente con pruebas que solo puede resolver el agente
+PENDIENTE = "Pendiente"
+
+_SIN_DECIDIR = -1
+
+COLUMNAS_PRUEBAS = ["paciente_id", "empresa", "perfil", "tipo_examen", "nombre_prueba", "valor", "numero", "veredicto", "origen"]
+
+
+@dataclass
+class Tamizaje:
+    """
+    Resultado del tamizaje de una cohorte: una fila por paciente y prueba
+    (`pruebas`) y una por paciente con el veredicto consolidado (`pacientes`).
+    """
+    pruebas: pd.DataFrame
+    pacientes: pd.DataFrame
+    segundos: float
+    segundos_carga: float # Parte de `segundos` que tomo leer la BD
+
+    @property
+    def pendientes(self) -> pd.DataFrame:
+        """Filas que no se pudieron decidir con reglas ni cache: quedan para el agente."""
+        return self.pruebas[self.pruebas["origen"] == "pending"]
+
+
+def cargar(
+    engine: Engine,
+    empresa: Optional[str] = None,
+    perfil: Optional[str] = None,
+    perfiles: Optional[Iterable[Tuple[str, str]]] = None,
+):
+    """
+    Lee pacientes, resultados y criterios en DataFrames. `perfiles` limita la
+    lectura a ciertos (empresa, perfil), p. ej. los afectados por un cambio.
+    """
+    filtros = []
+    if empresa:
+        filtros.append(models.Paciente.empresa == empresa)
+    if perfil:
+        filtros.append(models.Paciente.perfil == perfil)
+    if perfiles is not None:
+        filtros.append(tuple_(models.Paciente.empresa, models.Paciente.perfil).in_(list(perfiles)))
+
+    with engine.connect() as conexion:
+        pacientes = pd.read_sql(
+            select(
+                models.Paciente.id, models.Paciente.paciente_id, models.Paciente.empresa,
+                models.Paciente.perfil, models.Paciente.tipo_examen,
+            ).where(*filtros),
+            conexion,
+        )
+        resultados = pd.read_sql(
+            select(
+                models.Resultado.paciente_id.label("id"), models.Resultado.nombre_prueba,
+                models.Resultado.valor, models.Resultado.valor_numero, models.Resultado.valor_unidad,
+            )
+            .join(models.Paciente, models.Paciente.id == models.Resultado.paciente_id)
+            .where(*filtros),
+            conexion,
+        )
+        criterios = [
+            CriterioContext(**fila._mapping)
+            for fila in conexion.execute(select(
+                models.Criterio.id, models.Criterio.empresa, models.Criterio.perfil, models.Criterio.tipo_examen,
+                models.Criterio.nombre_prueba, models.Criterio.apto, models.Criterio.observado, models.Criterio.no_apto,
+            ))
+        ]
+
+    pacientes["tipo_examen"] = pacientes["tipo_examen"].fillna(models.TIPO_EXAMEN_POR_DEFECTO)
+    return pacientes, resultados, criterios
+
+
+def _intervalos(criterios: List[CriterioContext]) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    Reglas compiladas en arreglos de (criterio, intervalo) por veredicto. Las
+    reglas con menos intervalos se rellenan con NaN, que nunca se cumple.
+    """
+    compilados = [c.compilado for c in criterios]
+    ancho = max(
+        [len(r.intervalos) for c in compilados for r in c.reglas.values() if r is not None] + [1]
+    )
+
+    tablas = {}
+    for clave, _ in ORDEN_VEREDICTOS:
+        forma = (len(criterios), ancho)
+        tabla = {
+            "inferior": np.full(forma, np.nan), "superior": np.full(forma, np.nan),
+            "incluye_inferior": np.zeros(forma, bool), "incluye_superior": np.zeros(forma, bool),
+            "sin_regla": np.zeros(len(criterios), bool),
+        }
+        for fila, compilado in enumerate(compilados):
+            regla = compilado.reglas[clave]
+            if regla is None:
+                tabla["sin_regla"][fila] = True
+                continue
+            for columna, intervalo in enumerate(regla.intervalos):
+                tabla["inferior"][fila, columna] = intervalo.inferior
+                tabla["superior"][fila, columna] = intervalo.superior
+                tabla["incluye_inferior"][fila, columna] = intervalo.incluye_inferior
+                tabla["incluye_superior"][fila, columna] = intervalo.incluye_superior
+        tablas[clave] = tabla
+    return tablas
+
+
+def _evaluar_reglas(numeros: np.ndarray, codigos: np.ndarray, tablas) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Misma logica que `CriterioCompilado.evaluar`, para todas las filas a la vez:
+    las reglas se revisan en orden y la primera que se cumple decide; si antes
+    aparece una regla que no se pudo compilar, la fila queda para el agente.
+    """
+    veredictos = np.full(len(numeros), _SIN_DECIDIR, np.int8)
+    al_agente = np.isnan(numeros)
+    activas = ~al_agente
+    x = numeros[:, None]
+
+    for posicion, (clave, _) in enumerate(ORDEN_VEREDICTOS):
+        tabla = tablas[clave]
+        sin_regla = tabla["sin_regla"][codigos]
+        al_agente |= activas & sin_regla
+        activas &= ~sin_regla
+
+        inferior, superior = tabla["inferior"][codigos], tabla["superior"][codigos]
+        cumple = (
+            ((x > inferior) | ((x == inferior) & tabla["incluye_inferior"][codigos]))
+            & ((x < superior) | ((x == superior) & tabla["incluye_superior"][codigos]))
+        ).any(axis=1)
+
+        decide = activas & cumple
+        veredictos[decide] = posicion
+        activas &= ~decide
+
+    # Valor en un hueco entre rangos: tambien lo decide el agente
+    al_agente |= activas
+    return veredictos, al_agente
+
+
+def expandir(pacientes: pd.DataFrame, resultados: pd.DataFrame, criterios: List[CriterioContext], codigos=None) -> pd.DataFrame:
+    """
+    Una fila por paciente y prueba de los criterios de su perfil (como el grafo),
+    con el valor del paciente o NaN si no tiene resultado. `codigo` es la
+    posicion del criterio en `criterios` (o el codigo dado en `codigos`).
+    """
+    tabla_criterios = pd.DataFrame(
+        [(c.empresa, c.perfil, c.tipo_examen, c.nombre_prueba) for c in criterios],
+        columns=["empresa", "perfil", "tipo_examen", "nombre_prueba"],
+    )
+    tabla_criterios["codigo"] = np.arange(len(criterios)) if codigos is None else list(codigos)
+    filas = pacientes.merge(tabla_criterios, on=["empresa", "perfil", "tipo_examen"], how="inner")
+    return filas.merge(resultados, on=["id", "nombre_prueba"], how="left")
+
+
+def evaluar(filas: pd.DataFrame, criterios: List[CriterioContext], usar_cache: bool = True) -> pd.DataFrame:
+    """
+    Agrega a `filas` el numero, el veredicto y su origen (rule, cache,
+    classifier, missing o pending). `filas["codigo"]` indica el criterio de cada fila.
+    """
+    # El numero ya viene interpretado desde la ingesta (`resultados.valor_numero`)
+    numeros = filas["valor_numero"].to_numpy(dtype=float, copy=True)
+    codigos = filas["codigo"].to_numpy()
+    # Como `numero_comparable`: un numero en otra unidad que la del criterio lo decide el agente
+    unidades = filas["valor_unidad"].to_numpy()
+    con_unidad = np.flatnonzero(~pd.isna(unidades))
+    pares = list(zip(codigos[con_unidad], unidades[con_unidad]))
+    admitidas = {par: criterios[par[0]].compilado.admite_unidad(par[1]) for par in set(pares)}
+    numeros[con_unidad[np.fromiter((not admitidas[par] for par in pares), bool, len(pares))]] = np.nan
+
+    veredictos, al_agente = _evaluar_reglas(numeros, codigos, _intervalos(criterios))
+    faltantes = filas["valor"].isna().to_numpy()
+    veredictos[faltantes] = VEREDICTOS.index("Observado")
+    al_agente &= ~faltantes
+
+    origen = np.where(faltantes, "missing", np.where(al_agente, "pending", "rule")).astype(object)
+
+    if usar_cache and al_agente.any():
+        pendientes = filas.loc[al_agente, ["codigo", "nombre_prueba", "valor"]].drop_duplicates()
+        resueltos = {}
+        for codigo, nombre_prueba, valor in pendientes.itertuples(index=False):
+            guardado = verdict_cache.get(criterios[codigo], nombre_prueba, valor)
+            fuente = "cache"
+            if guardado is None:
+                guardado, fuente = clasificador.predecir(criterios[codigo], nombre_prueba, valor), "classifier"
+            if guardado is not None and guardado["verdict"] in VEREDICTOS:
+                resueltos[(codigo, valor)] = (VEREDICTOS.index(guardado["verdict"]), fuente)
+        if resueltos:
+            claves = pd.Series(list(zip(codigos[al_agente], filas["valor"].to_numpy()[al_agente])))
+            indices = np.flatnonzero(al_agente)
+            for fuente in ("cache", "classifier"):
+                desde_fuente = claves.map({k: g for k, (g, f) in resueltos.items() if f == fuente}).to_numpy()
+                encontrados = ~pd.isna(desde_fuente)
+                veredictos[indices[encontrados]] = desde_fuente[encontrados].astype(np.int8)
+                origen[indices[encontrados]] = fuente
+
+    filas["numero"] = numeros
+    filas["gravedad"] = veredictos
+    filas["veredicto"] = pd.Series(veredictos).map(dict(enumerate(VEREDICTOS))).to_numpy()
+    filas["origen"] = origen
+    return filas
+
+
+def consolidar(pacientes: pd.DataFrame, filas: pd.DataFrame) -> pd.DataFrame:
+    """
+    Veredicto general por paciente, como `consolidate_result`: gana el mas grave.
+    Un 'No Apto' ya es definitivo; si no lo hay y quedan pruebas pendientes,
+    el paciente queda `Pendiente` hasta que el agente las resuelva.
+    """
+    por_paciente = filas.assign(pendiente=filas["origen"] == "pending").groupby("paciente_id", sort=False).agg(
+        gravedad=("gravedad", "max"), pruebas=("codigo", "size"), pruebas_pendientes=("pendiente", "sum"),
+    )
+    general = por_paciente["gravedad"].map(dict(enumerate(VEREDICTOS)))
+    no_apto = por_paciente["gravedad"] == VEREDICTOS.index("No Apto")
+    general[(por_paciente["pruebas_pendientes"] > 0) & ~no_apto] = PENDIENTE
+
+    resumen = pacientes[["paciente_id", "empresa", "perfil", "tipo_examen"]].merge(
+        por_paciente.assign(veredicto_general=general).drop(columns="gravedad").reset_index(),
+        on="paciente_id", how="left",
+    )
+    # Igual que el grafo: sin criterios para el perfil no hay evaluacion
+    sin_criterios = resumen["pruebas"].isna()
+    resumen["error"] = np.where(
+        sin_criterios, "No se encontraron criterios para el perfil " + resumen["perfil"].astype(str), None
+    )
+    resumen[["pruebas", "pruebas_pendientes"]] = resumen[["pruebas", "pruebas_pendientes"]].fillna(0).astype(int)
+    return resumen
+
+
+def tamizar(engine: Engine, empresa: Optional[str] = None, perfil: Optional[str] = None, usar_cache: bool = True) -> Tamizaje:
+    """
+    Re-evalua todos los resultados de la cohorte contra los criterios actuales
+    con operaciones por columnas (sin recorrer paciente por paciente) y
+    consolida el veredicto de cada paciente como `consolidate_result`.
+    Las filas que las reglas no deciden se buscan en el cache de veredictos y
+    en el clasificador local; las que tampoco se deciden ahi quedan como
+    `pending` para el agente.
+    """
+    inicio = time.perf_counter()
+    pacientes, resultados, criterios = cargar(engine, empresa, perfil)
+    segundos_carga = time.perf_counter() - inicio
+
+    filas = evaluar(expandir(pacientes, resultados, criterios), criterios, usar_cache)
+    return Tamizaje(
+        pruebas=filas[COLUMNAS_PRUEBAS],
+        pacientes=consolidar(pacientes, filas),
+        segundos=time.perf_counter() - inicio,
+        segundos_carga=segundos_carga,
+    )
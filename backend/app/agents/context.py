@@ -0,0 +1,136 @@
+import hashlib
+import json
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+from backend.app.database import models
+from .rules import CriterioCompilado, compilar_criterio, numero_comparable
+
+
+@dataclass(frozen=True)
+class CriterioContext:
+    """Copia inmutable de una fila de `criterios` (mismos campos que el modelo)."""
+    id: int
+    empresa: str
+    perfil: str
+    tipo_examen: str
+    nombre_prueba: str
+    apto: str
+    observado: str
+    no_apto: str
+
+    @classmethod
+    def from_model(cls, criterio: models.Criterio) -> "CriterioContext":
+        return cls(
+            id=criterio.id,
+            empresa=criterio.empresa,
+            perfil=criterio.perfil,
+            tipo_examen=criterio.tipo_examen,
+            nombre_prueba=criterio.nombre_prueba,
+            apto=criterio.apto,
+            observado=criterio.observado,
+            no_apto=criterio.no_apto,
+        )
+
+    @cached_property
+    def compilado(self) -> CriterioCompilado:
+        """
+        Las reglas parseadas por el motor de reglas, una vez por criterio. No es un
+        campo: no entra en la igualdad ni en los checkpoints.
+        """
+        return compilar_criterio(self.nombre_prueba, self.apto, self.observado, self.no_apto)
+
+
+@dataclass(frozen=True)
+class PruebaContext:
+    nombre_prueba: str
+    criterio: CriterioContext
+    valor: Optional[str] # None si el paciente no tiene resultado para esta prueba
+    numero: Optional[float] = None # El valor ya interpretado en la ingesta; None si su unidad no es la del criterio
+
+
+@dataclass(frozen=True)
+class PatientContext:
+    """
+    Todo lo que el grafo necesita para evaluar a un paciente, cargado de una vez.
+    Los nodos leen de aqui y no vuelven a consultar la BD durante el bucle.
+    """
+    paciente_id: str
+    empresa: str
+    perfil: str
+    tipo_examen: str
+    pruebas: Tuple[PruebaContext, ...]
+
+    def prueba(self, nombre_prueba: str) -> PruebaContext:
+        return next(p for p in self.pruebas if p.nombre_prueba == nombre_prueba)
+
+    @property
+    def nombres_pruebas(self) -> Tuple[str, ...]:
+        return tuple(p.nombre_prueba for p in self.pruebas)
+
+    def huella(self) -> str:
+        """
+        Version de los datos de la evaluacion: cambia si cambia algun resultado
+        del paciente o alguna regla de sus criterios.
+        """
+        contenido = json.dumps(
+            sorted(
+                [p.nombre_prueba, p.valor, p.criterio.apto, p.criterio.observado, p.criterio.no_apto]
+                for p in self.pruebas
+            ),
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+
+def _prueba_context(criterio: CriterioContext, resultado: Optional[models.Resultado]) -> PruebaContext:
+    if resultado is None:
+        return PruebaContext(criterio.nombre_prueba, criterio, None)
+    numero = numero_comparable(criterio, resultado.valor, resultado.valor_numero, resultado.valor_unidad)
+    return PruebaContext(criterio.nombre_prueba, criterio, resultado.valor, numero)
+
+
+async def load_patient_context(db: AsyncSession, patient_id: str, criteria_index=None) -> PatientContext:
+    """
+    Una consulta para el paciente con sus resultados (JOIN). Los criterios
+    salen del indice en memoria si esta cargado; si no, de una segunda consulta.
+    """
+    paciente = (await db.execute(
+        select(models.Paciente)
+        .options(joinedload(models.Paciente.resultados))
+        .filter(models.Paciente.paciente_id == patient_id)
+    )).unique().scalars().first()
+    if not paciente:
+        raise ValueError(f"No se encontro al paciente con ID {patient_id}")
+
+    # Cada tipo de examen (INGRESO, PERIODICO, ...) tiene sus propios criterios
+    tipo_examen = paciente.tipo_examen or models.TIPO_EXAMEN_POR_DEFECTO
+    if criteria_index is not None and criteria_index.loaded:
+        criterios = list((criteria_index.get(paciente.empresa, paciente.perfil, tipo_examen) or {}).values())
+    else:
+        filas = (await db.execute(
+            select(models.Criterio).filter(
+                models.Criterio.empresa == paciente.empresa,
+                models.Criterio.perfil == paciente.perfil,
+                models.Criterio.tipo_examen == tipo_examen
+            )
+        )).scalars().all()
+        criterios = [CriterioContext.from_model(c) for c in filas]
+    if not criterios:
+        raise ValueError(f"No se encontraron criterios para el perfil {paciente.perfil} ({tipo_examen})")
+
+    # El numero y la unidad ya vienen interpretados desde la ingesta
+    resultados: Dict[str, models.Resultado] = {r.nombre_prueba: r for r in paciente.resultados}
+
+    return PatientContext(
+        paciente_id=paciente.paciente_id,
+        empresa=paciente.empresa,
+        perfil=paciente.perfil,
+        tipo_examen=tipo_examen,
+        pruebas=tuple(_prueba_context(c, resultados.get(c.nombre_prueba)) for c in criterios),
+    )
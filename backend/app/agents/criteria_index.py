@@ -0,0 +1,108 @@
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from backend.app.database import models
+from .context import CriterioContext
+
+logger = logging.getLogger(__name__)
+
+# Cada cuantos segundos se revisa si cambio la tabla `criterios`
+CRITERIA_RELOAD_INTERVAL = float(os.getenv("CRITERIA_RELOAD_INTERVAL", "30"))
+
+
+class CriteriaIndex:
+    """
+    Indice en memoria de todos los criterios, por (empresa, perfil, tipo de examen) y prueba.
+    La lectura es un acceso a diccionario, sin I/O. Una tarea de fondo compara
+    una huella de la tabla y, si cambio, reconstruye el indice y lo
+    reemplaza de una sola vez (los lectores nunca ven un indice a medio armar).
+    """
+
+    def __init__(self):
+        self._indice: Optional[Dict[Tuple[str, str, str], Dict[str, CriterioContext]]] = None
+        self._version: Optional[str] = None
+        self._sucio = False
+        self.recargas = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self._indice is not None
+
+    @property
+    def version(self) -> Optional[str]:
+        return self._version
+
+    def get(self, empresa: str, perfil: str, tipo_examen: str) -> Optional[Dict[str, CriterioContext]]:
+        return self._indice.get((empresa, perfil, tipo_examen)) if self._indice is not None else None
+
+    def perfiles(self) -> List[Tuple[str, str, str]]:
+        """Las combinaciones (empresa, perfil, tipo de examen) que tienen criterios, ordenadas."""
+        return sorted(self._indice) if self._indice is not None else []
+
+    def marcar_sucio(self):
+        """Se llama cuando este mismo proceso edita un criterio."""
+        self._sucio = True
+
+    @staticmethod
+    async def _huella(db: AsyncSession) -> str:
+        # La tabla es pequeña: leemos las columnas crudas (sin armar objetos ni
+        # parsear reglas) y las resumimos en un hash que cambia con cualquier edicion
+        filas = (await db.execute(
+            select(
+                models.Criterio.id, models.Criterio.empresa, models.Criterio.perfil,
+                models.Criterio.tipo_examen, models.Criterio.nombre_prueba, models.Criterio.apto,
+                models.Criterio.observado, models.Criterio.no_apto,
+            ).order_by(models.Criterio.id)
+        )).all()
+        return hashlib.sha256(repr([tuple(f) for f in filas]).encode("utf-8")).hexdigest()
+
+    async def reload(self, db: AsyncSession):
+        version = await self._huella(db)
+        filas = (await db.execute(select(models.Criterio))).scalars().all()
+
+        nuevo: Dict[Tuple[str, str, str], Dict[str, CriterioContext]] = {}
+        for fila in filas:
+            criterio = CriterioContext.from_model(fila)
+            # Las reglas se parsean aqui, fuera del camino de cada prueba (ver `CriterioContext.compilado`)
+            criterio.compilado
+            nuevo.setdefault((criterio.empresa, criterio.perfil, criterio.tipo_examen), {})[criterio.nombre_prueba] = criterio
+
+        # Reemplazo atomico: una sola asignacion de referencia
+        self._indice = nuevo
+        self._version = version
+        self._sucio = False
+        self.recargas += 1
+        logger.info("Indice de criterios cargado: %d criterios, %d perfiles", len(filas), len(nuevo))
+
+    async def reload_if_changed(self, db: AsyncSession) -> bool:
+        if self._sucio or not self.loaded or await self._huella(db) != self._version:
+            await self.reload(db)
+            return True
+        return False
+
+    async def watch(self, session_factory: async_sessionmaker, interval: float = CRITERIA_RELOAD_INTERVAL):
+        """Tarea de fondo: revisa la huella cada `interval` segundos."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                async with session_factory() as db:
+                    await self.reload_if_changed(db)
+            except Exception as error:
+                # Si falla la revision seguimos sirviendo el indice anterior
+                logger.warning("No se pudo revisar el indice de criterios: %s", error)
+
+
+criteria_index = CriteriaIndex()
+
+
+@event.listens_for(models.Criterio, "after_insert")
+@event.listens_for(models.Criterio, "after_update")
+@event.listens_for(models.Criterio, "after_delete")
+def _marcar_indice_sucio(mapper, connection, target):
+    criteria_index.marcar_sucio()
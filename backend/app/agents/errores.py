@@ -0,0 +1,18 @@
+# Errores del acceso al LLM. Viven aparte del gateway para que el orquestador
+# pueda capturarlos sin importar langchain al arrancar.
+
+
+class LLMNoDisponible(Exception):
+    """El proveedor no respondio dentro del plazo o siguio fallando tras los reintentos."""
+
+
+class CircuitoAbierto(LLMNoDisponible):
+    """El circuito esta abierto: no se llama al proveedor hasta que termine el enfriamiento."""
+
+
+class VeredictoInvalido(ValueError):
+    """El evaluador respondio algo que no es 'Apto', 'Observado' ni 'No Apto'."""
+
+
+class AgenteDetenido(VeredictoInvalido):
+    """El agente ReAct llego al tope de iteraciones (o de tiempo) sin dar un veredicto."""
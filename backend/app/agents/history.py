@@ -0,0 +1,167 @@
+import hashlib
+import os
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+from backend.app.database import models
+from .cache import hash_criterio, normalizar_valor
+from .context import PatientContext
+from .rules import ORDEN_VEREDICTOS
+
+# "1": cada evaluacion se guarda y la siguiente solo re-evalua las pruebas que cambiaron
+PERSISTIR_EVALUACIONES = os.getenv("PERSISTIR_EVALUACIONES", "1") == "1"
+
+VEREDICTOS = {veredicto for _, veredicto in ORDEN_VEREDICTOS}
+
+
+def hash_valor(valor: Optional[str]) -> Optional[str]:
+    """Huella del valor normalizado: '24,5 kg/m²' y '24.5 kg/m2' son el mismo valor."""
+    if valor is None:
+        return None
+    return hashlib.sha256(normalizar_valor(valor).encode("utf-8")).hexdigest()
+
+
+async def ultima_evaluacion(db: AsyncSession, paciente_id: str) -> Optional[models.Evaluacion]:
+    """
+    La evaluacion mas reciente del paciente con sus pruebas, en una consulta.
+    La busqueda es un salto en el indice (paciente_id, id), no depende de cuantas haya.
+    """
+    return (await db.execute(
+        select(models.Evaluacion)
+        .options(joinedload(models.Evaluacion.pruebas))
+        .where(models.Evaluacion.paciente_id == paciente_id)
+        .order_by(models.Evaluacion.id.desc())
+        .limit(1)
+    )).unique().scalars().first()
+
+
+async def historial(db: AsyncSession, paciente_id: str, limite: int = 20) -> List[models.Evaluacion]:
+    """Las ultimas `limite` evaluaciones del paciente, sin sus pruebas."""
+    return list((await db.execute(
+        select(models.Evaluacion)
+        .where(models.Evaluacion.paciente_id == paciente_id)
+        .order_by(models.Evaluacion.id.desc())
+        .limit(limite)
+    )).scalars())
+
+
+def reutilizables(context: PatientContext, anterior: Optional[models.Evaluacion]) -> Dict[str, Dict]:
+    """
+    Resultados de la evaluacion anterior que siguen valiendo: misma version del
+    criterio y mismo valor. Los veredictos invalidos (p. ej. un error del
+    agente) y los de respaldo (sin LLM) no se reutilizan: la prueba se vuelve a evaluar.
+    """
+    if anterior is None:
+        return {}
+    guardadas = {p.nombre_prueba: p for p in anterior.pruebas}
+
+    resultados = {}
+    for prueba in context.pruebas:
+        guardada = guardadas.get(prueba.nombre_prueba)
+        if (
+            guardada is None
+            or guardada.veredicto not in VEREDICTOS
+            or guardada.origen == "fallback"
+            or guardada.version_criterio != hash_criterio(prueba.criterio)
+            or guardada.hash_valor != hash_valor(prueba.valor)
+        ):
+            continue
+        resultados[prueba.nombre_prueba] = {
+            "verdict": guardada.veredicto,
+            "reasoning": guardada.razonamiento,
+            "source": "stored",
+            "stored_source": guardada.origen,
+        }
+    return resultados
+
+
+async def guardar_evaluacion(
+    db: AsyncSession,
+    context: PatientContext,
+    test_results: Dict[str, Dict],
+    veredicto_general: str,
+    modo: str,
+    latencia_ms: float,
+) -> int:
+    """
+    Guarda la evaluacion y una fila por prueba (las reutilizadas tambien, asi
+    cada evaluacion queda completa). Dos INSERT y un commit; devuelve el id.
+    """
+    filas = []
+    for prueba in context.pruebas:
+        resultado = test_results.get(prueba.nombre_prueba)
+        if resultado is None:
+            continue
+        reutilizada = resultado.get("source") == "stored"
+        metricas = {} if reutilizada else (resultado.get("metrics") or {})
+        filas.append({
+            "nombre_prueba": prueba.nombre_prueba,
+            "criterio_id": prueba.criterio.id,
+            "version_criterio": hash_criterio(prueba.criterio),
+            "hash_valor": hash_valor(prueba.valor),
+            "veredicto": resultado["verdict"],
+            "razonamiento": resultado["reasoning"],
+            "origen": resultado["stored_source"] if reutilizada else resultado.get("source", "agent"),
+            "reutilizada": reutilizada,
+            "latencia_ms": metricas.get("latencia_ms"),
+            "tokens_entrada": metricas.get("tokens_entrada"),
+            "tokens_salida": metricas.get("tokens_salida"),
+        })
+
+    reutilizadas = sum(f["reutilizada"] for f in filas)
+    evaluacion_id = (await db.execute(
+        insert(models.Evaluacion).values(
+            paciente_id=context.paciente_id,
+            veredicto_general=veredicto_general,
+            version_datos=context.huella(),
+            modo=modo,
+            pruebas_evaluadas=len(filas) - reutilizadas,
+            pruebas_reutilizadas=reutilizadas,
+            latencia_ms=round(latencia_ms, 1),
+            tokens_entrada=sum(f["tokens_entrada"] or 0 for f in filas),
+            tokens_salida=sum(f["tokens_salida"] or 0 for f in filas),
+            creado_en=time.time(),
+        ).returning(models.Evaluacion.id)
+    )).scalar_one()
+    if filas:
+        # Insert de Core sobre la tabla: un solo executemany (el bulk insert del ORM
+        # separa las filas segun que columnas vienen en None)
+        await db.execute(insert(models.EvaluacionPrueba.__table__), [{**f, "evaluacion_id": evaluacion_id} for f in filas])
+    await db.commit()
+    return evaluacion_id
+
+
+def resumen_evaluacion(evaluacion: models.Evaluacion) -> Dict:
+    return {
+        "id": evaluacion.id,
+        "paciente_id": evaluacion.paciente_id,
+        "veredicto_general": evaluacion.veredicto_general,
+        "version_datos": evaluacion.version_datos,
+        "modo": evaluacion.modo,
+        "pruebas_evaluadas": evaluacion.pruebas_evaluadas,
+        "pruebas_reutilizadas": evaluacion.pruebas_reutilizadas,
+        "latencia_ms": evaluacion.latencia_ms,
+        "tokens_entrada": evaluacion.tokens_entrada,
+        "tokens_salida": evaluacion.tokens_salida,
+        "creado_en": evaluacion.creado_en,
+    }
+
+
+def formatear_pruebas(evaluacion: models.Evaluacion) -> List[Dict]:
+    """Pruebas guardadas en el mismo formato que `format_test_results` (las reutilizadas como `stored`)."""
+    return [
+        {
+            "prueba": p.nombre_prueba,
+            "resultado": p.veredicto,
+            "razonamiento": p.razonamiento,
+            "origen": "stored" if p.reutilizada else p.origen,
+            "metricas": None if p.latencia_ms is None else {
+                "latencia_ms": p.latencia_ms, "tokens_entrada": p.tokens_entrada or 0, "tokens_salida": p.tokens_salida or 0,
+            },
+        }
+        for p in sorted(evaluacion.pruebas, key=lambda p: p.id)
+    ]
@@ -0,0 +1,230 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from .checkpoints import EjecucionEnCurso, ejecuciones, pruebas_fallidas
+from .orchestrator import MAX_CONCURRENCY, format_test_results
+
+logger = logging.getLogger(__name__)
+
+# Cuanto puede pasar sin noticias de un trabajo antes de considerar que su worker murio
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+# Cada cuanto el worker renueva el plazo del trabajo que esta evaluando
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", str(JOB_LEASE_SECONDS / 3)))
+# Veces que se toma un trabajo: uno que siempre mata a su worker termina en error
+JOB_MAX_INTENTOS = int(os.getenv("JOB_MAX_INTENTOS", "3"))
+# Cada cuanto revisan la cola los workers cuando no hay avisos de trabajos nuevos
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+
+PENDIENTE = "pendiente"
+EN_PROCESO = "en_proceso"
+COMPLETADO = "completado"
+PARCIAL = "parcial" # Termino con pruebas 'Pendiente': volver a encolarlo crea un trabajo nuevo
+ERROR = "error"
+
+
+class JobQueue:
+    """
+    Cola de evaluaciones persistida en una base SQLite local. Los trabajos
+    sobreviven a reinicios: los que quedaron `en_proceso` con el plazo vencido
+    vuelven a tomarse, hasta `JOB_MAX_INTENTOS` veces. Mientras un worker evalua
+    renueva el plazo, asi una evaluacion larga no la toma otro. Un mismo paciente con la misma version de datos
+    (ver `PatientContext.huella`) no se encola dos veces, salvo que el anterior
+    haya terminado con error o con pruebas pendientes (`parcial`).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._aviso = asyncio.Event()
+        self._workers: List[asyncio.Task] = []
+        self._crear_tabla()
+
+    @classmethod
+    def from_env(cls) -> "JobQueue":
+        return cls(os.getenv("JOBS_DB_PATH", "./jobs.db"))
+
+    @contextmanager
+    def _conectar(self):
+        # Una conexion por operacion: las operaciones corren en hilos distintos
+        conexion = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conexion.row_factory = sqlite3.Row
+        try:
+            yield conexion
+        finally:
+            conexion.close()
+
+    def _crear_tabla(self):
+        with self._conectar() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS trabajos (
+                    id TEXT PRIMARY KEY,
+                    paciente_id TEXT NOT NULL,
+                    version_datos TEXT NOT NULL,
+                    estado TEXT NOT NULL,
+                    resultado TEXT,
+                    error TEXT,
+                    intentos INTEGER NOT NULL DEFAULT 0,
+                    creado_en REAL NOT NULL,
+                    actualizado_en REAL NOT NULL
+                )
+                """
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS ix_trabajos_estado ON trabajos (estado, creado_en)")
+            db.execute("CREATE INDEX IF NOT EXISTS ix_trabajos_paciente ON trabajos (paciente_id, version_datos)")
+
+    @staticmethod
+    def _a_dict(fila: Optional[sqlite3.Row]) -> Optional[Dict]:
+        if fila is None:
+            return None
+        trabajo = dict(fila)
+        trabajo["resultado"] = json.loads(trabajo["resultado"]) if trabajo["resultado"] else None
+        return trabajo
+
+    def _encolar(self, paciente_id: str, version_datos: str) -> Dict:
+        ahora = time.time()
+        with self._conectar() as db:
+            db.execute("BEGIN IMMEDIATE")
+            existente = db.execute(
+                "SELECT * FROM trabajos WHERE paciente_id = ? AND version_datos = ? AND estado IN (?, ?, ?) "
+                "ORDER BY creado_en DESC LIMIT 1",
+                (paciente_id, version_datos, PENDIENTE, EN_PROCESO, COMPLETADO),
+            ).fetchone()
+            if existente is not None:
+                db.execute("COMMIT")
+                return {**self._a_dict(existente), "duplicado": True}
+
+            job_id = uuid.uuid4().hex
+            db.execute(
+                "INSERT INTO trabajos (id, paciente_id, version_datos, estado, creado_en, actualizado_en) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, paciente_id, version_datos, PENDIENTE, ahora, ahora),
+            )
+            fila = db.execute("SELECT * FROM trabajos WHERE id = ?", (job_id,)).fetchone()
+            db.execute("COMMIT")
+        return {**self._a_dict(fila), "duplicado": False}
+
+    def _tomar_siguiente(self) -> Optional[Dict]:
+        ahora = time.time()
+        with self._conectar() as db:
+            # BEGIN IMMEDIATE: dos workers (o dos procesos) nunca toman el mismo trabajo
+            db.execute("BEGIN IMMEDIATE")
+            db.execute(
+                "UPDATE trabajos SET estado = ?, error = ?, actualizado_en = ? "
+                "WHERE estado = ? AND actualizado_en < ? AND intentos >= ?",
+                (
+                    ERROR, f"El worker se detuvo en los {JOB_MAX_INTENTOS} intentos", ahora,
+                    EN_PROCESO, ahora - JOB_LEASE_SECONDS, JOB_MAX_INTENTOS,
+                ),
+            )
+            fila = db.execute(
+                "SELECT * FROM trabajos WHERE estado = ? OR (estado = ? AND actualizado_en < ?) "
+                "ORDER BY creado_en LIMIT 1",
+                (PENDIENTE, EN_PROCESO, ahora - JOB_LEASE_SECONDS),
+            ).fetchone()
+            if fila is None:
+                db.execute("COMMIT")
+                return None
+            db.execute(
+                "UPDATE trabajos SET estado = ?, intentos = intentos + 1, actualizado_en = ? WHERE id = ?",
+                (EN_PROCESO, ahora, fila["id"]),
+            )
+            db.execute("COMMIT")
+        return {**self._a_dict(fila), "estado": EN_PROCESO}
+
+    def _renovar(self, job_id: str):
+        with self._conectar() as db:
+            db.execute(
+                "UPDATE trabajos SET actualizado_en = ? WHERE id = ? AND estado = ?", (time.time(), job_id, EN_PROCESO)
+            )
+
+    async def _latido(self, job_id: str):
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            await asyncio.to_thread(self._renovar, job_id)
+
+    def _terminar(self, job_id: str, estado: str, resultado: Optional[Dict] = None, error: Optional[str] = None):
+        with self._conectar() as db:
+            db.execute(
+                "UPDATE trabajos SET estado = ?, resultado = ?, error = ?, actualizado_en = ? WHERE id = ?",
+                (
+                    estado,
+                    json.dumps(resultado, ensure_ascii=False) if resultado is not None else None,
+                    error,
+                    time.time(),
+                    job_id,
+                ),
+            )
+
+    def _obtener(self, job_id: str) -> Optional[Dict]:
+        with self._conectar() as db:
+            return self._a_dict(db.execute("SELECT * FROM trabajos WHERE id = ?", (job_id,)).fetchone())
+
+    async def submit(self, paciente_id: str, version_datos: str) -> Dict:
+        trabajo = await asyncio.to_thread(self._encolar, paciente_id, version_datos)
+        if not trabajo["duplicado"]:
+            self._aviso.set()
+        return trabajo
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        return await asyncio.to_thread(self._obtener, job_id)
+
+    async def _ejecutar(self, graph, session_factory: async_sessionmaker, trabajo: Dict):
+        paciente_id = trabajo["paciente_id"]
+        latido = asyncio.create_task(self._latido(trabajo["id"]))
+        try:
+            # La ejecucion es el trabajo: si se retoma al vencer su plazo, sigue desde su checkpoint
+            async with session_factory() as db:
+                _, final_state = await ejecuciones.ejecutar(
+                    graph, paciente_id, {"configurable": {"db": db}, "max_concurrency": MAX_CONCURRENCY},
+                    ejecucion=trabajo["id"],
+                )
+            resultado = {
+                "paciente_id": final_state["patient_id"],
+                "veredicto_general": final_state["final_veredict"],
+                "evaluaciones": format_test_results(final_state["test_results"]),
+            }
+            estado = PARCIAL if pruebas_fallidas(final_state["test_results"]) else COMPLETADO
+            await asyncio.to_thread(self._terminar, trabajo["id"], estado, resultado)
+        except EjecucionEnCurso:
+            # Su ejecucion todavia renueva el plazo en otro lado: el trabajo se retoma al vencer el suyo
+            logger.warning("Trabajo %s: su ejecucion sigue en curso, se reintenta mas tarde", trabajo["id"])
+        except Exception as error:
+            logger.warning("Trabajo %s fallo: %s", trabajo["id"], error)
+            await asyncio.to_thread(self._terminar, trabajo["id"], ERROR, None, str(error))
+        finally:
+            latido.cancel()
+
+    async def _worker(self, graph, session_factory: async_sessionmaker):
+        while True:
+            trabajo = await asyncio.to_thread(self._tomar_siguiente)
+            if trabajo is None:
+                # Esperamos un aviso de trabajo nuevo, o revisamos de nuevo al rato
+                self._aviso.clear()
+                try:
+                    await asyncio.wait_for(self._aviso.wait(), timeout=JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            logger.info("Trabajo %s: evaluando paciente %s", trabajo["id"], trabajo["paciente_id"])
+            await self._ejecutar(graph, session_factory, trabajo)
+
+    def start(self, graph, session_factory: async_sessionmaker, workers: int):
+        self._workers = [
+            asyncio.create_task(self._worker(graph, session_factory)) for _ in range(workers)
+        ]
+
+    async def stop(self):
+        # Los trabajos interrumpidos quedan en_proceso y se retoman al vencer su plazo
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
@@ -0,0 +1,357 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatResult
+from langchain_core.runnables import RunnableBinding
+from pydantic import ConfigDict, Field
+
+from backend.app.observability import LLM_CIRCUIT_STATE, LLM_HEDGES, LLM_RATE_LIMIT_WAIT_SECONDS, LLM_RETRIES
+from .errores import CircuitoAbierto, LLMNoDisponible
+
+logger = logging.getLogger(__name__)
+
+# Modelo y endpoint. LLM_BASE_URL permite apuntar a un proxy o al servidor stub de pruebas
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o")
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or None
+
+# Limites de la cuenta del proveedor (0: sin limite)
+LLM_RPM = int(os.getenv("LLM_RPM", "500"))
+LLM_TPM = int(os.getenv("LLM_TPM", "300000"))
+# Tokens de salida que se reservan por llamada hasta conocer los reales
+LLM_TOKENS_SALIDA_ESTIMADOS = int(os.getenv("LLM_TOKENS_SALIDA_ESTIMADOS", "300"))
+
+# Plazo de cada intento y plazo total de la llamada (reintentos incluidos)
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "30"))
+LLM_DEADLINE_S = float(os.getenv("LLM_DEADLINE_S", "90"))
+
+# Reintentos con backoff exponencial (con jitter) ante 429, 5xx, timeouts y errores de conexion
+LLM_MAX_REINTENTOS = int(os.getenv("LLM_MAX_REINTENTOS", "4"))
+LLM_BACKOFF_BASE_S = float(os.getenv("LLM_BACKOFF_BASE_S", "0.5"))
+LLM_BACKOFF_MAX_S = float(os.getenv("LLM_BACKOFF_MAX_S", "20"))
+
+# Si un intento tarda mas que esto se lanza una copia y gana la primera respuesta (0: sin hedging)
+LLM_HEDGE_MS = float(os.getenv("LLM_HEDGE_MS", "0"))
+
+# Fallos seguidos (5xx, timeouts) que abren el circuito y cuanto tiempo queda abierto
+LLM_BREAKER_FALLOS = int(os.getenv("LLM_BREAKER_FALLOS", "5"))
+LLM_BREAKER_ENFRIAMIENTO_S = float(os.getenv("LLM_BREAKER_ENFRIAMIENTO_S", "30"))
+
+# Errores que se reintentan: el cliente de OpenAI los expone con `status_code` o por su tipo
+ESTADOS_REINTENTABLES = {408, 409, 429, 500, 502, 503, 504}
+ERRORES_DE_RED = {"APIConnectionError", "APITimeoutError", "ConnectError", "ReadTimeout"}
+
+
+class TokenBucket:
+    """
+    Cubeta de `por_minuto` unidades que se rellena de forma continua. `reservar`
+    descuenta de inmediato (el saldo puede quedar negativo) y devuelve cuanto
+    hay que esperar, asi las reservas se atienden en orden de llegada.
+    """
+
+    def __init__(self, por_minuto: int):
+        self.capacidad = float(por_minuto)
+        self.tasa = por_minuto / 60.0
+        self.disponibles = self.capacidad
+        self._actualizado = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _rellenar(self):
+        ahora = time.monotonic()
+        self.disponibles = min(self.capacidad, self.disponibles + (ahora - self._actualizado) * self.tasa)
+        self._actualizado = ahora
+
+    def reservar(self, unidades: float) -> float:
+        with self._lock:
+            self._rellenar()
+            # Una llamada mas grande que la cubeta esperaria para siempre
+            self.disponibles -= min(unidades, self.capacidad)
+            return 0.0 if self.disponibles >= 0 else -self.disponibles / self.tasa
+
+    def ajustar(self, unidades: float):
+        """Devuelve (o cobra, si es negativo) la diferencia entre lo reservado y lo usado."""
+        with self._lock:
+            self._rellenar()
+            self.disponibles = min(self.capacidad, self.disponibles + unidades)
+
+
+class Planificador:
+    """Respeta a la vez el limite de peticiones y el de tokens por minuto."""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.peticiones = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+
+    def reservar(self, tokens: int) -> float:
+        espera = 0.0
+        if self.peticiones is not None:
+            espera = max(espera, self.peticiones.reservar(1))
+        if self.tokens is not None:
+            espera = max(espera, self.tokens.reservar(tokens))
+        LLM_RATE_LIMIT_WAIT_SECONDS.observe(espera)
+        return espera
+
+    async def esperar(self, tokens: int):
+        espera = self.reservar(tokens)
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+    def ajustar_tokens(self, reservados: int, usados: int):
+        if self.tokens is not None:
+            self.tokens.ajustar(reservados - usados)
+
+
+CERRADO, SEMIABIERTO, ABIERTO = "cerrado", "semiabierto", "abierto"
+
+
+class CircuitBreaker:
+    """
+    Tras `fallos` errores seguidos del proveedor el circuito se abre y las
+    llamadas fallan de inmediato con `CircuitoAbierto` (el orquestador usa el
+    veredicto de respaldo). Pasado el enfriamiento deja pasar una llamada de
+    prueba: si responde se cierra, si falla vuelve a abrirse.
+    """
+
+    def __init__(self, fallos: int, enfriamiento_s: float):
+        self.fallos = fallos
+        self.enfriamiento_s = enfriamiento_s
+        self.estado = CERRADO
+        self.fallos_seguidos = 0
+        self._abierto_en = 0.0
+        self._sondeando = False
+        self._lock = threading.Lock()
+
+    def _cambiar(self, estado: str):
+        if estado != self.estado:
+            logger.warning("Circuito del LLM: %s -> %s", self.estado, estado)
+        self.estado = estado
+        LLM_CIRCUIT_STATE.set((CERRADO, SEMIABIERTO, ABIERTO).index(estado))
+
+    def permitir(self):
+        with self._lock:
+            if self.estado == ABIERTO and time.monotonic() - self._abierto_en >= self.enfriamiento_s:
+                self._cambiar(SEMIABIERTO)
+            if self.estado == ABIERTO or (self.estado == SEMIABIERTO and self._sondeando):
+                raise CircuitoAbierto("Circuito del LLM abierto: el proveedor fallo repetidamente")
+            if self.estado == SEMIABIERTO:
+                self._sondeando = True
+
+    def exito(self):
+        with self._lock:
+            self.fallos_seguidos = 0
+            self._sondeando = False
+            self._cambiar(CERRADO)
+
+    def fallo(self):
+        with self._lock:
+            self.fallos_seguidos += 1
+            self._sondeando = False
+            if self.estado == SEMIABIERTO or self.fallos_seguidos >= self.fallos:
+                self._abierto_en = time.monotonic()
+                self._cambiar(ABIERTO)
+
+    def liberar(self):
+        """Una llamada de prueba que termino sin decir nada del proveedor (p. ej. un 429)."""
+        with self._lock:
+            self._sondeando = False
+
+
+@dataclass
+class Politica:
+    timeout_s: float = LLM_TIMEOUT_S
+    deadline_s: float = LLM_DEADLINE_S
+    max_reintentos: int = LLM_MAX_REINTENTOS
+    backoff_base_s: float = LLM_BACKOFF_BASE_S
+    backoff_max_s: float = LLM_BACKOFF_MAX_S
+    hedge_ms: float = LLM_HEDGE_MS
+    tokens_salida_estimados: int = LLM_TOKENS_SALIDA_ESTIMADOS
+    estados_reintentables: set = field(default_factory=lambda: set(ESTADOS_REINTENTABLES))
+
+
+def es_reintentable(error: BaseException, politica: Politica) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in ERRORES_DE_RED:
+        return True
+    return getattr(error, "status_code", None) in politica.estados_reintentables
+
+
+def es_fallo_del_proveedor(error: BaseException) -> bool:
+    """Un 429 es nuestro exceso, no una caida: no cuenta para el circuito."""
+    return getattr(error, "status_code", None) != 429
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMGateway(BaseChatModel):
+    """
+    Modelo de chat que envuelve al del proveedor y es el unico punto de salida
+    hacia el LLM: planifica con token buckets (RPM y TPM), corta cada intento
+    con un timeout, reintenta con backoff exponencial dentro de un plazo total,
+    puede lanzar una copia (hedging) de los intentos lentos y abre un circuito
+    cuando el proveedor falla seguido. Las copias de `bind_tools` comparten el
+    planificador y el circuito.
+    """
+
+    modelo: BaseChatModel
+    planificador: Planificador
+    circuito: CircuitBreaker
+    politica: Politica = Field(default_factory=Politica)
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    @property
+    def _llm_type(self) -> str:
+        return f"gateway-{self.modelo._llm_type}"
+
+    def bind_tools(self, tools, **kwargs):
+        # ChatOpenAI devuelve un binding con los kwargs de la API; otros modelos, una copia
+        enlazado = self.modelo.bind_tools(tools, **kwargs)
+        if isinstance(enlazado, RunnableBinding):
+            return self.bind(**enlazado.kwargs)
+        return self.model_copy(update={"modelo": enlazado})
+
+    def _tokens_estimados(self, messages: List[BaseMessage]) -> int:
+        # ~4 caracteres por token: basta para no pasarse del TPM
+        return sum(len(str(m.content)) for m in messages) // 4 + self.politica.tokens_salida_estimados
+
+    @staticmethod
+    def _tokens_usados(resultado: ChatResult, estimados: int) -> int:
+        uso = getattr(resultado.generations[0].message, "usage_metadata", None) if resultado.generations else None
+        return uso.get("total_tokens", estimados) if uso else estimados
+
+    def _espera_reintento(self, intento: int, error: BaseException) -> float:
+        # Full jitter: evita que todos los clientes reintenten al mismo tiempo
+        espera = random.uniform(0, min(self.politica.backoff_max_s, self.politica.backoff_base_s * 2 ** (intento - 1)))
+        return max(espera, retry_after(error) or 0.0)
+
+    def _registrar_error(self, error: BaseException, intento: int, limite: float) -> float:
+        """Decide si se reintenta: devuelve la espera o relanza el error como `LLMNoDisponible`."""
+        if not es_reintentable(error, self.politica):
+            self.circuito.liberar()
+            raise error
+        if es_fallo_del_proveedor(error):
+            self.circuito.fallo()
+        else:
+            self.circuito.liberar()
+
+        espera = self._espera_reintento(intento, error)
+        if intento > self.politica.max_reintentos or time.monotonic() + espera >= limite:
+            raise LLMNoDisponible(f"El LLM no respondio tras {intento} intentos: {error!r}") from error
+        LLM_RETRIES.labels(str(getattr(error, "status_code", None) or type(error).__name__)).inc()
+        logger.info("Reintentando llamada al LLM en %.2f s (intento %d): %r", espera, intento, error)
+        return espera
+
+    async def _intento(self, messages, stop, tokens: int, limite: float, **kwargs) -> ChatResult:
+        timeout = max(0.001, min(self.politica.timeout_s, limite - time.monotonic()))
+
+        def llamar():
+            return asyncio.wait_for(self.modelo._agenerate(messages, stop=stop, **kwargs), timeout)
+
+        if self.politica.hedge_ms <= 0:
+            return await llamar()
+
+        tareas = {asyncio.ensure_future(llamar())}
+        try:
+            hechos, _ = await asyncio.wait(tareas, timeout=self.politica.hedge_ms / 1000)
+            if not hechos:
+                # El intento va lento: lanzamos una copia, que tambien consume cupo del proveedor
+                await self.planificador.esperar(tokens)
+                LLM_HEDGES.inc()
+                tareas.add(asyncio.ensure_future(llamar()))
+
+            error = None
+            while tareas:
+                hechos, tareas = await asyncio.wait(tareas, return_when=asyncio.FIRST_COMPLETED)
+                for tarea in hechos:
+                    if tarea.exception() is None:
+                        return tarea.result()
+                    error = tarea.exception()
+            raise error
+        finally:
+            # La copia que pierde (o ambas, si nos cancelan) no debe quedar corriendo
+            for tarea in tareas:
+                tarea.cancel()
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        tokens = self._tokens_estimados(messages)
+        limite = time.monotonic() + self.politica.deadline_s
+        intento = 0
+        while True:
+            self.circuito.permitir()
+            await self.planificador.esperar(tokens)
+            intento += 1
+            try:
+                resultado = await self._intento(messages, stop, tokens, limite, **kwargs)
+            except asyncio.CancelledError:
+                self.circuito.liberar()
+                raise
+            except Exception as error:
+                await asyncio.sleep(self._registrar_error(error, intento, limite))
+                continue
+            self.circuito.exito()
+            self.planificador.ajustar_tokens(tokens, self._tokens_usados(resultado, tokens))
+            return resultado
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        # Camino sincrono (scripts): mismas reglas, sin hedging; el timeout lo aplica el cliente
+        tokens = self._tokens_estimados(messages)
+        limite = time.monotonic() + self.politica.deadline_s
+        intento = 0
+        while True:
+            self.circuito.permitir()
+            espera = self.planificador.reservar(tokens)
+            if espera > 0:
+                time.sleep(espera)
+            intento += 1
+            try:
+                resultado = self.modelo._generate(messages, stop=stop, **kwargs)
+            except Exception as error:
+                time.sleep(self._registrar_error(error, intento, limite))
+                continue
+            self.circuito.exito()
+            self.planificador.ajustar_tokens(tokens, self._tokens_usados(resultado, tokens))
+            return resultado
+
+
+def crear_gateway(modelo: BaseChatModel, politica: Optional[Politica] = None, rpm: int = LLM_RPM, tpm: int = LLM_TPM) -> LLMGateway:
+    return LLMGateway(
+        modelo=modelo,
+        planificador=Planificador(rpm, tpm),
+        circuito=CircuitBreaker(LLM_BREAKER_FALLOS, LLM_BREAKER_ENFRIAMIENTO_S),
+        politica=politica or Politica(),
+    )
+
+
+def crear_llm() -> LLMGateway:
+    """
+    Cliente del proveedor detras del gateway. Los reintentos del SDK se apagan:
+    los maneja el gateway, que conoce los limites y el plazo total.
+    """
+    # El SDK de OpenAI tarda casi un segundo en importarse: solo al crear el cliente
+    from langchain_openai import ChatOpenAI
+
+    modelo = ChatOpenAI(
+        model=LLM_MODEL, temperature=0, base_url=LLM_BASE_URL, timeout=LLM_TIMEOUT_S, max_retries=0,
+    )
+    return crear_gateway(modelo)
+
+
+@lru_cache(maxsize=None)
+def obtener_llm() -> LLMGateway:
+    """Gateway compartido por todos los agentes: se crea en el primer uso, no al importar."""
+    return crear_llm()
@@ -1,102 +1,278 @@
-from typing import List, TypedDict, Dict
-from sqlalchemy.orm import Session
-from backend.app.database import models
-from langgraph.graph import StateGraph
-from functools import partial
-from .specialist import crear_agente_evaluador
-from langchain_openai import ChatOpenAI
-from dotenv import load_dotenv
+from typing import TYPE_CHECKING, Annotated, List, Optional, Tuple, TypedDict, Dict
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from .rules import evaluar_con_reglas, normalizar_veredicto, numero_comparable
+from .cache import verdict_cache
+from .clasificador import clasificador
+from .context import CriterioContext, PatientContext, PruebaContext, load_patient_context
+from .criteria_index import criteria_index
+from .history import PERSISTIR_EVALUACIONES, VEREDICTOS, guardar_evaluacion, reutilizables, ultima_evaluacion
+from .errores import AgenteDetenido, LLMNoDisponible, VeredictoInvalido
+from backend.app.observability import LLM_FALLBACKS, TEST_FAILURES, medir_nodo, metrics_callback
 import json
+import logging
+import os
+import threading
+import time
 
-load_dotenv()
+if TYPE_CHECKING:
+    # Solo para las anotaciones: importar langchain_core.runnables carga langsmith
+    from langchain_core.runnables import RunnableConfig
+
+logger = logging.getLogger(__name__)
+
+# Maximo de pruebas evaluandose a la vez para un mismo paciente
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCIA_PRUEBAS", "8"))
+
+# "react": un agente por prueba con herramientas; "structured": una sola llamada por paciente
+EVALUATOR_MODE = os.getenv("EVALUATOR_MODE", "react")
+
+# Prompt del agente ReAct: "completo" (el original) o "compacto" (mas corto, con
+# prefijo estable para el cache del proveedor). Comparar con benchmarks/ab_prompt.py
+PROMPT_AGENTE = os.getenv("PROMPT_AGENTE", "completo")
+
+# Lo que devuelve el AgentExecutor (early_stopping_method="force") al llegar a `max_iterations`
+SALIDA_AGENTE_DETENIDO = "Agent stopped due to iteration limit or time limit."
+
+# Precio del modelo en USD por millon de tokens, para comparar el costo de cada modo
+LLM_PRICE_INPUT = float(os.getenv("LLM_PRICE_INPUT_PER_MTOK", "2.5"))
+LLM_PRICE_OUTPUT = float(os.getenv("LLM_PRICE_OUTPUT_PER_MTOK", "10"))
+
+# Origenes de resultado que una ejecucion reanudada vuelve a evaluar: las pruebas
+# que fallaron y las que se resolvieron con el veredicto de respaldo (sin LLM)
+SOURCES_TO_RETRY = ("error", "fallback")
+
+def merge_test_results(current: Dict[str, Dict[str, str]], new: Dict[str, Dict[str, str]]) -> Dict[str, Dict[str, str]]:
+    """
+    Reductor de `test_results`: junta los resultados que devuelve cada rama paralela.
+    Una prueba en None se quita (al reanudar, lo que no se conserva del intento anterior)
+    """
+    merged = {**(current or {}), **(new or {})}
+    return {test: result for test, result in merged.items() if result is not None}
 
 class GraphState(TypedDict):
     patient_id: str # ID del paciente a evaluar
+    context: PatientContext # Paciente, resultados y criterios cargados en `fetch_tests`
     tests_to_run: List[str] # Lista con los nombres de las pruebas a realizar
-    test_results: Dict[str, Dict[str,str]] # Un diccionario para guardar los resultados de cada prueba
+    test_results: Annotated[Dict[str, Dict[str,str]], merge_test_results] # Un diccionario para guardar los resultados de cada prueba
     final_veredict: str # El veredicto final consolidado
+    previous_evaluation: Optional[Dict] # id y version de datos de la ultima evaluacion guardada
+    evaluation_id: Optional[int] # Evaluacion guardada en `persist`
+    started: float # Inicio de la evaluacion (perf_counter), para la latencia guardada
 
-def fetch_patient_test(state:GraphState, db:Session) -> GraphState:
-    """
-    Primer nodo: Se conecta a la BD para buscar todas las pruebas 
-    asociadas al perfil del paciente.
-    """ 
-    print("Obteniendo las pruebas del paciente...")
-    patient_id = state["patient_id"]
-
-    # Buscamos al paciente
-    paciente = db.query(models.Paciente).filter(models.Paciente.paciente_id == patient_id).first()
-    if not paciente:
-        raise ValueError(f"No se encontro al paciente con ID {patient_id}")
+class TestState(TypedDict):
+    patient_id: str # ID del paciente a evaluar
+    current_test: str # Prueba que evalua esta rama
+    prueba: PruebaContext # Valor del paciente y criterio de esta prueba
 
-    # Buscamos todos los criterios y pruebas asociados
-    criterios = db.query(models.Criterio).filter(
-        models.Criterio.empresa == paciente.empresa,
-        models.Criterio.perfil == paciente.perfil
-    ).all()
+def get_db_from_config(config: "RunnableConfig") -> AsyncSession:
+    """
+    La sesion de BD llega en la config de cada ejecucion, asi el grafo
+    compilado no depende de ninguna peticion y se puede reutilizar.
+    """
+    db = config.get("configurable", {}).get("db")
+    if db is None:
+        raise ValueError("Falta la sesion de BD: invoca el grafo con config={'configurable': {'db': sesion}}")
+    return db
 
-    if not criterios:
-        raise ValueError(f"No se encontraron criterios para el perfil {paciente.perfil}")
+async def fetch_patient_test(state:GraphState, config: "RunnableConfig") -> GraphState:
+    """
+    Primer nodo: Se conecta a la BD y carga de una vez al paciente y sus resultados,
+    junto con los criterios de su perfil y la ultima evaluacion guardada.
+    Es el unico nodo que lee de la BD.
+    """ 
+    logger.debug("Obteniendo las pruebas del paciente %s", state["patient_id"])
+    started = time.perf_counter()
+    db = get_db_from_config(config)
+
+    # Los criterios salen del indice en memoria (sin consulta) cuando esta cargado
+    context = await load_patient_context(db, state["patient_id"], criteria_index)
+
+    # Las pruebas cuyo criterio y valor no cambiaron desde la ultima evaluacion no se re-evaluan
+    # (`reutilizar=False` en la config fuerza a evaluar todo de nuevo)
+    reused, previous = {}, None
+    if PERSISTIR_EVALUACIONES and config.get("configurable", {}).get("reutilizar", True):
+        anterior = await ultima_evaluacion(db, state["patient_id"])
+        reused = reutilizables(context, anterior)
+        if anterior is not None:
+            previous = {"id": anterior.id, "version_datos": anterior.version_datos}
+
+    # Con checkpointer, reintentar una ejecucion vuelve a correr el grafo sobre su estado:
+    # las pruebas que ya terminaron bien se conservan si los datos no cambiaron
+    anteriores = state.get("test_results") or {}
+    if anteriores and state.get("context") is not None and state["context"].huella() == context.huella():
+        reused = {**reused, **{
+            test: res for test, res in anteriores.items() if res.get("source") not in SOURCES_TO_RETRY
+        }}
 
     # Extraemos los nombres de las pruebas
-    test = [c.nombre_prueba for c in criterios]
-
-    print(f"-> Pruebas a realizar para el perfil '{paciente.perfil}': {test}")
+    test = [nombre for nombre in context.nombres_pruebas if nombre not in reused]
 
-    # Actualizamos los estados
-    state["tests_to_run"] = test
-    state["test_results"] = {}
+    logger.debug("Pruebas a realizar para el perfil '%s': %s (%d reutilizadas)", context.perfil, test, len(reused))
 
-    return state
+    # Actualizamos los estados (lo que no se conserva del intento anterior se descarta)
+    return {
+        "context": context, "tests_to_run": test,
+        "test_results": {**{t: None for t in anteriores if t not in reused}, **reused},
+        "previous_evaluation": previous, "evaluation_id": None, "started": started,
+    }
 
-llm = ChatOpenAI(model="gpt-4o", temperature = 0)
-evaluation_agent_executor = crear_agente_evaluador(llm)
+# Evaluadores compartidos por todas las evaluaciones. Se crean en el primer uso
+# (la API los precarga en su lifespan), no al importar: los agentes de langchain
+# y el cliente de OpenAI suman mas de un segundo de imports. Los benchmarks
+# pueden reemplazarlos asignando estos atributos.
+evaluation_agent_executor = None
+structured_evaluator = None
+_evaluadores_lock = threading.Lock()
+
+def agente_evaluador():
+    global evaluation_agent_executor
+    with _evaluadores_lock:
+        if evaluation_agent_executor is None:
+            from .llm_gateway import obtener_llm
+            from .specialist import crear_agente_evaluador
+            evaluation_agent_executor = crear_agente_evaluador(obtener_llm(), PROMPT_AGENTE)
+        return evaluation_agent_executor
+
+def evaluador_estructurado():
+    global structured_evaluator
+    with _evaluadores_lock:
+        if structured_evaluator is None:
+            from .llm_gateway import obtener_llm
+            from .specialist import crear_evaluador_estructurado
+            structured_evaluator = crear_evaluador_estructurado(obtener_llm())
+        return structured_evaluator
+
+def precargar_evaluadores():
+    """Crea el gateway del LLM y los dos evaluadores (el de cada modo) de una vez."""
+    agente_evaluador()
+    evaluador_estructurado()
+
+def llm_metrics(mode: str, started: float, input_tokens: int, output_tokens: int, tests_in_call: int = 1, calls: int = 1) -> Dict[str, float]:
+    """
+    Latencia, tokens y costo de una llamada al evaluador. Si la llamada evaluo
+    varias pruebas, tokens y costo se reparten entre ellas. `calls` son las
+    llamadas al LLM que hizo (el agente ReAct hace una por paso).
+    """
+    tokens_por_llamada = input_tokens / calls if calls else 0
+    input_tokens = input_tokens / tests_in_call
+    output_tokens = output_tokens / tests_in_call
+    return {
+        "modo": mode,
+        "latencia_ms": round((time.perf_counter() - started) * 1000, 1),
+        "tokens_entrada": input_tokens,
+        "tokens_salida": output_tokens,
+        "costo_usd": round((input_tokens * LLM_PRICE_INPUT + output_tokens * LLM_PRICE_OUTPUT) / 1_000_000, 6),
+        "pruebas_en_llamada": tests_in_call,
+        "llamadas_llm": calls,
+        "tokens_entrada_por_llamada": round(tokens_por_llamada, 1),
+    }
 
-def run_evaluation_agent(state: GraphState, db: Session) -> GraphState:
+def quick_verdict(criterio: CriterioContext, current_test: str, valor_paciente_str: Optional[str], numero: Optional[float] = None) -> Optional[Dict[str, str]]:
     """
-    Segundo nodo: Ejecuta el agente evaluador para una prueba especifica
+    Todo lo que se puede decidir sin el LLM: prueba sin resultado, reglas, cache
+    y clasificador local.
+    `numero` es el valor ya interpretado en la ingesta, si se tiene.
+    Devuelve None si la prueba necesita al evaluador.
     """
-    print("Nodo: Ejecutando Agente Evaluador")
+    # Sin resultado no hay nada que evaluar: la prueba queda observada hasta completarla
+    if valor_paciente_str is None:
+        logger.debug("Sin resultado para '%s'", current_test)
+        return {
+            "verdict": "Observado",
+            "reasoning": f"El paciente no tiene un resultado registrado para '{current_test}'. Debe completarse la prueba.",
+            "source": "missing"
+        }
 
-    # Tomamos la primera prueba de la lista de pendientes
-    tests_pending = state["tests_to_run"]
-    current_test = tests_pending.pop(0)
-    print(f"-> Evaluando prueba: '{current_test}'")
+    # Camino rapido: si la regla y el valor son numericos no necesitamos al agente
+    resultado_regla = evaluar_con_reglas(criterio, valor_paciente_str, numero)
+    if resultado_regla is not None:
+        logger.debug("Conclusión por reglas para '%s': %s", current_test, resultado_regla["verdict"])
+        return resultado_regla
 
-    patient_id = state['patient_id']
+    # Si otro paciente ya tuvo el mismo valor para este mismo criterio, reutilizamos el veredicto
+    resultado_cache = verdict_cache.get(criterio, current_test, valor_paciente_str)
+    if resultado_cache is not None and resultado_cache["verdict"] in VEREDICTOS:
+        logger.debug("Conclusión desde cache para '%s': %s", current_test, resultado_cache["verdict"])
+        return {**resultado_cache, "source": "cache"}
 
-    # Obtenemos de la BD los datos necesarios para esta prueba
-    paciente = db.query(models.Paciente).filter(models.Paciente.paciente_id == patient_id).first()
-    resultado_paciente = db.query(models.Resultado).filter(
-        models.Resultado.paciente_id == paciente.id,
-        models.Resultado.nombre_prueba == current_test
-    ).first()
-    criterio = db.query(models.Criterio). filter(
-        models.Criterio.empresa == paciente.empresa,
-        models.Criterio.perfil == paciente.perfil,
-        models.Criterio.nombre_prueba == current_test
-    ).first()
+    # Hallazgos de texto frecuentes: el clasificador local, entrenado con veredictos anteriores del agente
+    resultado_clasificador = clasificador.predecir(criterio, current_test, valor_paciente_str)
+    if resultado_clasificador is not None:
+        logger.debug("Conclusión del clasificador para '%s': %s", current_test, resultado_clasificador["verdict"])
+        return resultado_clasificador
 
-    valor_paciente_str = resultado_paciente.valor
+    return None
 
-    try:
-        valor_para_agente = float(valor_paciente_str.split()[0].replace(",","."))
-    except (ValueError, IndexError):
-        valor_para_agente = valor_paciente_str.strip()
+def fallback_verdict(current_test: str, error: Exception) -> Dict[str, str]:
+    """
+    Veredicto de respaldo cuando el LLM no esta disponible: la prueba queda
+    'Pendiente' de revision manual (no es un hallazgo: una caida del LLM no debe
+    dejar Observado a un paciente sano). No se guarda en el cache de veredictos.
+    """
+    LLM_FALLBACKS.inc()
+    logger.warning("Sin LLM para '%s', se usa el veredicto de respaldo: %s", current_test, error)
+    return {
+        "verdict": "Pendiente",
+        "reasoning": f"No se pudo consultar al evaluador para '{current_test}' ({error}). Requiere revision manual.",
+        "source": "fallback",
+    }
+
+def failed_verdict(current_test: str, error: Exception) -> Dict[str, str]:
+    """
+    Resultado de una prueba cuya evaluacion fallo: queda 'Pendiente' y el resto
+    del paciente se evalua igual. Al reanudar la ejecucion se vuelve a evaluar.
+    """
+    TEST_FAILURES.inc()
+    logger.warning("Fallo la evaluacion de '%s': %r", current_test, error)
+    return {
+        "verdict": "Pendiente",
+        "reasoning": f"Fallo la evaluacion de '{current_test}' ({type(error).__name__}: {error}). Se reintenta al reanudar la ejecucion.",
+        "source": "error",
+    }
+
+def remember_verdict(criterio: CriterioContext, current_test: str, valor_paciente_str: str, resultado: Dict):
+    # Solo veredictos validos: lo que se guarda se sirve a los demas pacientes y entrena al clasificador
+    if resultado["verdict"] not in VEREDICTOS:
+        return
+    # Las metricas son de esta llamada, no se guardan en el cache
+    verdict_cache.put(criterio, current_test, valor_paciente_str, {
+        "verdict": resultado["verdict"], "reasoning": resultado["reasoning"], "source": resultado["source"]
+    })
+
+def entrada_agente(criterio: CriterioContext, valor_paciente_str: str, numero: Optional[float] = None) -> Dict[str, str]:
+    """Variables del prompt del agente para una prueba (las mismas en cualquier variante del prompt)."""
+    # En otra unidad que la del criterio el agente recibe el texto, con su unidad
+    numero = numero_comparable(criterio, valor_paciente_str, numero)
+    valor_para_agente = numero if numero is not None else valor_paciente_str.strip()
 
-    # Preparamos la entrada para el agente evaluador
     criterio_para_agente = {
         "apto": criterio.apto, 
         "observado": criterio.observado,
         "no_apto": criterio.no_apto
     }
-    input_data = {
+    return {
         "valor_paciente": valor_para_agente,
         "criterios_json": json.dumps(criterio_para_agente)
     }
 
-    # Invocamos al agente
-    result = evaluation_agent_executor.invoke(input_data)
+async def run_react_agent(criterio: CriterioContext, current_test: str, valor_paciente_str: str, numero: Optional[float] = None) -> Dict:
+    """
+    Modo "react": el agente razona paso a paso usando las herramientas matematicas.
+    Recibe el numero ya interpretado; los valores de texto o compuestos ('120/80 mmHg') van tal cual.
+    """
+    input_data = entrada_agente(criterio, valor_paciente_str, numero)
+
+    # Importarlo carga langsmith (~0.4 s): recien cuando se llama al agente
+    from langchain_core.callbacks import get_usage_metadata_callback
+
+    # Invocamos al agente sin bloquear el event loop
+    started = time.perf_counter()
+    with get_usage_metadata_callback() as usage:
+        result = await agente_evaluador().ainvoke(
+            input_data, config={"callbacks": [metrics_callback], "metadata": {"prompt": PROMPT_AGENTE}}
+        )
+    tokens = list(usage.usage_metadata.values())
     conclusion = result.get("output", "Error")
 
     reasoning_steps = result.get("intermediate_steps", [])
@@ -109,97 +285,268 @@ def run_evaluation_agent(state: GraphState, db: Session) -> GraphState:
             f"Observacion: {observation}\n---\n"
         )
 
-    print(f"-> Conclusión del agente: {conclusion}")
+    logger.debug("Conclusión del agente para '%s': %s", current_test, conclusion)
 
-    # Actualizamos el estado
-    current_results = state["test_results"]
-    current_results[current_test] = {
-        "verdict":conclusion,
-        "reasoning": formatted_reasoning
+    # Detenido por el tope, el agente no hizo la llamada de la respuesta final
+    detenido = conclusion.strip() == SALIDA_AGENTE_DETENIDO
+    metricas = llm_metrics(
+        "react", started,
+        sum(t.get("input_tokens", 0) for t in tokens),
+        sum(t.get("output_tokens", 0) for t in tokens),
+        calls=len(reasoning_steps) + (0 if detenido else 1),
+    )
+    if detenido:
+        error = AgenteDetenido(f"sin veredicto despues de {len(reasoning_steps)} pasos")
+        return {**failed_verdict(current_test, error), "metrics": metricas}
+
+    veredicto = normalizar_veredicto(conclusion)
+    if veredicto is None:
+        # Una respuesta que no es un veredicto queda 'Pendiente' (nunca Apto) y no se guarda
+        return {**failed_verdict(current_test, VeredictoInvalido(conclusion)), "metrics": metricas}
+
+    resultado_agente = {
+        "verdict": veredicto,
+        "reasoning": formatted_reasoning,
+        "source": "agent",
+        "metrics": metricas,
     }
+    remember_verdict(criterio, current_test, valor_paciente_str, resultado_agente)
 
-    state["tests_to_run"] = tests_pending
-    state["test_results"] = current_results
+    return resultado_agente
 
-    return state
+async def run_structured_evaluator(cases: List[Tuple[CriterioContext, str, str, Optional[float]]]) -> Dict[str, Dict]:
+    """
+    Modo "structured": una sola llamada al LLM para todas las pruebas pendientes,
+    con la respuesta validada contra `VeredictosPaciente`. Las pruebas que falten
+    en la respuesta (o si no valida) se evaluan con el agente ReAct.
+    Cada caso es (criterio, prueba, valor, numero ya interpretado o None).
+    """
+    casos_json = json.dumps([
+        {
+            "prueba": test,
+            "valor_paciente": valor,
+            "criterios": {"apto": criterio.apto, "observado": criterio.observado, "no_apto": criterio.no_apto},
+        }
+        for criterio, test, valor, _ in cases
+    ], ensure_ascii=False)
+
+    started = time.perf_counter()
+    respuesta = await evaluador_estructurado().ainvoke({"casos_json": casos_json}, config={"callbacks": [metrics_callback], "metadata": {"prompt": "estructurado"}})
+    usage = getattr(respuesta["raw"], "usage_metadata", None) or {}
+    parsed = respuesta.get("parsed")
+
+    veredictos = {v.prueba: v for v in parsed.evaluaciones} if parsed is not None else {}
+    if parsed is None:
+        logger.warning("Respuesta estructurada invalida: %s", respuesta.get("parsing_error"))
+
+    results = {}
+    for criterio, test, valor, numero in cases:
+        veredicto = veredictos.get(test)
+        if veredicto is None:
+            # Con el numero de la ingesta, como cuando la prueba va directo al agente
+            results[test] = await run_react_agent(criterio, test, valor, numero)
+            continue
+        results[test] = {
+            "verdict": veredicto.veredicto,
+            "reasoning": veredicto.razonamiento,
+            "source": "agent",
+            "metrics": llm_metrics(
+                "structured", started, usage.get("input_tokens", 0), usage.get("output_tokens", 0), len(cases)
+            )
+        }
+        remember_verdict(criterio, test, valor, results[test])
 
-def decide_next_step(state:GraphState) -> str:
+    return results
+
+async def evaluate_test(criterio: CriterioContext, current_test: str, valor_paciente_str: Optional[str], numero: Optional[float] = None) -> Dict:
     """
-    Tercer nodo (condicional): Revisa si aun quedan pruebas por evaluar.
+    Evalua una prueba contra su criterio: primero sin LLM (reglas, cache)
+    y, si eso no alcanza, con el evaluador del modo configurado.
     """
-    print("Nodo: Decidiendo siguiente paso...")
+    resultado = quick_verdict(criterio, current_test, valor_paciente_str, numero)
+    if resultado is not None:
+        return resultado
 
-    if len(state["tests_to_run"]) > 0:
-        print("-> Aun quedan pruebas. Continuando evaluación.")
-        return "continue_evaluation"
-    
-    else:
-        print("-> No quedan mas pruebas. Finalizado.")
-        return "finish_evaluation"
+    try:
+        if EVALUATOR_MODE == "structured":
+            return (await run_structured_evaluator([(criterio, current_test, valor_paciente_str, numero)]))[current_test]
+        return await run_react_agent(criterio, current_test, valor_paciente_str, numero)
+    except LLMNoDisponible as error:
+        return fallback_verdict(current_test, error)
+
+async def run_evaluation_agent(state: TestState) -> GraphState:
+    """
+    Segundo nodo: Ejecuta el agente evaluador para una prueba especifica.
+    Cada prueba corre en su propia rama, en paralelo con las demas.
+    """
+    current_test = state["current_test"]
+    logger.debug("Evaluando prueba '%s'", current_test)
+
+    # Todo lo necesario ya viene en el contexto: esta rama no consulta la BD
+    prueba = state["prueba"]
+    try:
+        resultado = await evaluate_test(prueba.criterio, current_test, prueba.valor, prueba.numero)
+    except Exception as error:
+        # El fallo queda en esta prueba: las demas ramas terminan y el grafo sigue
+        resultado = failed_verdict(current_test, error)
+
+    # Devolvemos solo el resultado de esta prueba, el reductor lo junta con los demas
+    return {"test_results": {current_test: resultado}}
+
+async def run_structured_batch(state: GraphState) -> GraphState:
+    """
+    Segundo nodo en modo "structured": resuelve sin LLM todo lo que puede y manda
+    las pruebas restantes del paciente en una sola llamada al evaluador.
+    """
+    context = state["context"]
+    test_results = {}
+    pending = []
+    for prueba in map(context.prueba, state["tests_to_run"]):
+        resultado = quick_verdict(prueba.criterio, prueba.nombre_prueba, prueba.valor, prueba.numero)
+        if resultado is None:
+            pending.append((prueba.criterio, prueba.nombre_prueba, prueba.valor, prueba.numero))
+        else:
+            test_results[prueba.nombre_prueba] = resultado
+
+    if pending:
+        logger.debug("Evaluando %d pruebas en una sola llamada", len(pending))
+        try:
+            test_results.update(await run_structured_evaluator(pending))
+        except LLMNoDisponible as error:
+            test_results.update({test: fallback_verdict(test, error) for _, test, _, _ in pending})
+        except Exception as error:
+            test_results.update({test: failed_verdict(test, error) for _, test, _, _ in pending})
+
+    return {"test_results": test_results}
+
+def dispatch_tests(state: GraphState):
+    """
+    Tercer nodo (condicional): Lanza una rama de `run_agent` por cada prueba pendiente.
+    """
+    if not state["tests_to_run"]:
+        logger.debug("No hay pruebas por evaluar. Finalizado.")
+        return "consolidate"
+
+    from langgraph.types import Send
+
+    logger.debug("Evaluando %d pruebas en paralelo", len(state["tests_to_run"]))
+    context = state["context"]
+    return [
+        Send("run_agent", {"patient_id": state["patient_id"], "current_test": test, "prueba": context.prueba(test)})
+        for test in state["tests_to_run"]
+    ]
+
+def consolidate_verdicts(verdicts: List[str]) -> str:
+    """
+    Regla de consolidacion: basta un 'No Apto' para que el paciente sea No Apto;
+    si no, una prueba que fallo (o cualquier veredicto que no se reconoce) lo deja
+    'Pendiente' y si no, basta un 'Observado' para que sea Observado.
+    """
+    if "No Apto" in verdicts:
+        return "No Apto"
+    if any(v not in VEREDICTOS for v in verdicts):
+        return "Pendiente"
+    if "Observado" in verdicts:
+        return "Observado"
+    return "Apto"
+
+def format_test_results(test_results: Dict[str, Dict[str, str]]) -> List[Dict[str, str]]:
+    """
+    Resultados por prueba en el formato de la API (prueba, resultado, razonamiento, origen, metricas)
+    """
+    return [
+        {
+            "prueba": test, "resultado": res["verdict"], "razonamiento": res["reasoning"],
+            "origen": res.get("source", "agent"), "metricas": res.get("metrics")
+        }
+        for test, res in test_results.items()
+    ]
 
 def consolidate_result(state: GraphState) -> GraphState:
     """
     Nodo final: Revisa todos los resultados individuales
     y genera el veredicto final del paciente.
     """
-    print("Nodo: Consolidando Resultados")
-
     test_results = state["test_results"]
 
-    verdicts = [res["verdict"] for res in test_results.values()]
+    final_verdicts = consolidate_verdicts([res["verdict"] for res in test_results.values()])
 
-    final_verdicts = "Apto"
-    if any("No Apto" in v for v in verdicts):
-        final_verdicts = "No Apto"
-    elif any("Observado" in v for v in verdicts):
-        final_verdicts = "Observado"
-    
-    print(f"-> Veredicto final consolidado: {final_verdicts}")
+    logger.info("Paciente %s: veredicto final %s", state["patient_id"], final_verdicts)
 
-    state["final_veredict"] = final_verdicts
-    return state
+    return {"final_veredict": final_verdicts}
 
-def build_graph(db_session: Session):
+def persist_node(mode: str):
     """
-    Construye y compila el grafo del orquestador con el bucle de evaluacion
+    Nodo final de guardado para el modo `mode`: la evaluacion queda en la BD,
+    la proxima solo re-evalua lo que cambio y se puede leer sin correr el grafo.
     """
-    workflow = StateGraph(GraphState)
+    async def persist_results(state: GraphState, config: "RunnableConfig") -> GraphState:
+        if not PERSISTIR_EVALUACIONES:
+            return {}
+
+        context = state["context"]
+        previous = state.get("previous_evaluation")
+        # Nada cambio desde la ultima evaluacion: ya esta guardada tal cual
+        if previous and not state["tests_to_run"] and previous["version_datos"] == context.huella():
+            return {"evaluation_id": previous["id"]}
+
+        db = get_db_from_config(config)
+        try:
+            evaluation_id = await guardar_evaluacion(
+                db, context, state["test_results"], state["final_veredict"], mode,
+                (time.perf_counter() - state["started"]) * 1000,
+            )
+        except SQLAlchemyError as error:
+            # El veredicto ya esta calculado: no guardarlo no debe hacer fallar la evaluacion
+            await db.rollback()
+            logger.warning("No se pudo guardar la evaluacion de %s: %s", state["patient_id"], error)
+            return {}
+
+        logger.debug("Paciente %s: evaluacion %d guardada", state["patient_id"], evaluation_id)
+        return {"evaluation_id": evaluation_id}
+
+    return persist_results
+
+def build_graph(mode: str = EVALUATOR_MODE, checkpointer=None):
+    """
+    Construye y compila el grafo del orquestador. En modo "react" `fetch_tests`
+    reparte una rama por prueba (map) y `consolidate` junta todos los resultados
+    (reduce); en modo "structured" un solo nodo evalua todas las pruebas juntas.
+    `persist` guarda la evaluacion al final. Se compila una sola vez; la sesion de BD se pasa en cada ejecucion con
+    `config={"configurable": {"db": sesion}, "max_concurrency": ...}`.
+    Con `checkpointer` el estado se guarda despues de cada paso y la config
+    necesita ademas un `thread_id` (ver `checkpoints.Ejecuciones`).
+    """
+    # langgraph se importa aqui: importar el orquestador (p. ej. desde la API) no lo carga
+    from langgraph.graph import StateGraph
 
-    # Inyectamos la BD
-    fetch_patient_test_with_db = partial(fetch_patient_test, db=db_session)
-    run_evaluation_agent_with_db = partial(run_evaluation_agent, db=db_session)
+    workflow = StateGraph(GraphState)
 
     # Primer nodo del grafo
-    workflow.add_node("fetch_tests", fetch_patient_test_with_db)
-    workflow.add_node("run_agent", run_evaluation_agent_with_db)
-    #workflow.add_node("router", decide_next_step) # No necesita la BD
-    workflow.add_node("consolidate", consolidate_result)
+    # Cada nodo se envuelve con `medir_nodo` para medir su duracion y abrir un span
+    workflow.add_node("fetch_tests", medir_nodo("fetch_tests", fetch_patient_test))
+    workflow.add_node("consolidate", medir_nodo("consolidate", consolidate_result))
+    workflow.add_node("persist", medir_nodo("persist", persist_node(mode)))
 
     # Punto de entrada del grafo
     workflow.set_entry_point("fetch_tests")
 
-    # Vamos al router para decidir
-    #workflow.add_edge("fetch_tests", "router")
-    #workflow.add_edge("run_agent", "router")
+    if mode == "structured":
+        workflow.add_node("run_batch", medir_nodo("run_batch", run_structured_batch))
+        workflow.add_edge("fetch_tests", "run_batch")
+        workflow.add_edge("run_batch", "consolidate")
+    else:
+        workflow.add_node("run_agent", medir_nodo("run_agent", run_evaluation_agent))
 
-    workflow.add_edge("consolidate", "__end__")
+        # Map: una rama por prueba (o directo a consolidar si no hay pruebas)
+        workflow.add_conditional_edges("fetch_tests", dispatch_tests, ["run_agent", "consolidate"])
+
+        # Reduce: consolidate espera a que terminen todas las ramas
+        workflow.add_edge("run_agent", "consolidate")
+
+    # Guardamos el resultado antes de terminar
+    workflow.add_edge("consolidate", "persist")
+    workflow.add_edge("persist", "__end__")
 
-    # Creamos la ARISTA CONDICIONAL
-    workflow.add_conditional_edges(
-        "fetch_tests",
-        decide_next_step,
-        {
-            "continue_evaluation": "run_agent",
-            "finish_evaluation": "consolidate"
-        }
-    )
-    workflow.add_conditional_edges(
-        "run_agent",
-        decide_next_step,
-        {
-            "continue_evaluation": "run_agent",
-            "finish_evaluation":  "consolidate"
-        }
-    )
     # Compilamos el grafo
-    return workflow.compile()
\ No newline at end of file
+    return workflow.compile(checkpointer=checkpointer)
@@ -0,0 +1,244 @@
+import math
+import re
+from dataclasses import dataclass
+from functools import cached_property, lru_cache
+from typing import Dict, FrozenSet, Optional, Tuple
+
+from backend.app.database.valores import UNIDADES, normalizar, normalizar_texto as _normalizar, unidades_de
+
+# Orden en el que el agente revisa las reglas (el mismo del prompt)
+ORDEN_VEREDICTOS = (("apto", "Apto"), ("observado", "Observado"), ("no_apto", "No Apto"))
+
+# Frases que indican que un veredicto no tiene regla (nunca se cumple)
+SIN_REGLA = ("no existe", "no aplica", "ninguno", "ninguna", "n/a")
+
+_NUMERO = r"[-+]?\d+(?:[.,]\d+)?"
+_COMPARADOR = r"<=|>=|=<|=>|≤|≥|<|>"
+
+_PATRON_ENTRE = re.compile(rf"^(?:entre|de)?\s*({_NUMERO})\s*(?:y|a|-|–)\s*({_NUMERO})$")
+_PATRON_COMPARADOR = re.compile(rf"^({_COMPARADOR})\s*({_NUMERO})$")
+_PATRON_TEXTO = re.compile(
+    rf"^(menor|mayor)\s+(?:o\s+igual\s+)?(?:que|a|de)\s+({_NUMERO})$"
+)
+
+
+@dataclass(frozen=True)
+class Intervalo:
+    inferior: float = -math.inf
+    superior: float = math.inf
+    incluye_inferior: bool = True
+    incluye_superior: bool = True
+
+    def contiene(self, valor: float) -> bool:
+        if valor < self.inferior or (valor == self.inferior and not self.incluye_inferior):
+            return False
+        if valor > self.superior or (valor == self.superior and not self.incluye_superior):
+            return False
+        return True
+
+    def __str__(self) -> str:
+        izquierda = "[" if self.incluye_inferior else "("
+        derecha = "]" if self.incluye_superior else ")"
+        return f"{izquierda}{self.inferior}, {self.superior}{derecha}"
+
+
+@dataclass(frozen=True)
+class Regla:
+    texto: str
+    intervalos: Tuple[Intervalo, ...]
+    unidades: FrozenSet[str] = frozenset() # Unidades escritas en la regla ('mg/dl')
+
+    def cumple(self, valor: float) -> bool:
+        return any(intervalo.contiene(valor) for intervalo in self.intervalos)
+
+
+@dataclass(frozen=True)
+class CriterioCompilado:
+    """
+    Reglas de un criterio ya parseadas. Un veredicto con regla `None`
+    no pudo interpretarse y debe resolverlo el agente.
+    """
+    nombre_prueba: str
+    reglas: Dict[str, Optional[Regla]]
+
+    @property
+    def es_numerico(self) -> bool:
+        return all(regla is not None for regla in self.reglas.values())
+
+    @cached_property
+    def unidades(self) -> FrozenSet[str]:
+        return frozenset().union(*(regla.unidades for regla in self.reglas.values() if regla is not None))
+
+    def admite_unidad(self, unidad: Optional[str]) -> bool:
+        """
+        Si un numero con esta unidad se puede comparar con las reglas. Un valor
+        sin unidad, o un criterio que no la escribe, se compara tal cual.
+        """
+        propias = unidades_de(unidad)
+        return not propias or not self.unidades or propias <= self.unidades
+
+    def evaluar(self, valor: float) -> Optional[Tuple[str, str]]:
+        """
+        Revisa las reglas en el mismo orden que el agente. Devuelve
+        (veredicto, razonamiento) o None si no se puede decidir localmente.
+        """
+        pasos = []
+        for clave, veredicto in ORDEN_VEREDICTOS:
+            regla = self.reglas.get(clave)
+            if regla is None:
+                return None
+            cumple = regla.cumple(valor)
+            intervalos = " o ".join(str(i) for i in regla.intervalos) or "sin regla"
+            pasos.append(f"Regla '{veredicto}' ({regla.texto.strip()}): {valor} en {intervalos} -> {cumple}")
+            if cumple:
+                return veredicto, "\n".join(pasos)
+        # Ninguna regla cubre el valor (hueco entre rangos), lo decide el agente
+        return None
+
+
+def _palabras_prueba(nombre_prueba: str) -> set:
+    """Palabras que pueden aparecer como etiqueta en la regla (ej: 'IMC')."""
+    return set(re.findall(r"[a-z]+", _normalizar(nombre_prueba)))
+
+
+def _limpiar_clausula(clausula: str, etiquetas: set) -> str:
+    # Quitamos la etiqueta de la prueba y las unidades, el resto debe ser la condicion
+    tokens = [
+        t for t in clausula.replace(":", " ").split()
+        if t not in etiquetas and t not in UNIDADES
+    ]
+    return " ".join(tokens).strip(" .;")
+
+
+def _numero(texto: str) -> float:
+    return float(texto.replace(",", "."))
+
+
+def _parsear_clausula(clausula: str) -> Optional[Intervalo]:
+    coincidencia = _PATRON_ENTRE.match(clausula)
+    if coincidencia:
+        inferior, superior = sorted((_numero(coincidencia.group(1)), _numero(coincidencia.group(2))))
+        return Intervalo(inferior, superior)
+
+    coincidencia = _PATRON_COMPARADOR.match(clausula)
+    if coincidencia:
+        operador, numero = coincidencia.group(1), _numero(coincidencia.group(2))
+        if operador in ("<", "<=", "=<", "≤"):
+            return Intervalo(superior=numero, incluye_superior=operador != "<")
+        return Intervalo(inferior=numero, incluye_inferior=operador != ">")
+
+    coincidencia = _PATRON_TEXTO.match(clausula)
+    if coincidencia:
+        inclusivo = " igual " in f" {clausula} "
+        numero = _numero(coincidencia.group(2))
+        if coincidencia.group(1) == "menor":
+            return Intervalo(superior=numero, incluye_superior=inclusivo)
+        return Intervalo(inferior=numero, incluye_inferior=inclusivo)
+
+    return None
+
+
+@lru_cache(maxsize=1024)
+def compilar_regla(texto: str, nombre_prueba: str = "") -> Optional[Regla]:
+    """
+    Convierte el texto de una regla (ej: 'IMC entre 25.0 y 34.9 o IMC <18.5')
+    en una union de intervalos. Devuelve None si el texto tiene condiciones
+    que no son rangos numericos (ej: 'con sintomatologia cardiovascular').
+    """
+    normalizado = _normalizar(texto or "")
+
+    if not normalizado or normalizado.startswith(SIN_REGLA):
+        return Regla(texto=texto or "", intervalos=())
+
+    # Los comentarios entre parentesis sin numeros no cambian la regla
+    normalizado = re.sub(r"\([^()\d]*\)", " ", normalizado)
+    if "(" in normalizado or ")" in normalizado or "\n" in normalizado:
+        return None
+
+    etiquetas = _palabras_prueba(nombre_prueba)
+    intervalos = []
+    for clausula in re.split(r"\s+o\s+", normalizado):
+        intervalo = _parsear_clausula(_limpiar_clausula(clausula, etiquetas))
+        if intervalo is None:
+            return None
+        intervalos.append(intervalo)
+
+    return Regla(texto=texto, intervalos=tuple(intervalos), unidades=unidades_de(normalizado))
+
+
+@lru_cache(maxsize=1024)
+def compilar_criterio(nombre_prueba: str, apto: str, observado: str, no_apto: str) -> CriterioCompilado:
+    return CriterioCompilado(
+        nombre_prueba=nombre_prueba,
+        reglas={
+            "apto": compilar_regla(apto, nombre_prueba),
+            "observado": compilar_regla(observado, nombre_prueba),
+            "no_apto": compilar_regla(no_apto, nombre_prueba),
+        },
+    )
+
+
+def _compilado(criterio) -> CriterioCompilado:
+    # Un CriterioContext guarda sus reglas ya parseadas (`compilado`); otros objetos pasan por el cache
+    return getattr(criterio, "compilado", None) or compilar_criterio(
+        criterio.nombre_prueba, criterio.apto, criterio.observado, criterio.no_apto
+    )
+
+
+def numero_comparable(criterio, valor: Optional[str], numero: Optional[float] = None,
+                      unidad: Optional[str] = None) -> Optional[float]:
+    """
+    El numero del valor si se puede comparar con las reglas del criterio: None
+    si es texto o si trae una unidad distinta de la del criterio ('5 g/dl'
+    contra una regla en mg/dl), y entonces decide el agente con el texto.
+    `numero` y `unidad` son los de la ingesta; si no vienen, se interpreta `valor`.
+    """
+    if numero is None:
+        if valor is None:
+            return None
+        normalizado = normalizar(str(valor))
+        numero, unidad = normalizado.numero, normalizado.unidad
+    if numero is None or not _compilado(criterio).admite_unidad(unidad):
+        return None
+    return numero
+
+
+def evaluar_con_reglas(criterio, valor: str, numero: Optional[float] = None) -> Optional[Dict[str, str]]:
+    """
+    Camino rapido: decide el veredicto sin el agente cuando la regla y el
+    valor del paciente son numericos y en la misma unidad. `numero` es el
+    valor ya interpretado (ver `numero_comparable`); si no viene, se
+    interpreta `valor`. Devuelve None si debe usarse el agente.
+    """
+    numero = numero_comparable(criterio, valor, numero)
+    if numero is None:
+        return None
+
+    decision = _compilado(criterio).evaluar(numero)
+    if decision is None:
+        return None
+
+    veredicto, razonamiento = decision
+    return {"verdict": veredicto, "reasoning": razonamiento, "source": "rule"}
+
+
+_PATRON_VEREDICTO = re.compile(r"\bno\s+apto\b|\bobservado\b|\bapto\b")
+# Una negacion justo antes de 'apto' ('no es apto', 'ni apto'); 'no apto' ya es el veredicto No Apto
+_APTO_NEGADO = re.compile(r"\b(?:no|ni)\s+(?:(?:es|esta|resulta|sera|seria|fue|queda)\s+)?apto\b")
+
+
+def normalizar_veredicto(salida: Optional[str]) -> Optional[str]:
+    """
+    El veredicto ('Apto', 'Observado' o 'No Apto') de la respuesta del evaluador.
+    Devuelve None si no nombra exactamente uno, o si niega el 'Apto' justo antes
+    ('no es apto'): una respuesta dudosa nunca se toma como Apto. Las negaciones
+    en el resto del texto ('Apto, sin alteraciones') no cuentan.
+    """
+    normalizado = _normalizar(salida or "")
+    nombres = {" ".join(encontrado.split()) for encontrado in _PATRON_VEREDICTO.findall(normalizado)}
+    if len(nombres) != 1:
+        return None
+    nombre = nombres.pop()
+    if nombre == "apto" and _APTO_NEGADO.search(normalizado):
+        return None
+    return next(veredicto for _, veredicto in ORDEN_VEREDICTOS if veredicto.lower() == nombre)
@@ -4,15 +4,33 @@ from .tools import (
     es_mayor_o_igual_que,
     es_menor_o_igual_que
 )
-from langchain_core.prompts import PromptTemplate
+import os
+from typing import List, Literal
+from pydantic import BaseModel, Field
+from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
+from langchain_core.runnables import RunnablePassthrough
 from langchain.agents import AgentExecutor, create_react_agent
+from langchain.agents.output_parsers import ReActSingleInputOutputParser
 
-def crear_agente_evaluador(llm):
+# Variante "compacto": pasos del scratchpad que se reenvian completos (los anteriores
+# van resumidos) y tope de iteraciones del agente por prueba
+PASOS_COMPLETOS = int(os.getenv("AGENTE_PASOS_COMPLETOS", "2"))
+MAX_ITERACIONES = int(os.getenv("AGENTE_MAX_ITERACIONES", "8"))
+
+VARIANTES_PROMPT = ("completo", "compacto")
+
+def crear_agente_evaluador(llm, variante: str = "completo"):
     """
-    Crea un agente experto que razona sobre criterios medicos usando herramientas matematicas
+    Crea un agente experto que razona sobre criterios medicos usando herramientas matematicas.
+    `variante` elige el prompt: "completo" (el original) o "compacto" (ver `crear_agente_compacto`).
     """
     tools = [es_mayor_que, es_menor_que, es_menor_o_igual_que, es_mayor_o_igual_que]
 
+    if variante == "compacto":
+        return crear_agente_compacto(llm, tools)
+    if variante != "completo":
+        raise ValueError(f"Variante de prompt desconocida: {variante!r} (use una de {VARIANTES_PROMPT})")
+
     prompt_template = """
     Eres un riguroso medico auditor que evalua los resultados de un paciente. Tu objetivo es determinar si un pacinte es 'Apto', 'Observado' o 'No Apto' basado en el valor de un conjunto de criterios.
     
@@ -62,7 +80,112 @@ def crear_agente_evaluador(llm):
     prompt = PromptTemplate.from_template(prompt_template)
 
     agent = create_react_agent(llm, tools, prompt)
-    agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True, handle_parsing_errors=True, return_intermediate_steps=True)
+    agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=False, handle_parsing_errors=True, return_intermediate_steps=True)
 
     return agent_executor
 
+
+INSTRUCCIONES_COMPACTAS = """Eres un medico auditor. Decide si el valor del paciente es 'Apto', 'Observado' o 'No Apto' segun sus criterios.
+
+- Revisa las reglas en orden: 'Apto', luego 'Observado', luego 'No Apto'. La primera que se cumpla es el veredicto.
+- Valor NUMÉRICO: verifica cada limite con una herramienta y decide solo con los True/False que devuelven. Un rango 'entre A y B' son dos pasos: es_mayor_o_igual_que con A y es_menor_o_igual_que con B.
+- Valor DE TEXTO: interpreta el hallazgo sin herramientas; si es normal es 'Apto'.
+
+Herramientas (Action Input: 'valor, limite'):
+{tools}
+
+Formato:
+Thought: que hacer
+Action: una de [{tool_names}]
+Action Input: la entrada
+Observation: el resultado
+... (Thought/Action/Action Input/Observation se repite)
+Thought: Ahora sé la respuesta final.
+Final Answer: Apto, Observado o No Apto"""
+
+CASO_COMPACTO = """Información del caso:
+- Valor del paciente {valor_paciente}
+- Criterios: {criterios_json}
+
+Inicia tu razonamiento:
+{agent_scratchpad}"""
+
+def herramientas_compactas(tools) -> str:
+    """Una linea por herramienta: el nombre y la primera linea de su docstring."""
+    return "\n".join(f"- {t.name}: {t.description.strip().splitlines()[0]}" for t in tools)
+
+def scratchpad_acotado(pasos, completos: int = PASOS_COMPLETOS) -> str:
+    """
+    Scratchpad del agente con los pasos viejos resumidos: de ellos solo queda la
+    accion y su resultado, sin el texto del pensamiento. Los ultimos `completos`
+    pasos van tal cual, como los arma `format_log_to_str`.
+    """
+    partes = []
+    for n, (accion, observacion) in enumerate(pasos):
+        if n < len(pasos) - completos:
+            partes.append(f"Action: {accion.tool}\nAction Input: {accion.tool_input}\nObservation: {observacion}\n")
+        else:
+            partes.append(f"{accion.log}\nObservation: {observacion}\nThought: ")
+    if partes and not partes[-1].endswith("Thought: "):
+        partes.append("Thought: ")
+    return "".join(partes)
+
+def crear_agente_compacto(llm, tools):
+    """
+    El mismo agente ReAct con un prompt mas corto y ordenado para el cache de
+    prefijos del proveedor: instrucciones y herramientas (fijas) en el mensaje
+    de sistema, y el caso y el scratchpad (lo que cambia) al final. El
+    scratchpad se acota con `scratchpad_acotado` y el agente con `MAX_ITERACIONES`.
+    """
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", INSTRUCCIONES_COMPACTAS),
+        ("human", CASO_COMPACTO),
+    ]).partial(tools=herramientas_compactas(tools), tool_names=", ".join(t.name for t in tools))
+
+    # Lo que hace `create_react_agent`, con el scratchpad acotado
+    agent = (
+        RunnablePassthrough.assign(agent_scratchpad=lambda x: scratchpad_acotado(x["intermediate_steps"]))
+        | prompt
+        | llm.bind(stop=["\nObservation"])
+        | ReActSingleInputOutputParser()
+    )
+    return AgentExecutor(
+        agent=agent, tools=tools, verbose=False, handle_parsing_errors=True, return_intermediate_steps=True,
+        # Al llegar al tope devuelve un texto fijo en vez de un veredicto: el orquestador deja la prueba 'Pendiente'
+        max_iterations=MAX_ITERACIONES, early_stopping_method="force",
+    )
+
+
+class VeredictoPrueba(BaseModel):
+    prueba: str = Field(description="Nombre exacto de la prueba evaluada")
+    veredicto: Literal["Apto", "Observado", "No Apto"]
+    razonamiento: str = Field(description="Comparacion breve del valor con la regla que se cumple")
+
+class VeredictosPaciente(BaseModel):
+    evaluaciones: List[VeredictoPrueba]
+
+def crear_evaluador_estructurado(llm):
+    """
+    Alternativa al agente ReAct: evalua todas las pruebas pendientes de un
+    paciente en UNA sola llamada y devuelve veredictos validados contra un esquema.
+    Devuelve {"raw": AIMessage, "parsed": VeredictosPaciente | None, "parsing_error": ...}
+    """
+    instrucciones = """
+    Eres un riguroso medico auditor que evalua los resultados de un paciente. Para cada prueba debes determinar si el paciente es 'Apto', 'Observado' o 'No Apto' segun sus criterios.
+
+    Sigue este proceso para cada prueba:
+    1. Si la regla 'Apto' se cumple ESTRICTAMENTE, el veredicto es 'Apto'.
+    2. Si no, si se cumple la regla 'Observado', el veredicto es 'Observado'.
+    3. Si no, evalua la regla 'No Apto'.
+    - Para valores NUMÉRICOS compara con cuidado cada limite (un rango incluye ambos extremos salvo que la regla diga lo contrario).
+    - Para valores DE TEXTO interpreta el hallazgo; si es normal es 'Apto'.
+
+    Responde con una evaluacion por cada prueba recibida, usando exactamente el mismo nombre de prueba.
+    """
+
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", instrucciones),
+        ("human", "Pruebas del paciente (valor y criterios):\n{casos_json}")
+    ])
+
+    return prompt | llm.with_structured_output(VeredictosPaciente, include_raw=True)
@@ -1,13 +1,16 @@
 from langchain.tools import tool
 import re
 
+# Numeros enteros o decimales, con signo (el patron anterior perdia el signo de los enteros: '-5' -> 5)
+_NUMERO = re.compile(r"[-+]?(?:\d+\.\d*|\.\d+|\d+)")
+
 def _parse_input(input_str: str) -> tuple[float, float]:
     """Función interna para procesar el string de entrada del agente."""
     # Limpiamos la entrada de paréntesis y espacios
     cleaned_str = input_str.strip().strip('()')
     
-    # Usamos una expresión regular para encontrar todos los números (enteros o decimales)
-    numbers = re.findall(r"[-+]?\d*\.\d+|\d+", cleaned_str)
+    # El agente recibe el valor del paciente ya interpretado, asi que aqui solo llegan numeros simples
+    numbers = _NUMERO.findall(cleaned_str)
     
     if len(numbers) != 2:
         raise ValueError(f"Se esperaban 2 números, pero se encontraron {len(numbers)} en la entrada: '{input_str}'")
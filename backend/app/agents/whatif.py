@@ -0,0 +1,138 @@
+import time
+from dataclasses import replace
+from typing import Dict, List, Optional
+
+import pandas as pd
+from sqlalchemy.engine import Engine
+
+from backend.app.database import models
+from .cohort import PENDIENTE, cargar, consolidar, evaluar, expandir
+from .context import CriterioContext
+
+CAMPOS_REGLA = ("apto", "observado", "no_apto")
+COLUMNAS_VEREDICTO = ["numero", "gravedad", "veredicto", "origen"]
+
+
+def _aplicar_cambios(criterios: List[CriterioContext], cambios: List[Dict]):
+    """
+    Lista de criterios propuesta: los cambios reemplazan las reglas indicadas
+    (las que no vienen se mantienen), agregan pruebas nuevas o las eliminan.
+    Los criterios conservan su posicion, asi el `codigo` de cada fila sigue valiendo.
+    """
+    posiciones = {(c.empresa, c.perfil, c.tipo_examen, c.nombre_prueba): i for i, c in enumerate(criterios)}
+    propuestos = list(criterios)
+    modificados, eliminados, nuevos = set(), set(), []
+
+    for cambio in cambios:
+        clave = (
+            cambio["empresa"], cambio["perfil"],
+            cambio.get("tipo_examen") or models.TIPO_EXAMEN_POR_DEFECTO, cambio["nombre_prueba"],
+        )
+        reglas = {campo: cambio[campo] for campo in CAMPOS_REGLA if cambio.get(campo) is not None}
+        posicion = posiciones.get(clave)
+        if posicion is None:
+            if not cambio.get("eliminar"):
+                nuevos.append(CriterioContext(
+                    id=0, empresa=clave[0], perfil=clave[1], tipo_examen=clave[2], nombre_prueba=clave[3],
+                    **{campo: reglas.get(campo, "") for campo in CAMPOS_REGLA},
+                ))
+        elif cambio.get("eliminar"):
+            eliminados.add(posicion)
+        else:
+            propuestos[posicion] = replace(criterios[posicion], **reglas)
+            modificados.add(posicion)
+
+    propuestos.extend(nuevos)
+    return propuestos, modificados, eliminados, nuevos
+
+
+def _conteo(serie: pd.Series) -> Dict[str, int]:
+    return {str(k): int(v) for k, v in serie.fillna("Sin criterios").value_counts().items()}
+
+
+def simular(engine: Engine, cambios: List[Dict], usar_cache: bool = True, limite: Optional[int] = 100) -> Dict:
+    """
+    Que pasaria si se aplicaran `cambios` a la tabla de criterios. Solo se leen
+    los pacientes de los perfiles afectados y solo se re-evaluan las pruebas
+    cambiadas, con los valores guardados, el motor de reglas y el cache de
+    veredictos (nunca el LLM). Devuelve las transiciones de veredicto general
+    y, para los primeros `limite` pacientes que cambian, el detalle por prueba.
+    """
+    inicio = time.perf_counter()
+    perfiles = {(c["empresa"], c["perfil"]) for c in cambios}
+    pacientes, resultados, criterios = cargar(engine, perfiles=perfiles)
+
+    # Solo los pacientes del mismo tipo de examen que algun cambio
+    afectados = {(c["empresa"], c["perfil"], c.get("tipo_examen") or models.TIPO_EXAMEN_POR_DEFECTO) for c in cambios}
+    claves = pd.MultiIndex.from_frame(pacientes[["empresa", "perfil", "tipo_examen"]])
+    pacientes = pacientes[claves.isin(list(afectados))]
+
+    propuestos, modificados, eliminados, nuevos = _aplicar_cambios(criterios, cambios)
+
+    antes = evaluar(expandir(pacientes, resultados, criterios), criterios, usar_cache)
+
+    # Despues: las filas de criterios sin cambios se reutilizan tal cual
+    despues = antes[~antes["codigo"].isin(eliminados)].copy()
+    cambiadas = despues["codigo"].isin(modificados).to_numpy()
+    reevaluadas = int(cambiadas.sum())
+    if reevaluadas:
+        nuevas = evaluar(despues.loc[cambiadas].drop(columns=COLUMNAS_VEREDICTO), propuestos, usar_cache)
+        for columna in COLUMNAS_VEREDICTO:
+            despues.loc[cambiadas, columna] = nuevas[columna].to_numpy()
+    if nuevos:
+        codigos_nuevos = range(len(criterios), len(propuestos))
+        agregadas = evaluar(expandir(pacientes, resultados, nuevos, codigos_nuevos), propuestos, usar_cache)
+        reevaluadas += len(agregadas)
+        despues = pd.concat([despues, agregadas], ignore_index=True)
+
+    general = consolidar(pacientes, antes)[["paciente_id", "veredicto_general"]].merge(
+        consolidar(pacientes, despues)[["paciente_id", "veredicto_general"]],
+        on="paciente_id", suffixes=("_antes", "_despues"),
+    )
+    cambio = general["veredicto_general_antes"].fillna("") != general["veredicto_general_despues"].fillna("")
+    con_cambio = general[cambio]
+    transiciones = (con_cambio["veredicto_general_antes"].fillna("Sin criterios") + " -> "
+                    + con_cambio["veredicto_general_despues"].fillna("Sin criterios"))
+
+    # Detalle por prueba de los pacientes que cambian (solo las pruebas tocadas por los cambios)
+    detalle = con_cambio.head(limite) if limite is not None else con_cambio
+    codigos_tocados = modificados | eliminados | set(range(len(criterios), len(propuestos)))
+    def tocadas(filas):
+        filas = filas[filas["codigo"].isin(codigos_tocados) & filas["paciente_id"].isin(detalle["paciente_id"])]
+        return filas.assign(veredicto=filas["veredicto"].where(filas["origen"] != "pending", PENDIENTE))
+
+    pruebas = tocadas(antes)[["paciente_id", "nombre_prueba", "valor", "veredicto"]].merge(
+        tocadas(despues)[["paciente_id", "nombre_prueba", "valor", "veredicto", "origen"]],
+        on=["paciente_id", "nombre_prueba"], how="outer", suffixes=("_antes", "_despues"),
+    )
+    pruebas = pruebas.astype(object).where(pruebas.notna(), None)
+
+    por_paciente = {}
+    for fila in pruebas.itertuples(index=False):
+        por_paciente.setdefault(fila.paciente_id, []).append({
+            "prueba": fila.nombre_prueba,
+            "valor": fila.valor_despues if fila.valor_despues is not None else fila.valor_antes,
+            "antes": fila.veredicto_antes,
+            "despues": fila.veredicto_despues,
+            "origen": fila.origen,
+        })
+
+    return {
+        "pacientes_evaluados": int(len(pacientes)),
+        "pacientes_con_cambio": int(len(con_cambio)),
+        "transiciones": _conteo(transiciones),
+        "veredictos_antes": _conteo(general["veredicto_general_antes"]),
+        "veredictos_despues": _conteo(general["veredicto_general_despues"]),
+        "pruebas_reevaluadas": reevaluadas,
+        "pruebas_pendientes": int((despues["origen"] == "pending").sum()),
+        "pacientes": [
+            {
+                "paciente_id": fila.paciente_id,
+                "antes": fila.veredicto_general_antes,
+                "despues": fila.veredicto_general_despues,
+                "pruebas": por_paciente.get(fila.paciente_id, []),
+            }
+            for fila in detalle.astype(object).where(detalle.notna(), None).itertuples(index=False)
+        ],
+        "segundos": round(time.perf_counter() - inicio, 3),
+    }
@@ -0,0 +1,266 @@
+import hashlib
+import json
+import logging
+import time
+from dataclasses import dataclass
+from itertools import chain, islice
+from typing import Dict, Iterable, Iterator, List
+
+from sqlalchemy import case, delete, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection, Engine
+
+from .models import TIPO_EXAMEN_POR_DEFECTO, Criterio, Paciente, Resultado
+from .valores import columnas_valor
+
+logger = logging.getLogger(__name__)
+
+# Pacientes por transaccion: acota la memoria y lo que se pierde si falla un lote
+TAMANO_LOTE = 500
+
+CAMPOS_PACIENTE = ("empresa", "perfil", "puesto_ocupacional", "sexo", "tipo_examen")
+
+
+@dataclass
+class ResumenIngesta:
+    registros: int = 0 # Registros leidos del archivo
+    nuevos: int = 0
+    actualizados: int = 0
+    sin_cambios: int = 0 # Saltados en la re-ingesta incremental
+    rechazados: int = 0 # Registros sin paciente_id
+    filas: int = 0 # Filas escritas en la BD (todas las tablas)
+    segundos: float = 0.0
+
+    @property
+    def filas_por_segundo(self) -> float:
+        return round(self.filas / self.segundos, 1) if self.segundos else 0.0
+
+    def as_dict(self) -> Dict:
+        return {**self.__dict__, "segundos": round(self.segundos, 3), "filas_por_segundo": self.filas_por_segundo}
+
+
+def leer_registros(ruta: str, tamano_bloque: int = 1 << 16) -> Iterator[Dict]:
+    """
+    Lee un arreglo JSON (`[{...}, {...}]`) o un NDJSON (un objeto por linea)
+    objeto por objeto, sin cargar el archivo completo en memoria.
+    """
+    with open(ruta, "r", encoding="utf-8") as archivo:
+        inicio = archivo.read(1)
+        while inicio and inicio.isspace():
+            inicio = archivo.read(1)
+
+        if inicio == "{":
+            # NDJSON
+            for linea in chain([inicio + archivo.readline()], archivo):
+                if linea.strip():
+                    yield json.loads(linea)
+            return
+
+        if inicio != "[":
+            raise ValueError(f"{ruta}: se esperaba un arreglo JSON o NDJSON")
+
+        decoder = json.JSONDecoder()
+        buffer = ""
+        while True:
+            bloque = archivo.read(tamano_bloque)
+            buffer += bloque
+            pos = 0
+            while True:
+                while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] == ","):
+                    pos += 1
+                if pos >= len(buffer) or buffer[pos] == "]":
+                    break
+                try:
+                    objeto, pos_fin = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    # Objeto cortado al final del bloque: leemos mas
+                    if not bloque:
+                        raise
+                    break
+                yield objeto
+                pos = pos_fin
+            buffer = buffer[pos:]
+            if not bloque:
+                return
+
+
+def _en_lotes(registros: Iterable[Dict], tamano: int) -> Iterator[List[Dict]]:
+    iterador = iter(registros)
+    while lote := list(islice(iterador, tamano)):
+        yield lote
+
+
+def _insert(conexion: Connection, tabla):
+    # ON CONFLICT existe en SQLite y PostgreSQL, cada uno con su propio `insert`
+    dialecto = postgresql if conexion.dialect.name == "postgresql" else sqlite
+    return dialecto.insert(tabla)
+
+
+def huella_paciente(registro: Dict) -> str:
+    """Hash del registro normalizado: no cambia si solo cambia el orden de los resultados."""
+    contenido = json.dumps(
+        [
+            [registro.get(campo) for campo in CAMPOS_PACIENTE],
+            sorted((r.get("nombre_prueba"), r.get("valor")) for r in registro.get("resultados", [])),
+        ],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+
+def _ingestar_lote_pacientes(conexion: Connection, lote: List[Dict], incremental: bool, resumen: ResumenIngesta):
+    # Si un paciente se repite dentro del lote, gana el ultimo
+    registros = {}
+    for registro in lote:
+        if not registro.get("paciente_id"):
+            resumen.rechazados += 1
+            continue
+        registros[registro["paciente_id"]] = registro
+
+    existentes = dict(conexion.execute(
+        select(Paciente.paciente_id, Paciente.huella_datos).where(Paciente.paciente_id.in_(list(registros)))
+    ).all())
+
+    ahora = time.time()
+    filas_pacientes = []
+    for paciente_id, registro in registros.items():
+        huella = huella_paciente(registro)
+        if incremental and existentes.get(paciente_id) == huella:
+            resumen.sin_cambios += 1
+            continue
+        if paciente_id in existentes:
+            resumen.actualizados += 1
+        else:
+            resumen.nuevos += 1
+        filas_pacientes.append({
+            "paciente_id": paciente_id,
+            **{campo: registro.get(campo) for campo in CAMPOS_PACIENTE},
+            "tipo_examen": registro.get("tipo_examen") or TIPO_EXAMEN_POR_DEFECTO,
+            "huella_datos": huella,
+            "actualizado_en": ahora,
+        })
+    if not filas_pacientes:
+        return
+
+    insert_pacientes = _insert(conexion, Paciente)
+    excluido = insert_pacientes.excluded
+    insert_pacientes = insert_pacientes.on_conflict_do_update(
+        index_elements=[Paciente.paciente_id],
+        set_={
+            **{campo: excluido[campo] for campo in (*CAMPOS_PACIENTE, "huella_datos")},
+            # Una re-ingesta completa (no incremental) no cambia la fecha de los registros iguales
+            "actualizado_en": case(
+                (Paciente.huella_datos == excluido.huella_datos, Paciente.actualizado_en), else_=excluido.actualizado_en,
+            ),
+        },
+    ).returning(Paciente.id, Paciente.paciente_id)
+    ids = {paciente_id: id_ for id_, paciente_id in conexion.execute(insert_pacientes, filas_pacientes)}
+
+    filas_resultados = []
+    for fila in filas_pacientes:
+        valores = {
+            r["nombre_prueba"]: r.get("valor")
+            for r in registros[fila["paciente_id"]].get("resultados", []) if r.get("nombre_prueba")
+        }
+        # El valor se interpreta aqui, una sola vez: los evaluadores leen las columnas `valor_*`
+        filas_resultados.extend(
+            {"paciente_id": ids[fila["paciente_id"]], "nombre_prueba": nombre, "valor": valor, **columnas_valor(valor)}
+            for nombre, valor in valores.items()
+        )
+
+    if filas_resultados:
+        insert_resultados = _insert(conexion, Resultado)
+        conexion.execute(
+            insert_resultados.on_conflict_do_update(
+                index_elements=[Resultado.paciente_id, Resultado.nombre_prueba],
+                set_={columna: insert_resultados.excluded[columna] for columna in ("valor", *columnas_valor(None))},
+            ),
+            filas_resultados,
+        )
+
+    # Pruebas que ya no vienen en el registro actualizado
+    actualizados = {ids[f["paciente_id"]] for f in filas_pacientes if f["paciente_id"] in existentes}
+    if actualizados:
+        vigentes = [(f["paciente_id"], f["nombre_prueba"]) for f in filas_resultados if f["paciente_id"] in actualizados]
+        borrado = delete(Resultado).where(Resultado.paciente_id.in_(list(actualizados)))
+        if vigentes:
+            borrado = borrado.where(tuple_(Resultado.paciente_id, Resultado.nombre_prueba).not_in(vigentes))
+        conexion.execute(borrado)
+
+    resumen.filas += len(filas_pacientes) + len(filas_resultados)
+
+
+def ingestar_pacientes(engine: Engine, ruta: str, tamano_lote: int = TAMANO_LOTE, incremental: bool = True) -> ResumenIngesta:
+    """
+    Carga pacientes y resultados desde JSON o NDJSON con upserts por lotes,
+    una transaccion por lote. En modo incremental los pacientes cuyo registro
+    no cambio (misma huella) no se vuelven a escribir.
+    """
+    resumen = ResumenIngesta()
+    inicio = time.perf_counter()
+    for lote in _en_lotes(leer_registros(ruta), tamano_lote):
+        with engine.begin() as conexion:
+            _ingestar_lote_pacientes(conexion, lote, incremental, resumen)
+        resumen.registros += len(lote)
+        resumen.segundos = time.perf_counter() - inicio
+        logger.info(
+            "%d pacientes leidos (%d nuevos, %d actualizados, %d sin cambios), %.0f filas/s",
+            resumen.registros, resumen.nuevos, resumen.actualizados, resumen.sin_cambios, resumen.filas_por_segundo,
+        )
+    resumen.segundos = time.perf_counter() - inicio
+    return resumen
+
+
+def recorrer_criterios(datos: Dict) -> Iterator[Dict]:
+    """
+    Aplana `empresa -> perfil -> tipo de examen -> grupo -> prueba` en filas de
+    `criterios`. Recorre todos los tipos de examen y grupos, no solo INGRESO/General;
+    las claves que no son pruebas (p. ej. `tipo_area`) se ignoran.
+    """
+    for empresa, perfiles in datos.items():
+        for perfil, tipos_examen in perfiles.items():
+            for tipo_examen, grupos in tipos_examen.items():
+                for grupo, pruebas in grupos.items():
+                    if not isinstance(pruebas, dict):
+                        continue
+                    for nombre_prueba, detalles in pruebas.items():
+                        if isinstance(detalles, dict) and "rangos" in detalles:
+                            rangos = detalles["rangos"]
+                            yield {
+                                "empresa": empresa,
+                                "perfil": perfil,
+                                "tipo_examen": tipo_examen,
+                                "nombre_prueba": nombre_prueba,
+                                "apto": rangos.get("apto", ""),
+                                "observado": rangos.get("observado", ""),
+                                "no_apto": rangos.get("no_apto", ""),
+                            }
+
+
+def ingestar_criterios(engine: Engine, ruta: str, tamano_lote: int = TAMANO_LOTE) -> ResumenIngesta:
+    """
+    Carga los criterios con upserts por (empresa, perfil, tipo de examen, prueba).
+    El archivo de criterios es pequeño y anidado, asi que se lee completo.
+    """
+    with open(ruta, "r", encoding="utf-8") as f:
+        datos = json.load(f)
+
+    resumen = ResumenIngesta()
+    inicio = time.perf_counter()
+    for lote in _en_lotes(recorrer_criterios(datos), tamano_lote):
+        with engine.begin() as conexion:
+            insert_criterios = _insert(conexion, Criterio)
+            excluido = insert_criterios.excluded
+            # Solo reescribimos las filas cuyas reglas cambiaron
+            insert_criterios = insert_criterios.on_conflict_do_update(
+                index_elements=[Criterio.empresa, Criterio.perfil, Criterio.tipo_examen, Criterio.nombre_prueba],
+                set_={"apto": excluido.apto, "observado": excluido.observado, "no_apto": excluido.no_apto},
+                where=(Criterio.apto != excluido.apto) | (Criterio.observado != excluido.observado)
+                | (Criterio.no_apto != excluido.no_apto),
+            )
+            escritas = conexion.execute(insert_criterios, lote).rowcount
+        resumen.registros += len(lote)
+        resumen.filas += max(escritas, 0)
+    resumen.sin_cambios = resumen.registros - resumen.filas
+    resumen.segundos = time.perf_counter() - inicio
+    return resumen
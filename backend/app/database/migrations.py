@@ -0,0 +1,134 @@
+import time
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, bindparam, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from .models import TIPO_EXAMEN_POR_DEFECTO, Base
+from .valores import columnas_valor
+
+# Filas por UPDATE al rellenar columnas nuevas de tablas grandes
+TAMANO_LOTE_MIGRACION = 5000
+
+# Registro de las migraciones aplicadas a esta base
+migraciones = Table(
+    "migraciones", MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("nombre", String, nullable=False),
+    Column("aplicada_en", Float, nullable=False),
+)
+
+
+def _columnas(conexion: Connection, tabla: str) -> set:
+    return {c["name"] for c in inspect(conexion).get_columns(tabla)}
+
+
+def _agregar_columna(conexion: Connection, tabla: str, columna: str, definicion: str):
+    if columna not in _columnas(conexion, tabla):
+        conexion.execute(text(f"ALTER TABLE {tabla} ADD COLUMN {columna} {definicion}"))
+
+
+def _crear_indices(conexion: Connection, tabla: str):
+    # Los indices declarados en el modelo que todavia no existen en la base
+    # (los de columnas que agrega una migracion posterior se crean en esa migracion)
+    columnas = _columnas(conexion, tabla)
+    for indice in Base.metadata.tables[tabla].indexes:
+        if {c.name for c in indice.columns} <= columnas:
+            indice.create(conexion, checkfirst=True)
+
+
+def _quitar_duplicados(conexion: Connection, tabla: str, columnas: str):
+    # Antes de crear un indice unico: nos quedamos con la fila mas reciente de cada clave
+    conexion.execute(text(
+        f"DELETE FROM {tabla} WHERE id NOT IN (SELECT MAX(id) FROM {tabla} GROUP BY {columnas})"
+    ))
+
+
+def _criterios_por_tipo_examen(conexion: Connection):
+    _agregar_columna(conexion, "criterios", "tipo_examen", f"VARCHAR NOT NULL DEFAULT '{TIPO_EXAMEN_POR_DEFECTO}'")
+
+
+def _huella_de_pacientes(conexion: Connection):
+    _agregar_columna(conexion, "pacientes", "huella_datos", "VARCHAR")
+
+
+def _indices_compuestos(conexion: Connection):
+    _quitar_duplicados(conexion, "criterios", "empresa, perfil, tipo_examen, nombre_prueba")
+    _quitar_duplicados(conexion, "resultados", "paciente_id, nombre_prueba")
+    _crear_indices(conexion, "criterios")
+    _crear_indices(conexion, "resultados")
+
+
+def _tablas_de_evaluaciones(conexion: Connection):
+    for tabla in ("evaluaciones", "evaluaciones_pruebas"):
+        Base.metadata.tables[tabla].create(conexion, checkfirst=True)
+        _crear_indices(conexion, tabla)
+
+
+def _valores_normalizados(conexion: Connection):
+    for columna, definicion in (
+        ("valor_numero", "FLOAT"), ("valor_componentes", "VARCHAR"), ("valor_unidad", "VARCHAR"), ("valor_token", "VARCHAR"),
+    ):
+        _agregar_columna(conexion, "resultados", columna, definicion)
+    _crear_indices(conexion, "resultados")
+
+    # Interpretamos los valores ya cargados, por lotes de id para acotar la memoria
+    resultados = Base.metadata.tables["resultados"]
+    actualizar = resultados.update().where(resultados.c.id == bindparam("_id")).values(
+        {columna: bindparam(columna) for columna in columnas_valor(None)}
+    )
+    ultimo = 0
+    while True:
+        filas = conexion.execute(
+            select(resultados.c.id, resultados.c.valor)
+            .where(resultados.c.id > ultimo, resultados.c.valor.is_not(None), resultados.c.valor_token.is_(None))
+            .order_by(resultados.c.id)
+            .limit(TAMANO_LOTE_MIGRACION)
+        ).all()
+        if not filas:
+            break
+        conexion.execute(actualizar, [{"_id": id_, **columnas_valor(valor)} for id_, valor in filas])
+        ultimo = filas[-1].id
+
+
+def _catalogo_de_pacientes(conexion: Connection):
+    _agregar_columna(conexion, "pacientes", "actualizado_en", "FLOAT")
+    pacientes = Base.metadata.tables["pacientes"]
+    conexion.execute(pacientes.update().where(pacientes.c.actualizado_en.is_(None)).values(actualizado_en=time.time()))
+    # El filtro por tipo de examen es una igualdad sobre el indice: sin NULL
+    conexion.execute(
+        pacientes.update().where(pacientes.c.tipo_examen.is_(None)).values(tipo_examen=TIPO_EXAMEN_POR_DEFECTO)
+    )
+    _crear_indices(conexion, "pacientes")
+
+
+# Migraciones en orden. Cada una es idempotente: en una base nueva (creada con
+# `create_all`) no cambia nada y solo queda registrada.
+MIGRACIONES: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "criterios.tipo_examen", _criterios_por_tipo_examen),
+    (2, "pacientes.huella_datos", _huella_de_pacientes),
+    (3, "indices compuestos de criterios y resultados", _indices_compuestos),
+    (4, "evaluaciones y evaluaciones_pruebas", _tablas_de_evaluaciones),
+    (5, "resultados.valor_* (valores normalizados)", _valores_normalizados),
+    (6, "pacientes.actualizado_en e indices del catalogo", _catalogo_de_pacientes),
+]
+
+
+def migrar(engine: Engine) -> List[str]:
+    """
+    Aplica las migraciones pendientes, cada una en su propia transaccion.
+    Devuelve los nombres de las que se aplicaron.
+    """
+    with engine.begin() as conexion:
+        migraciones.create(conexion, checkfirst=True)
+        aplicadas = set(conexion.execute(select(migraciones.c.version)).scalars())
+
+    nuevas = []
+    for version, nombre, migracion in MIGRACIONES:
+        if version in aplicadas:
+            continue
+        with engine.begin() as conexion:
+            migracion(conexion)
+            conexion.execute(migraciones.insert().values(version=version, nombre=nombre, aplicada_en=time.time()))
+        nuevas.append(nombre)
+    return nuevas
@@ -1,11 +1,20 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Boolean, Column, Float, Index, Integer, String, Text, ForeignKey
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
 
+# Tipo de examen de los pacientes y criterios que no lo indican
+TIPO_EXAMEN_POR_DEFECTO = "INGRESO"
+
 class Paciente(Base):
     __tablename__ = "pacientes"
+    # Catalogo paginado por paciente_id dentro de una empresa o de un perfil (paginacion
+    # por clave, sin OFFSET). El tipo de examen queda como filtro sobre el recorrido
+    __table_args__ = (
+        Index("ix_paciente_catalogo", "empresa", "perfil", "paciente_id"),
+        Index("ix_paciente_empresa", "empresa", "paciente_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     paciente_id = Column(String, unique=True, index=True) # <-- "P00x"
@@ -14,30 +23,87 @@ class Paciente(Base):
     puesto_ocupacional = Column(String)
     sexo = Column(String)
     tipo_examen = Column(String)
+    huella_datos = Column(String) # Hash del registro de origen: si no cambia, la re-ingesta lo salta
+    actualizado_en = Column(Float) # Cuando cambio el registro por ultima vez (Last-Modified del catalogo)
 
     # Un paciente tiene mucho resultados
     resultados = relationship("Resultado", back_populates="paciente")
 
 class Resultado(Base):
     __tablename__ = 'resultados'
+    # Un valor por prueba y paciente: indice para buscar el resultado de una prueba
+    # y clave del upsert en la ingesta. Los otros dos sirven a las busquedas por
+    # rango (IMC entre 25 y 30) y por valor de texto, sin parsear en Python
+    __table_args__ = (
+        Index("uq_resultado_paciente_prueba", "paciente_id", "nombre_prueba", unique=True),
+        Index("ix_resultado_prueba_numero", "nombre_prueba", "valor_numero"),
+        Index("ix_resultado_prueba_token", "nombre_prueba", "valor_token"),
+    )
 
     id = Column(Integer, primary_key=True, index = True)
     nombre_prueba = Column(String)
-    valor = Column(String)
+    valor = Column(String) # Texto original del resultado
     paciente_id = Column(Integer, ForeignKey('pacientes.id'))
 
+    # El valor ya interpretado en la ingesta (ver `valores.normalizar`)
+    valor_numero = Column(Float) # '24.5 kg/m²' -> 24.5 (None si es texto o compuesto)
+    valor_componentes = Column(String) # JSON de los componentes: '120/80 mmHg' -> [120.0, 80.0]
+    valor_unidad = Column(String) # 'kg/m2', 'mg/dl', 'mmhg'...
+    valor_token = Column(String) # Texto canonico del valor (clave del cache de veredictos)
+
     # Relacion inversa: Un resultado pertenece a un paciente
     paciente = relationship("Paciente", back_populates="resultados")
 
 class Criterio(Base):
     __tablename__ = 'criterios'
+    # Indice compuesto de la busqueda de criterios (empresa, perfil, tipo de examen, prueba)
+    __table_args__ = (Index("uq_criterio", "empresa", "perfil", "tipo_examen", "nombre_prueba", unique=True),)
 
     id = Column(Integer, primary_key=True, index=True)
     empresa = Column(String, index=True)
     perfil = Column(String, index=True)
+    tipo_examen = Column(String, index=True, default=TIPO_EXAMEN_POR_DEFECTO, server_default=TIPO_EXAMEN_POR_DEFECTO) # INGRESO, PERIODICO, RETIRO...
     nombre_prueba=Column(String, index=True)
 
     # Guardamos las reglas como texto (el agente sabra como interpretarlos)
     apto = Column(String)
     observado = Column(String)
-    no_apto = Column(String)
\ No newline at end of file
+    no_apto = Column(String)
+
+class Evaluacion(Base):
+    __tablename__ = "evaluaciones"
+    # La ultima evaluacion de un paciente es el primer registro de este indice (sin ordenar la tabla)
+    __table_args__ = (Index("ix_evaluacion_paciente", "paciente_id", "id"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    paciente_id = Column(String, nullable=False) # <-- "P00x", como en la API
+    veredicto_general = Column(String)
+    version_datos = Column(String) # PatientContext.huella(): resultados y reglas con que se evaluo
+    modo = Column(String) # "react" o "structured"
+    pruebas_evaluadas = Column(Integer) # Pruebas que se evaluaron en esta ejecucion
+    pruebas_reutilizadas = Column(Integer) # Pruebas copiadas de la evaluacion anterior (mismos datos)
+    latencia_ms = Column(Float)
+    tokens_entrada = Column(Float)
+    tokens_salida = Column(Float)
+    creado_en = Column(Float)
+
+    pruebas = relationship("EvaluacionPrueba", back_populates="evaluacion")
+
+class EvaluacionPrueba(Base):
+    __tablename__ = "evaluaciones_pruebas"
+
+    id = Column(Integer, primary_key=True, index=True)
+    evaluacion_id = Column(Integer, ForeignKey("evaluaciones.id"), index=True)
+    nombre_prueba = Column(String)
+    criterio_id = Column(Integer)
+    version_criterio = Column(String) # hash_criterio: cambia si se edita alguna regla
+    hash_valor = Column(String) # Hash del valor normalizado (None si no habia resultado)
+    veredicto = Column(String)
+    razonamiento = Column(Text) # Traza del agente (pensamiento, accion, observacion) o motivo de la regla
+    origen = Column(String) # rule, agent, cache o missing: como se obtuvo la primera vez
+    reutilizada = Column(Boolean, default=False) # Copiada de la evaluacion anterior (mismos datos)
+    latencia_ms = Column(Float)
+    tokens_entrada = Column(Float)
+    tokens_salida = Column(Float)
+
+    evaluacion = relationship("Evaluacion", back_populates="pruebas")
@@ -0,0 +1,112 @@
+import json
+import re
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, Optional, Tuple
+
+# Unidades que pueden acompañar a un numero sin cambiar su significado
+UNIDADES = {
+    "anos", "ano", "kg/m2", "kg/m", "kg", "mg/dl", "g/dl", "mmhg", "cm", "m",
+    "lpm", "bpm", "%", "mg", "ml", "u/l", "ui/l", "mm3", "x", "mm",
+}
+# Formas distintas de escribir la misma unidad
+SINONIMOS_UNIDAD = {"ano": "anos", "bpm": "lpm", "kg/m": "kg/m2", "ui/l": "u/l"}
+
+_NUMERO = r"[-+]?\d+(?:[.,]\d+)?"
+_PATRON_VALOR = re.compile(rf"^({_NUMERO})(?:\s+(.*))?$")
+# Valores de varios componentes, como la presion arterial '120/80 mmHg'
+_PATRON_COMPUESTO = re.compile(rf"^({_NUMERO}(?:\s*/\s*{_NUMERO})+)(?:\s+(.*))?$")
+
+
+def normalizar_texto(texto: str) -> str:
+    """Sin tildes, en minusculas y con '²'/'³' como digitos: 'Kg/m²' -> 'kg/m2'."""
+    texto = unicodedata.normalize("NFKD", texto)
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return texto.replace("²", "2").replace("³", "3").lower().strip()
+
+
+def normalizar_valor(valor) -> str:
+    """'  24,5  Kg/m² ' y '24.5 kg/m2' deben dar la misma clave."""
+    texto = unicodedata.normalize("NFKD", str(valor))
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.lower().replace(",", ".").split())
+
+
+def unidades_de(texto: Optional[str]) -> FrozenSet[str]:
+    """Las unidades conocidas de un texto ya normalizado, con sus sinonimos unificados."""
+    if not texto:
+        return frozenset()
+    return frozenset(SINONIMOS_UNIDAD.get(t, t) for t in texto.replace(":", " ").split() if t in UNIDADES)
+
+
+def _numero(texto: str) -> float:
+    return float(texto.replace(",", "."))
+
+
+def _unidad(resto: Optional[str]) -> Tuple[bool, Optional[str]]:
+    # Lo que sigue al numero solo puede ser una unidad conocida
+    if not resto:
+        return True, None
+    tokens = resto.split()
+    return all(token in UNIDADES for token in tokens), " ".join(tokens)
+
+
+@dataclass(frozen=True)
+class ValorNormalizado:
+    """
+    Un resultado ya interpretado: se calcula una vez en la ingesta y se guarda
+    en las columnas `valor_*` de `resultados`.
+    """
+    numero: Optional[float] # '24.5 kg/m²' -> 24.5; None si es texto o compuesto
+    componentes: Optional[Tuple[float, ...]] # '120/80 mmHg' -> (120.0, 80.0)
+    unidad: Optional[str] # 'kg/m2', 'mmhg'... (None si no trae o no es numerico)
+    token: str # Texto canonico: clave del cache de veredictos y de las evaluaciones agrupadas
+
+    def columnas(self) -> Dict:
+        return {
+            "valor_numero": self.numero,
+            "valor_componentes": json.dumps(self.componentes) if self.componentes else None,
+            "valor_unidad": self.unidad,
+            "valor_token": self.token,
+        }
+
+
+@lru_cache(maxsize=8192)
+def normalizar(valor: str) -> ValorNormalizado:
+    """
+    Interpreta un resultado de texto libre. Un numero seguido de algo que no
+    es una unidad ('5 cruces') queda como texto: solo tiene token.
+    """
+    token = normalizar_valor(valor)
+    texto = normalizar_texto(str(valor))
+
+    coincidencia = _PATRON_VALOR.match(texto)
+    if coincidencia:
+        valida, unidad = _unidad(coincidencia.group(2))
+        if valida:
+            return ValorNormalizado(_numero(coincidencia.group(1)), None, unidad, token)
+
+    coincidencia = _PATRON_COMPUESTO.match(texto)
+    if coincidencia:
+        valida, unidad = _unidad(coincidencia.group(2))
+        if valida:
+            componentes = tuple(_numero(parte) for parte in coincidencia.group(1).split("/"))
+            return ValorNormalizado(None, componentes, unidad, token)
+
+    return ValorNormalizado(None, None, None, token)
+
+
+def columnas_valor(valor: Optional[str]) -> Dict:
+    """Columnas `valor_*` de una fila de `resultados` (todas None si no hay valor)."""
+    if valor is None:
+        return {"valor_numero": None, "valor_componentes": None, "valor_unidad": None, "valor_token": None}
+    return normalizar(valor).columnas()
+
+
+def parsear_valor(valor: str) -> Optional[float]:
+    """
+    Extrae el numero de un resultado como '24.5 kg/m²' o '35 años'.
+    Devuelve None si el valor es texto o trae algo mas que una unidad.
+    """
+    return normalizar(str(valor)).numero
@@ -1,64 +1,529 @@
+from dotenv import load_dotenv
+
+# Cada modulo lee su configuracion del entorno al importarse: el .env se carga
+# una sola vez, aqui, antes de importar el resto de la aplicacion
+load_dotenv()
+
 import os
 import json
-from fastapi import FastAPI, HTTPException, Depends
-from pydantic import BaseModel
-from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from backend.app.agents.specialist import crear_agente_evaluador
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
 
-from sqlalchemy.orm import Session
-from .database import database, models
-from typing import List, Dict
-from backend.app.agents.orchestrator import build_graph
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import database
+from typing import List, Dict, Optional, Union
+from backend.app.agents.orchestrator import build_graph, format_test_results, precargar_evaluadores, MAX_CONCURRENCY
+from backend.app.agents.cache import verdict_cache
+from backend.app.agents.checkpoints import COMPLETADA, EJECUCION_PLAZO_SEGUNDOS, EN_PROCESO, EjecucionEnCurso, Ejecuciones, ejecuciones
+from backend.app.agents.clasificador import clasificador
+from backend.app.agents.batch import MAX_CONCURRENCIA_LOTE, cargar_lote, ejecutar_lote
+from backend.app.agents.criteria_index import criteria_index
+from backend.app.agents.catalogo import TAMANO_PAGINA, listar_pacientes
+from backend.app.agents.context import load_patient_context
+from backend.app.agents.jobs import JobQueue
+from backend.app.agents.history import formatear_pruebas, historial, resumen_evaluacion, ultima_evaluacion
+from backend.app.observability import HTTP_SECONDS, configurar_logging, metrics_response, span
 
-def get_db(): # Dependencia de FastAPI (se ejecuta por cada peticion)
-     db = database.SessionLocal()
-     try:
+async def get_db(): # Dependencia de FastAPI (se ejecuta por cada peticion)
+     async with database.AsyncSessionLocal() as db:
           yield db
+
+logger = logging.getLogger(__name__)
+
+# Workers que atienden la cola de evaluaciones en segundo plano
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+     # Nivel de log segun LOG_LEVEL (DEBUG muestra cada nodo y cada paso del agente)
+     configurar_logging()
+
+     # El grafo no depende de la peticion: lo compilamos una sola vez al arrancar, con el
+     # checkpointer de las ejecuciones para reanudar las que fallan
+     await ejecuciones.abrir()
+     # Si algo falla al arrancar (o la app termina con error) la conexion de los checkpoints
+     # se cierra igual: su hilo de aiosqlite no deja terminar al proceso
+     try:
+          app.state.graph = build_graph(checkpointer=ejecuciones.checkpointer)
+
+          # El gateway del LLM y los evaluadores (compartidos por todas las evaluaciones) se
+          # crean en segundo plano: la API queda lista sin esperar sus imports
+          precarga = asyncio.create_task(precargar())
+
+          # Indice de criterios en memoria, con recarga cuando cambia la tabla
+          async with database.AsyncSessionLocal() as db:
+               await criteria_index.reload(db)
+          vigilante = asyncio.create_task(criteria_index.watch(database.AsyncSessionLocal))
+
+          # Cola persistente de evaluaciones en segundo plano
+          app.state.jobs = JobQueue.from_env()
+          app.state.jobs.start(app.state.graph, database.AsyncSessionLocal, JOB_WORKERS)
+
+          try:
+               yield
+          finally:
+               await app.state.jobs.stop()
+               vigilante.cancel()
+               precarga.cancel()
      finally:
-          db.close()
+          await ejecuciones.cerrar()
 
-load_dotenv()
+async def precargar():
+     try:
+          await asyncio.to_thread(precargar_evaluadores)
+     except Exception as error:
+          # Se reintenta en la primera evaluacion que los necesite
+          logger.warning("No se pudieron precargar los evaluadores: %s", error)
 
-llm = ChatOpenAI(model="gpt-4o", temperature=0)
-agente_executor = crear_agente_evaluador(llm)
+def get_graph(request: Request):
+     return request.app.state.graph
+
+def get_jobs(request: Request) -> JobQueue:
+     return request.app.state.jobs
+
+def get_ejecuciones() -> Ejecuciones:
+     if not ejecuciones.activo:
+          raise HTTPException(status_code=404, detail="Los checkpoints estan desactivados (USAR_CHECKPOINTS=0)")
+     return ejecuciones
 
 app = FastAPI(
       title="API de Agente Evaluador",
-      description="Una API para evaluar la aptitud de un paciente."
+      description="Una API para evaluar la aptitud de un paciente.",
+      lifespan=lifespan
 )
 
+@app.middleware("http")
+async def medir_peticion(request: Request, call_next):
+      # Un span por peticion: los spans de los nodos y de las llamadas al LLM cuelgan de este
+      inicio = time.perf_counter()
+      with span(f"HTTP {request.method}") as peticion:
+            response = await call_next(request)
+            # La plantilla de la ruta (no la URL) para no crear una serie por paciente
+            ruta = getattr(request.scope.get("route"), "path", "desconocida")
+            peticion.update_name(f"HTTP {request.method} {ruta}")
+            peticion.set_attribute("http.status_code", response.status_code)
+      # En las respuestas en streaming esto mide hasta el primer byte
+      HTTP_SECONDS.labels(request.method, ruta, str(response.status_code)).observe(time.perf_counter() - inicio)
+      return response
+
 class ResultadoIndividual(BaseModel):
      prueba: str
      resultado: str
      razonamiento: str
+     origen: str # "rule" (motor de reglas), "agent" (agente), "cache" (veredicto reutilizado), "classifier" (clasificador local), "missing" (sin resultado), "stored" (de la evaluacion anterior), "fallback" (sin LLM) o "error" (fallo, se reintenta al reanudar)
+     metricas: Optional[Dict[str, Union[float, str]]] = None # Latencia, tokens y costo si se llamo al LLM
 
 class PerfilEvaluacionResponse(BaseModel):
+     paciente_id: str
+     veredicto_general: str # "Pendiente" si fallo alguna prueba y ninguna es No Apto
+     evaluaciones: List[ResultadoIndividual]
+     ejecucion: Optional[str] = None # Para reanudar la ejecucion si quedaron pruebas fallidas
+
+class EjecucionResponse(BaseModel):
+     ejecucion: str
+     paciente_id: str
+     estado: str # en_proceso, parcial (con pruebas fallidas), interrumpida o completada
+     pruebas_fallidas: List[str]
+     error: Optional[str] = None
+     intentos: int
+     creado_en: float
+     actualizado_en: float
+
+class EjecucionDetalleResponse(EjecucionResponse):
+     pruebas: List[str]
+     evaluaciones: List[ResultadoIndividual] # Las pruebas que ya tienen resultado
+     siguientes_pasos: List[str] # Nodos del grafo que faltan si se corto a mitad de camino
+     veredicto_general: Optional[str] = None
+
+class EvaluacionResumen(BaseModel):
+     id: int
      paciente_id: str
      veredicto_general: str
+     version_datos: Optional[str] = None
+     modo: Optional[str] = None
+     pruebas_evaluadas: int
+     pruebas_reutilizadas: int
+     latencia_ms: Optional[float] = None
+     tokens_entrada: Optional[float] = None
+     tokens_salida: Optional[float] = None
+     creado_en: float
+
+class EvaluacionGuardadaResponse(EvaluacionResumen):
      evaluaciones: List[ResultadoIndividual]
 
+class TrabajoResponse(BaseModel):
+     id: str
+     paciente_id: str
+     estado: str # pendiente, en_proceso, completado, parcial (con pruebas pendientes) o error
+     intentos: int
+     duplicado: bool = False
+     resultado: Optional[PerfilEvaluacionResponse] = None
+     error: Optional[str] = None
+
+class LoteEvaluacionRequest(BaseModel):
+     empresa: Optional[str] = None
+     perfil: Optional[str] = None
+     paciente_ids: Optional[List[str]] = None
+     max_concurrencia: int = Field(MAX_CONCURRENCY, ge=1, le=MAX_CONCURRENCIA_LOTE)
+
+class CambioCriterio(BaseModel):
+     empresa: str
+     perfil: str
+     nombre_prueba: str
+     tipo_examen: Optional[str] = None # Por defecto INGRESO
+     apto: Optional[str] = None # Las reglas que no se indican se mantienen
+     observado: Optional[str] = None
+     no_apto: Optional[str] = None
+     eliminar: bool = False
+
+class PacienteResumen(BaseModel):
+     paciente_id: str
+     empresa: Optional[str] = None
+     perfil: Optional[str] = None
+     tipo_examen: Optional[str] = None
+     puesto_ocupacional: Optional[str] = None
+     sexo: Optional[str] = None
+
+class PaginaPacientesResponse(BaseModel):
+     pacientes: List[PacienteResumen]
+     siguiente: Optional[str] = None # Pasar como `despues` para pedir la pagina siguiente
+     limite: int
+
+class SimulacionRequest(BaseModel):
+     cambios: List[CambioCriterio]
+     limite: int = 100 # Pacientes con detalle por prueba en la respuesta
+     usar_cache: bool = True
+
+def respuesta_condicional(request: Request, response: Response, etag: str, ultima_modificacion: Optional[float]) -> Optional[Response]:
+     """
+     Pone ETag y Last-Modified en la respuesta. Si el cliente ya tiene esta
+     version (If-None-Match, o If-Modified-Since si no manda ETag) devuelve el 304.
+     """
+     cabeceras = {"ETag": f'"{etag}"', "Cache-Control": "private, no-cache"}
+     if ultima_modificacion is not None:
+          cabeceras["Last-Modified"] = formatdate(ultima_modificacion, usegmt=True)
+     response.headers.update(cabeceras)
+
+     if_none_match = request.headers.get("if-none-match")
+     if_modified_since = request.headers.get("if-modified-since")
+     if if_none_match is not None:
+          etags = {e.strip().removeprefix("W/") for e in if_none_match.split(",")}
+          vigente = "*" in etags or cabeceras["ETag"] in etags
+     elif if_modified_since is not None and ultima_modificacion is not None:
+          try:
+               # Last-Modified tiene resolucion de segundos
+               vigente = int(ultima_modificacion) <= parsedate_to_datetime(if_modified_since).timestamp()
+          except (TypeError, ValueError):
+               vigente = False
+     else:
+          vigente = False
+     return Response(status_code=304, headers=cabeceras) if vigente else None
+
+@app.get("/pacientes", response_model=PaginaPacientesResponse)
+async def catalogo_pacientes(
+     request: Request,
+     response: Response,
+     empresa: Optional[str] = None,
+     perfil: Optional[str] = None,
+     tipo_examen: Optional[str] = None,
+     buscar: Optional[str] = None,
+     despues: Optional[str] = None,
+     limite: int = TAMANO_PAGINA,
+     db: AsyncSession = Depends(get_db)
+     ):
+      """
+      Catalogo de pacientes filtrado por empresa, perfil y tipo de examen, o
+      buscado por prefijo del ID. Paginado por clave: la respuesta trae
+      `siguiente`, que se pasa como `despues` para la pagina que sigue. Con
+      If-None-Match / If-Modified-Since responde 304 si la pagina no cambio.
+      """
+      pagina = await listar_pacientes(db, empresa, perfil, tipo_examen, buscar, despues, limite)
+      no_modificada = respuesta_condicional(request, response, pagina.etag, pagina.ultima_modificacion)
+      if no_modificada is not None:
+           return no_modificada
+      return PaginaPacientesResponse(pacientes=pagina.pacientes, siguiente=pagina.siguiente, limite=pagina.limite)
+
+@app.get("/pacientes/filtros")
+async def filtros_pacientes():
+      """
+      Empresas, perfiles y tipos de examen con criterios cargados, para los
+      filtros del catalogo. Sale del indice en memoria, sin consultar la BD.
+      """
+      return [{"empresa": e, "perfil": p, "tipo_examen": t} for e, p, t in criteria_index.perfiles()]
+
 @app.post("/evaluar-perfil/{paciente_id}", response_model=PerfilEvaluacionResponse)
 async def evaluar_paciente(
      paciente_id: str, 
-     db: Session = Depends(get_db)     
+     forzar: bool = False,
+     ejecucion: Optional[str] = None,
+     db: AsyncSession = Depends(get_db),
+     graph = Depends(get_graph)
      ):
       """
-      Invoca al agente orquestador para una evaluación completa del perfil del paciente
+      Invoca al agente orquestador para una evaluación completa del perfil del paciente.
+      Las pruebas que no cambiaron desde la ultima evaluacion se reutilizan
+      (origen "stored"); con `forzar=true` se evaluan todas de nuevo.
+      Si la ultima ejecucion del paciente quedo a medias (o se indica `ejecucion`),
+      se retoma desde su checkpoint sin repetir las pruebas que ya terminaron.
       """
-      graph = build_graph(db)
-
-      initial_input = {"patient_id": paciente_id}
-
-      final_state = graph.invoke(initial_input)
+      # Las pruebas se evaluan en paralelo, con un limite de ramas simultaneas
+      try:
+           ejecucion, final_state = await ejecuciones.ejecutar(
+                graph, paciente_id,
+                {"configurable": {"db": db, "reutilizar": not forzar}, "max_concurrency": MAX_CONCURRENCY},
+                ejecucion, nueva=forzar,
+           )
+      except EjecucionEnCurso as error:
+           raise HTTPException(status_code=409, detail=str(error))
 
       resultados_individuales = [
-           ResultadoIndividual(prueba = test, resultado=res["verdict"], razonamiento=res["reasoning"])
-           for test, res in final_state["test_results"].items()
+           ResultadoIndividual(**resultado) for resultado in format_test_results(final_state["test_results"])
       ]
 
       return PerfilEvaluacionResponse(
            paciente_id=final_state["patient_id"],
            veredicto_general=final_state["final_veredict"],
-           evaluaciones = resultados_individuales
-      )
\ No newline at end of file
+           evaluaciones = resultados_individuales,
+           ejecucion=ejecucion
+      )
+
+def evento_sse(evento: str, datos: Dict) -> str:
+     return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+@app.get("/evaluar-perfil/{paciente_id}/eventos")
+async def evaluar_paciente_eventos(
+     paciente_id: str,
+     graph = Depends(get_graph)
+     ):
+      """
+      Misma evaluacion que /evaluar-perfil, pero como Server-Sent Events:
+      `inicio` con las pruebas a evaluar, un `prueba` por cada prueba apenas
+      termina y `veredicto` con el resultado consolidado (o `error`).
+      """
+      async def generar_eventos():
+           # La sesion vive mientras dure el stream, no solo la funcion del endpoint
+           async with database.AsyncSessionLocal() as db:
+                ejecucion, config, entrada = await ejecuciones.preparar(
+                     graph, paciente_id, {"configurable": {"db": db}, "max_concurrency": MAX_CONCURRENCY}
+                )
+                # Resultados ya enviados: al reanudar, el grafo vuelve a emitir las ramas que habian terminado
+                enviados = {}
+
+                def nuevos(test_results):
+                     for resultado in format_test_results(test_results):
+                          if enviados.get(resultado["prueba"]) != resultado:
+                               enviados[resultado["prueba"]] = resultado
+                               yield resultado
+
+                try:
+                     if entrada is None:
+                          # Se retoma a mitad del grafo: `fetch_tests` no vuelve a correr, asi que
+                          # las pruebas y lo que ya termino salen del checkpoint
+                          guardado = await ejecuciones.estado(graph, paciente_id, ejecucion)
+                          yield evento_sse("inicio", {"paciente_id": paciente_id, "pruebas": guardado["pruebas"], "ejecucion": ejecucion})
+                          for resultado in nuevos(guardado["test_results"]):
+                               yield evento_sse("prueba", resultado)
+                     async for actualizacion in graph.astream(entrada, config=config, stream_mode="updates"):
+                          for nodo, cambios in actualizacion.items():
+                               if nodo == "fetch_tests":
+                                    yield evento_sse("inicio", {"paciente_id": paciente_id, "pruebas": list(cambios["context"].nombres_pruebas), "ejecucion": ejecucion})
+                                    # Las pruebas reutilizadas de la evaluacion anterior ya estan listas
+                                    for resultado in nuevos(cambios["test_results"]):
+                                         yield evento_sse("prueba", resultado)
+                               elif nodo in ("run_agent", "run_batch"):
+                                    for resultado in nuevos(cambios["test_results"]):
+                                         yield evento_sse("prueba", resultado)
+                               elif nodo == "consolidate":
+                                    yield evento_sse("veredicto", {"paciente_id": paciente_id, "veredicto_general": cambios["final_veredict"]})
+                except Exception as error:
+                     await ejecuciones.terminar(paciente_id, ejecucion, error=error)
+                     yield evento_sse("error", {"paciente_id": paciente_id, "detalle": str(error), "ejecucion": ejecucion})
+                     return
+                except BaseException as error:
+                     # El cliente se desconecto (CancelledError/GeneratorExit): no hay a quien avisarle,
+                     # pero la ejecucion queda interrumpida y se puede reanudar enseguida
+                     await ejecuciones.terminar(paciente_id, ejecucion, error=error)
+                     raise
+                if ejecucion is not None:
+                     await ejecuciones.terminar(paciente_id, ejecucion, (await graph.aget_state(config)).values)
+
+      return StreamingResponse(
+           generar_eventos(),
+           media_type="text/event-stream",
+           headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+      )
+
+@app.post("/trabajos/evaluar-perfil/{paciente_id}", response_model=TrabajoResponse, status_code=202)
+async def encolar_evaluacion(
+     paciente_id: str,
+     db: AsyncSession = Depends(get_db),
+     jobs: JobQueue = Depends(get_jobs)
+     ):
+      """
+      Encola la evaluacion y responde de inmediato con el ID del trabajo.
+      Si ya hay un trabajo para el paciente con los mismos datos, devuelve ese.
+      """
+      try:
+           context = await load_patient_context(db, paciente_id, criteria_index)
+      except ValueError as error:
+           raise HTTPException(status_code=404, detail=str(error))
+
+      return await jobs.submit(paciente_id, context.huella())
+
+@app.get("/trabajos/{job_id}", response_model=TrabajoResponse)
+async def consultar_trabajo(job_id: str, jobs: JobQueue = Depends(get_jobs)):
+      """
+      Estado del trabajo y, cuando termina, su resultado o su error
+      """
+      trabajo = await jobs.get(job_id)
+      if trabajo is None:
+           raise HTTPException(status_code=404, detail=f"No existe el trabajo {job_id}")
+      return trabajo
+
+@app.get("/evaluaciones/{paciente_id}", response_model=EvaluacionGuardadaResponse)
+async def ultima_evaluacion_paciente(
+     paciente_id: str,
+     request: Request,
+     response: Response,
+     db: AsyncSession = Depends(get_db)
+     ):
+      """
+      La ultima evaluacion guardada del paciente, con el razonamiento de cada
+      prueba. Es una lectura por indice: no vuelve a correr el grafo. Responde
+      304 si el cliente ya tiene esta evaluacion (ETag = ID de la evaluacion).
+      """
+      evaluacion = await ultima_evaluacion(db, paciente_id)
+      if evaluacion is None:
+           raise HTTPException(status_code=404, detail=f"El paciente {paciente_id} no tiene evaluaciones guardadas")
+      no_modificada = respuesta_condicional(request, response, f"evaluacion-{evaluacion.id}", evaluacion.creado_en)
+      if no_modificada is not None:
+           return no_modificada
+      return {**resumen_evaluacion(evaluacion), "evaluaciones": formatear_pruebas(evaluacion)}
+
+@app.get("/evaluaciones/{paciente_id}/historial", response_model=List[EvaluacionResumen])
+async def historial_paciente(paciente_id: str, limite: int = 20, db: AsyncSession = Depends(get_db)):
+      """
+      Las ultimas evaluaciones del paciente (sin el detalle por prueba), de la mas reciente a la mas antigua
+      """
+      return [resumen_evaluacion(e) for e in await historial(db, paciente_id, max(1, min(limite, 200)))]
+
+@app.get("/ejecuciones/{paciente_id}", response_model=List[EjecucionResponse])
+async def ejecuciones_paciente(paciente_id: str, limite: int = 20, registro: Ejecuciones = Depends(get_ejecuciones)):
+      """
+      Las ultimas ejecuciones del grafo para el paciente, con su estado y sus pruebas fallidas
+      """
+      return await registro.listar(paciente_id, max(1, min(limite, 200)))
+
+@app.get("/ejecuciones/{paciente_id}/{ejecucion}", response_model=EjecucionDetalleResponse)
+async def detalle_ejecucion(
+     paciente_id: str,
+     ejecucion: str,
+     graph = Depends(get_graph),
+     registro: Ejecuciones = Depends(get_ejecuciones)
+     ):
+      """
+      Lo que quedo guardado de una ejecucion: las pruebas que ya tienen resultado
+      y los pasos del grafo que le faltan. No evalua nada.
+      """
+      estado = await registro.estado(graph, paciente_id, ejecucion)
+      if estado is None:
+           raise HTTPException(status_code=404, detail=f"No existe la ejecucion {ejecucion} del paciente {paciente_id}")
+      return {**estado, "evaluaciones": format_test_results(estado["test_results"])}
+
+@app.post("/ejecuciones/{paciente_id}/{ejecucion}/reanudar", response_model=PerfilEvaluacionResponse)
+async def reanudar_ejecucion(
+     paciente_id: str,
+     ejecucion: str,
+     db: AsyncSession = Depends(get_db),
+     graph = Depends(get_graph),
+     registro: Ejecuciones = Depends(get_ejecuciones)
+     ):
+      """
+      Retoma una ejecucion parcial o interrumpida: solo corren los pasos que
+      faltaban y las pruebas que fallaron.
+      """
+      actual = await registro.obtener(paciente_id, ejecucion)
+      if actual is None:
+           raise HTTPException(status_code=404, detail=f"No existe la ejecucion {ejecucion} del paciente {paciente_id}")
+      if actual["estado"] == COMPLETADA:
+           raise HTTPException(status_code=409, detail=f"La ejecucion {ejecucion} ya esta completada")
+      if actual["estado"] == EN_PROCESO and actual["actualizado_en"] > time.time() - EJECUCION_PLAZO_SEGUNDOS:
+           raise HTTPException(status_code=409, detail=f"La ejecucion {ejecucion} esta en curso")
+      return await evaluar_paciente(paciente_id, ejecucion=ejecucion, db=db, graph=graph)
+
+@app.post("/evaluar-lote")
+async def evaluar_lote(
+     solicitud: LoteEvaluacionRequest,
+     db: AsyncSession = Depends(get_db)
+     ):
+      """
+      Evalua todos los pacientes de una empresa, un perfil o una lista de IDs.
+      Devuelve un NDJSON con una linea por paciente, a medida que van terminando.
+      """
+      if not (solicitud.empresa or solicitud.perfil or solicitud.paciente_ids):
+           raise HTTPException(status_code=400, detail="Indique empresa, perfil o paciente_ids")
+
+      # Cargamos todo antes de responder: el stream ya no necesita la sesion
+      lote = await cargar_lote(db, solicitud.empresa, solicitud.perfil, solicitud.paciente_ids)
+
+      async def generar_lineas():
+           async for resultado in ejecutar_lote(lote, solicitud.max_concurrencia):
+                yield json.dumps(resultado, ensure_ascii=False) + "\n"
+
+      return StreamingResponse(generar_lineas(), media_type="application/x-ndjson")
+
+@app.post("/criterios/simular")
+async def simular_criterios(solicitud: SimulacionRequest):
+      """
+      Que pasaria con la poblacion si se cambiaran estos criterios: re-evalua solo
+      las pruebas afectadas con los valores guardados y devuelve las transiciones
+      de veredicto por paciente. No modifica los criterios ni llama al LLM.
+      """
+      if not solicitud.cambios:
+           raise HTTPException(status_code=400, detail="Indique al menos un cambio")
+
+      # pandas se importa en el primer uso, no al arrancar la API
+      from backend.app.agents.whatif import simular
+
+      # El calculo es de pandas/numpy: lo sacamos del event loop
+      return await asyncio.to_thread(
+           simular, database.engine, [c.model_dump() for c in solicitud.cambios],
+           solicitud.usar_cache, max(0, solicitud.limite),
+      )
+
+@app.get("/cache/veredictos")
+async def estadisticas_cache():
+      """
+      Aciertos y fallos del cache de veredictos: cuantas llamadas al agente nos ahorramos
+      """
+      return verdict_cache.stats()
+
+@app.get("/clasificador")
+async def estadisticas_clasificador():
+      """
+      Modelos cargados del clasificador local y cuantos hallazgos de texto decidio sin el agente
+      """
+      return await asyncio.to_thread(clasificador.stats)
+
+@app.post("/clasificador/recargar")
+async def recargar_clasificador():
+      """
+      Vuelve a leer el modelo despues de correr entrenar_clasificador.py, sin reiniciar la API
+      """
+      await asyncio.to_thread(clasificador.recargar)
+      return await asyncio.to_thread(clasificador.stats)
+
+@app.get("/metrics")
+async def metricas():
+      """
+      Metricas en formato Prometheus: duracion de nodos, consultas, llamadas al LLM,
+      tokens, iteraciones del agente, herramientas y peticiones HTTP.
+      """
+      contenido, content_type = metrics_response()
+      return Response(content=contenido, media_type=content_type)
@@ -0,0 +1,252 @@
+import functools
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from opentelemetry import trace
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Nivel de log de la aplicacion: DEBUG muestra cada nodo y cada paso del agente,
+# en produccion basta con INFO o WARNING
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+logger = logging.getLogger(__name__)
+
+# Sin un SDK de OpenTelemetry configurado (p. ej. con `opentelemetry-instrument`)
+# los spans son no-ops y no cuestan nada
+tracer = trace.get_tracer("medical_eval")
+
+NODE_SECONDS = Histogram(
+    "evaluacion_nodo_segundos", "Duracion de cada nodo del grafo", ["nodo"]
+)
+DB_QUERY_SECONDS = Histogram(
+    "bd_consulta_segundos", "Duracion de cada consulta a la BD", ["operacion"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+LLM_CALL_SECONDS = Histogram(
+    "llm_llamada_segundos", "Duracion de cada llamada al LLM",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0),
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total", "Tokens enviados y recibidos del LLM", ["tipo"]
+)
+# Tamaño del prompt de cada llamada, por variante de prompt (PROMPT_AGENTE o "estructurado")
+LLM_PROMPT_CHARS = Histogram(
+    "llm_prompt_caracteres", "Caracteres del prompt enviado en cada llamada al LLM", ["prompt"],
+    buckets=(500, 1000, 2000, 3000, 4000, 6000, 8000, 12000, 16000, 32000),
+)
+LLM_PROMPT_TOKENS = Histogram(
+    "llm_prompt_tokens", "Tokens de entrada de cada llamada al LLM", ["prompt"],
+    buckets=(128, 256, 512, 768, 1024, 1536, 2048, 3072, 4096, 8192),
+)
+LLM_ERRORS = Counter(
+    "llm_errores_total", "Llamadas al LLM que fallaron"
+)
+LLM_RETRIES = Counter(
+    "llm_reintentos_total", "Reintentos de llamadas al LLM por motivo (estado HTTP o tipo de error)", ["motivo"]
+)
+LLM_HEDGES = Counter(
+    "llm_hedges_total", "Copias lanzadas de llamadas lentas al LLM"
+)
+LLM_FALLBACKS = Counter(
+    "llm_respaldos_total", "Pruebas resueltas con el veredicto de respaldo porque el LLM no estaba disponible"
+)
+LLM_RATE_LIMIT_WAIT_SECONDS = Histogram(
+    "llm_espera_cupo_segundos", "Espera por cupo de peticiones o tokens por minuto antes de llamar al LLM",
+    buckets=(0.0, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+LLM_CIRCUIT_STATE = Gauge(
+    "llm_circuito_estado", "Estado del circuito del LLM: 0 cerrado, 1 semiabierto, 2 abierto"
+)
+TEST_FAILURES = Counter(
+    "pruebas_fallidas_total", "Pruebas cuya evaluacion fallo y quedaron pendientes de reanudar"
+)
+CLASSIFIER_DECISIONS = Counter(
+    "clasificador_decisiones_total", "Hallazgos de texto que el clasificador local decidio o derivo al agente", ["resultado"]
+)
+AGENT_ITERATION_SECONDS = Histogram(
+    "agente_iteracion_segundos", "Duracion de cada iteracion (decision + herramienta) del agente ReAct",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0),
+)
+TOOL_SECONDS = Histogram(
+    "herramienta_segundos", "Duracion de cada herramienta del agente", ["herramienta"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1),
+)
+HTTP_SECONDS = Histogram(
+    "http_peticion_segundos", "Duracion de cada peticion HTTP", ["metodo", "ruta", "estado"]
+)
+
+
+def configurar_logging(level: str = LOG_LEVEL):
+    """
+    Configura el logging de la aplicacion. Se llama al arrancar (API o scripts),
+    nunca al importar.
+    """
+    logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    logging.getLogger("backend").setLevel(level)
+
+
+def metrics_response() -> tuple:
+    """Contenido y content-type para el endpoint `/metrics`."""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+@contextmanager
+def span(nombre: str, **atributos):
+    with tracer.start_as_current_span(nombre, attributes=atributos or None) as actual:
+        yield actual
+
+
+def medir_nodo(nombre: str, funcion):
+    """
+    Envuelve un nodo del grafo: mide su duracion y abre un span con su nombre.
+    `functools.wraps` conserva la firma, asi LangGraph sigue pasando `config`.
+    """
+    @functools.wraps(funcion)
+    async def nodo(*args, **kwargs):
+        inicio = time.perf_counter()
+        with span(f"nodo.{nombre}"):
+            try:
+                resultado = funcion(*args, **kwargs)
+                if hasattr(resultado, "__await__"):
+                    resultado = await resultado
+                return resultado
+            finally:
+                NODE_SECONDS.labels(nombre).observe(time.perf_counter() - inicio)
+
+    return nodo
+
+
+def instrumentar_engine(engine: Engine):
+    """Registra la duracion de cada consulta de este motor (sincrono o `async_engine.sync_engine`)."""
+
+    # El inicio va en el contexto de la ejecucion: si la consulta falla no hay `after_cursor_execute`,
+    # y no debe quedar un inicio suelto que desfase las consultas siguientes de la conexion
+    @event.listens_for(engine, "before_cursor_execute")
+    def _inicio(conn, cursor, statement, parameters, context, executemany):
+        context._inicio_consulta = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _fin(conn, cursor, statement, parameters, context, executemany):
+        inicio = context._inicio_consulta
+        operacion = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "?"
+        DB_QUERY_SECONDS.labels(operacion).observe(time.perf_counter() - inicio)
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    Callback de LangChain que mide cada llamada al LLM (duracion y tokens),
+    cada iteracion del agente y cada herramienta, y registra los pasos del
+    agente en el log a nivel DEBUG (reemplaza a `verbose=True`).
+    Corre en linea (`run_inline`) para heredar el span actual, asi las
+    llamadas al LLM quedan dentro del span de la peticion HTTP.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self._inicios: Dict[UUID, float] = {}
+        self._spans: Dict[UUID, Any] = {}
+        self._iteraciones: Dict[UUID, float] = {}
+        self._prompts: Dict[UUID, str] = {}
+
+    # LLM
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, metadata: Optional[dict] = None, **kwargs):
+        caracteres = sum(len(str(m.content)) for mensajes in messages for m in mensajes)
+        self._inicio_llamada(run_id, caracteres, metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, metadata: Optional[dict] = None, **kwargs):
+        self._inicio_llamada(run_id, sum(len(p) for p in prompts), metadata)
+
+    def _inicio_llamada(self, run_id: UUID, caracteres: int, metadata: Optional[dict]):
+        # La variante del prompt llega en la metadata de la config con la que se invoca
+        variante = (metadata or {}).get("prompt", "otro")
+        LLM_PROMPT_CHARS.labels(variante).observe(caracteres)
+        self._prompts[run_id] = variante
+        self._inicios[run_id] = time.perf_counter()
+        self._spans[run_id] = tracer.start_span("llm.llamada", attributes={"llm.prompt": variante, "llm.prompt_caracteres": caracteres})
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs):
+        inicio = self._inicios.pop(run_id, None)
+        if inicio is not None:
+            LLM_CALL_SECONDS.observe(time.perf_counter() - inicio)
+
+        uso = {}
+        for generaciones in response.generations:
+            for generacion in generaciones:
+                uso = getattr(getattr(generacion, "message", None), "usage_metadata", None) or uso
+        entrada, salida = uso.get("input_tokens", 0), uso.get("output_tokens", 0)
+        # Tokens de entrada que el proveedor sirvio desde su cache de prefijos
+        cacheados = (uso.get("input_token_details") or {}).get("cache_read", 0)
+        LLM_TOKENS.labels("entrada").inc(entrada)
+        LLM_TOKENS.labels("entrada_cacheada").inc(cacheados)
+        LLM_TOKENS.labels("salida").inc(salida)
+        variante = self._prompts.pop(run_id, "otro")
+        if entrada:
+            LLM_PROMPT_TOKENS.labels(variante).observe(entrada)
+
+        llm_span = self._spans.pop(run_id, None)
+        if llm_span is not None:
+            llm_span.set_attribute("llm.tokens_entrada", entrada)
+            llm_span.set_attribute("llm.tokens_entrada_cacheados", cacheados)
+            llm_span.set_attribute("llm.tokens_salida", salida)
+            llm_span.end()
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        LLM_ERRORS.inc()
+        self._inicios.pop(run_id, None)
+        self._prompts.pop(run_id, None)
+        llm_span = self._spans.pop(run_id, None)
+        if llm_span is not None:
+            llm_span.record_exception(error)
+            llm_span.end()
+        logger.warning("Fallo una llamada al LLM: %s", error)
+
+    # Agente: una iteracion va de una decision a la siguiente (incluye la herramienta)
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, **kwargs):
+        self._iteraciones[run_id] = time.perf_counter()
+
+    def on_agent_action(self, action, *, run_id: UUID, **kwargs):
+        self._cerrar_iteracion(run_id, reiniciar=True)
+        logger.debug("Agente -> %s(%s)", action.tool, action.tool_input)
+
+    def on_agent_finish(self, finish, *, run_id: UUID, **kwargs):
+        self._cerrar_iteracion(run_id, reiniciar=False)
+        logger.debug("Agente -> respuesta final: %s", finish.return_values.get("output"))
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs):
+        self._iteraciones.pop(run_id, None)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        self._iteraciones.pop(run_id, None)
+
+    def _cerrar_iteracion(self, run_id: UUID, reiniciar: bool):
+        inicio = self._iteraciones.pop(run_id, None)
+        ahora = time.perf_counter()
+        if inicio is not None:
+            AGENT_ITERATION_SECONDS.observe(ahora - inicio)
+        if reiniciar:
+            self._iteraciones[run_id] = ahora
+
+    # Herramientas
+    def on_tool_start(self, serialized, input_str, *, run_id: UUID, **kwargs):
+        self._inicios[run_id] = time.perf_counter()
+
+    def on_tool_end(self, output, *, run_id: UUID, name: Optional[str] = None, **kwargs):
+        inicio = self._inicios.pop(run_id, None)
+        if inicio is not None:
+            TOOL_SECONDS.labels(name or "desconocida").observe(time.perf_counter() - inicio)
+        logger.debug("Herramienta %s -> %s", name, output)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        self._inicios.pop(run_id, None)
+
+
+metrics_callback = MetricsCallbackHandler()
@@ -0,0 +1,161 @@
+"""
+Compara las variantes del prompt del agente ReAct ("completo" y "compacto")
+sobre un conjunto fijo de casos: tokens de entrada (y los servidos desde el
+cache de prefijos del proveedor), llamadas y latencia.
+
+Con `--llm fake` solo verifica que el prompt compacto envie menos tokens: el
+modelo falso decide al azar, asi que no se miden aciertos ni acuerdo. Con
+`--llm openai` (el gateway real configurado por el entorno) ademas termina con
+error si alguna variante acierta el veredicto esperado de `casos_prompt.json`
+en menos de `--min-aciertos` de los casos, o si las variantes coinciden en
+menos de `--min-acuerdo`.
+
+Uso:
+    python -m backend.benchmarks.ab_prompt --llm fake
+    python -m backend.benchmarks.ab_prompt --llm openai --min-aciertos 0.9 --min-acuerdo 0.95 --salida ab_prompt.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+from langchain_core.callbacks import get_usage_metadata_callback
+
+from backend.app.agents.context import CriterioContext
+from backend.app.agents.orchestrator import entrada_agente
+from backend.app.agents.rules import normalizar_veredicto
+from backend.app.agents.specialist import VARIANTES_PROMPT, crear_agente_evaluador
+from backend.app.observability import metrics_callback
+from .fake_llm import FakeChatModel
+
+CASOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "casos_prompt.json")
+
+errores = []
+
+
+def verificar(condicion: bool, mensaje: str):
+    print(("OK    " if condicion else "FALLO ") + mensaje)
+    if not condicion:
+        errores.append(mensaje)
+
+
+def normalizar(salida: str) -> str:
+    # Como en el orquestador: lo que no es un veredicto (o el tope de iteraciones) queda 'Pendiente'
+    return normalizar_veredicto(salida) or "Pendiente"
+
+
+async def evaluar_caso(agente, variante: str, caso: dict) -> dict:
+    criterio = CriterioContext(
+        id=0, empresa="AB", perfil="AB", tipo_examen="INGRESO", nombre_prueba=caso["prueba"], **caso["criterios"]
+    )
+    inicio = time.perf_counter()
+    with get_usage_metadata_callback() as uso:
+        resultado = await agente.ainvoke(
+            entrada_agente(criterio, caso["valor"]),
+            config={"callbacks": [metrics_callback], "metadata": {"prompt": variante}},
+        )
+    consumos = list(uso.usage_metadata.values())
+    return {
+        "veredicto": normalizar(resultado.get("output", "")),
+        "llamadas": len(resultado.get("intermediate_steps", [])) + 1,
+        "tokens_entrada": sum(c.get("input_tokens", 0) for c in consumos),
+        "tokens_cacheados": sum((c.get("input_token_details") or {}).get("cache_read", 0) for c in consumos),
+        "latencia_ms": (time.perf_counter() - inicio) * 1000,
+    }
+
+
+async def correr_variante(llm, variante: str, casos: list, concurrencia: int) -> list:
+    agente = crear_agente_evaluador(llm, variante)
+    semaforo = asyncio.Semaphore(concurrencia)
+
+    async def uno(caso):
+        async with semaforo:
+            return await evaluar_caso(agente, variante, caso)
+
+    return await asyncio.gather(*(uno(caso) for caso in casos))
+
+
+def resumen(casos: list, resultados: list) -> dict:
+    llamadas = sum(r["llamadas"] for r in resultados)
+    tokens = sum(r["tokens_entrada"] for r in resultados)
+    return {
+        "aciertos": sum(r["veredicto"] == c["esperado"] for c, r in zip(casos, resultados)) / len(casos),
+        "llamadas": llamadas,
+        "tokens_entrada": tokens,
+        "tokens_entrada_por_llamada": round(tokens / llamadas, 1) if llamadas else None,
+        "tokens_cacheados": sum(r["tokens_cacheados"] for r in resultados),
+        "latencia_p50_ms": round(statistics.median(r["latencia_ms"] for r in resultados), 1),
+    }
+
+
+async def main(args) -> int:
+    with open(args.casos, encoding="utf-8") as archivo:
+        casos = json.load(archivo)
+
+    if args.llm == "fake":
+        llm = FakeChatModel(latencia_ms=args.latencia_ms, pasos_react=args.pasos_react)
+    else:
+        from backend.app.agents.llm_gateway import obtener_llm
+        llm = obtener_llm()
+
+    resultados, resumenes = {}, {}
+    for variante in VARIANTES_PROMPT:
+        resultados[variante] = await correr_variante(llm, variante, casos, args.concurrencia)
+        resumenes[variante] = resumen(casos, resultados[variante])
+        r = resumenes[variante]
+        if args.llm == "fake":
+            # Los veredictos del modelo falso son al azar: no se reportan aciertos
+            r["aciertos"] = None
+        aciertos = f"aciertos {r['aciertos']:.0%}, " if r["aciertos"] is not None else ""
+        print(
+            f"{variante:9} {aciertos}{r['llamadas']} llamadas, "
+            f"{r['tokens_entrada']} tokens de entrada ({r['tokens_entrada_por_llamada']} por llamada, "
+            f"{r['tokens_cacheados']} desde cache), p50 {r['latencia_p50_ms']} ms"
+        )
+
+    completo, compacto = resultados["completo"], resultados["compacto"]
+    distintos = [
+        {"prueba": c["prueba"], "valor": c["valor"], "esperado": c["esperado"],
+         "completo": a["veredicto"], "compacto": b["veredicto"]}
+        for c, a, b in zip(casos, completo, compacto) if a["veredicto"] != b["veredicto"]
+    ]
+    acuerdo = 1 - len(distintos) / len(casos)
+
+    base = resumenes["completo"]["tokens_entrada"]
+    ahorro = 1 - resumenes["compacto"]["tokens_entrada"] / base if base else 0.0
+    verificar(ahorro > 0, f"el prompt compacto envia {ahorro:.0%} menos tokens de entrada")
+    if args.llm == "fake":
+        print("Con el modelo falso solo se compara el tamaño del prompt, no la calidad de los veredictos")
+    else:
+        for d in distintos:
+            print(f"  {d['prueba']} = {d['valor']!r}: completo {d['completo']}, compacto {d['compacto']} (esperado {d['esperado']})")
+        for variante, r in resumenes.items():
+            verificar(r["aciertos"] >= args.min_aciertos,
+                      f"la variante {variante} acierta {r['aciertos']:.0%} de {len(casos)} casos (minimo {args.min_aciertos:.0%})")
+        verificar(acuerdo >= args.min_acuerdo, f"las variantes coinciden en {acuerdo:.0%} de {len(casos)} casos (minimo {args.min_acuerdo:.0%})")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            fake = args.llm == "fake"
+            json.dump({"llm": args.llm, "acuerdo": None if fake else acuerdo, "ahorro_tokens": round(ahorro, 3),
+                       "variantes": resumenes, "distintos": [] if fake else distintos}, archivo, ensure_ascii=False, indent=2)
+
+    print("OK" if not errores else f"FALLO: {len(errores)} verificaciones")
+    return len(errores)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="A/B de las variantes del prompt del agente ReAct")
+    parser.add_argument("--llm", choices=["fake", "openai"], default="fake", help="Modelo falso o el gateway real")
+    parser.add_argument("--casos", default=CASOS, help="JSON con prueba, valor, criterios y veredicto esperado")
+    parser.add_argument("--min-aciertos", type=float, default=0.9, help="Fraccion minima de veredictos esperados por variante (solo openai)")
+    parser.add_argument("--min-acuerdo", type=float, default=0.9, help="Fraccion minima de veredictos iguales entre variantes (solo openai)")
+    parser.add_argument("--concurrencia", type=int, default=4, help="Casos evaluandose a la vez")
+    parser.add_argument("--latencia-ms", type=float, default=20.0, help="Latencia del modelo falso")
+    parser.add_argument("--pasos-react", type=int, default=2, help="Herramientas que usa el modelo falso por caso")
+    parser.add_argument("--salida", help="Guardar el resultado en este JSON")
+    args = parser.parse_args()
+    sys.exit(1 if asyncio.run(main(args)) else 0)
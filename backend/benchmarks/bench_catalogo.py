@@ -0,0 +1,59 @@
+"""
+Mide el catalogo paginado de pacientes sobre una base sintetica: la primera
+pagina, la ultima (paginacion por clave) y la misma pagina con OFFSET.
+La correccion de la paginacion y del ETag se prueba en tests/test_catalogo.py.
+
+Uso: python -m backend.benchmarks.bench_catalogo --pacientes 100000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from backend.app.agents.catalogo import listar_pacientes
+from .synthetic import generar
+
+
+async def medir(sesiones, repeticiones: int = 20, **parametros) -> float:
+    duraciones = []
+    async with sesiones() as db:
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            await listar_pacientes(db, **parametros)
+            duraciones.append(time.perf_counter() - inicio)
+    return statistics.median(duraciones) * 1000
+
+
+async def main(pacientes: int, limite: int):
+    ruta = os.path.join(tempfile.mkdtemp(), "catalogo.db")
+    ids = generar(f"sqlite:///{ruta}", pacientes)
+    engine = create_engine(f"sqlite:///{ruta}")
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{ruta}")
+    sesiones = async_sessionmaker(async_engine, expire_on_commit=False)
+
+    primera = await medir(sesiones, limite=limite)
+    profunda = await medir(sesiones, limite=limite, despues=ids[-limite - 1])
+    with engine.connect() as conexion:
+        inicio = time.perf_counter()
+        for _ in range(20):
+            conexion.execute(text(f"SELECT * FROM pacientes ORDER BY paciente_id LIMIT {limite} OFFSET {pacientes - limite}")).all()
+        offset = (time.perf_counter() - inicio) / 20 * 1000
+    print(f"Pacientes: {pacientes}, {limite} por pagina")
+    print(f"Pagina 1:                {primera:.2f} ms")
+    print(f"Ultima pagina (clave):   {profunda:.2f} ms")
+    print(f"Ultima pagina (OFFSET):  {offset:.2f} ms")
+
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide la paginacion del catalogo de pacientes")
+    parser.add_argument("--pacientes", type=int, default=100000)
+    parser.add_argument("--limite", type=int, default=50, help="Pacientes por pagina")
+    args = parser.parse_args()
+    asyncio.run(main(args.pacientes, args.limite))
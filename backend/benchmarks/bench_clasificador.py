@@ -0,0 +1,67 @@
+"""
+Mide el clasificador local de hallazgos de texto sobre hallazgos sinteticos de
+audiometria: precision y cobertura con validacion cruzada y latencia por
+prediccion. Lo que decide y lo que deja al agente se prueba en
+tests/test_clasificador.py.
+
+Uso: python -m backend.benchmarks.bench_clasificador --ejemplos 600
+"""
+import argparse
+import random
+import time
+
+from backend.app.agents.cache import hash_criterio
+from backend.app.agents.clasificador import ClasificadorLocal, Ejemplo, clave_modelo, entrenar_modelos, reporte
+from backend.app.agents.context import CriterioContext
+
+CRITERIO = CriterioContext(
+    id=1, empresa="EMPRESA SINTETICA SAC", perfil="PERFIL B: Conductor", tipo_examen="INGRESO",
+    nombre_prueba="Audiometría", apto="Normal", observado="Hipoacusia leve", no_apto="Hipoacusia moderada o severa",
+)
+
+HALLAZGOS = {
+    "Apto": ["Normal", "Audición normal", "Sin alteraciones", "Dentro de límites normales", "Umbrales auditivos normales"],
+    "Observado": ["Hipoacusia leve", "Trauma acústico leve", "Hipoacusia neurosensorial leve", "Caída leve en 4 kHz"],
+    "No Apto": ["Hipoacusia moderada", "Hipoacusia severa", "Hipoacusia profunda", "Pérdida auditiva moderada"],
+}
+PREFIJOS = ["", "Audiometría tonal: ", "Resultado: ", "Evaluación: "]
+SUFIJOS = ["", " bilateral", " en ambos oídos", " oído derecho", " oído izquierdo", " a predominio derecho"]
+
+
+def hallazgos(cantidad: int, ruido: float, semilla: int = 7):
+    """(texto, veredicto del agente) con una fraccion `ruido` de veredictos equivocados."""
+    azar = random.Random(semilla)
+    for _ in range(cantidad):
+        veredicto = azar.choice(list(HALLAZGOS))
+        texto = azar.choice(PREFIJOS) + azar.choice(HALLAZGOS[veredicto]) + azar.choice(SUFIJOS)
+        if azar.random() < ruido:
+            veredicto = azar.choice([v for v in HALLAZGOS if v != veredicto])
+        yield texto, veredicto
+
+
+def ejemplos(cantidad: int, ruido: float = 0.02):
+    clave = clave_modelo(CRITERIO.empresa, CRITERIO.perfil, CRITERIO.tipo_examen, CRITERIO.nombre_prueba)
+    return [Ejemplo(clave, hash_criterio(CRITERIO), texto, veredicto) for texto, veredicto in hallazgos(cantidad, ruido)]
+
+
+def main(cantidad: int):
+    datos = ejemplos(cantidad)
+    resultado = reporte(datos, umbral=0.9)
+    print(
+        f"{resultado['ejemplos']} casos: cobertura {resultado['cobertura']:.1%}, precision {resultado['precision']:.1%}, "
+        f"p99 {resultado['latencia_p99_ms']} ms"
+    )
+
+    local = ClasificadorLocal(path="", umbral=0.9, min_ejemplos=5)
+    local.usar(entrenar_modelos(datos))
+    inicio = time.perf_counter()
+    for _ in range(1000):
+        local.predecir(CRITERIO, CRITERIO.nombre_prueba, "Trauma acústico leve oído derecho")
+    print(f"1000 decisiones en {(time.perf_counter() - inicio) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide el clasificador local de hallazgos de texto")
+    parser.add_argument("--ejemplos", type=int, default=600, help="Veredictos sinteticos del agente")
+    args = parser.parse_args()
+    main(args.ejemplos)
@@ -0,0 +1,50 @@
+"""
+Compara el tiempo del tamizaje vectorizado de cohortes con el del motor de
+reglas fila por fila sobre una base sintetica. Que ambos den los mismos
+veredictos se prueba en tests/test_cohort.py.
+
+Uso: python -m backend.benchmarks.bench_cohort --pacientes 100000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+
+from backend.app.agents.cohort import tamizar
+from backend.app.agents.context import CriterioContext
+from backend.app.agents.rules import evaluar_con_reglas
+from .synthetic import PERFILES, PRUEBAS, EMPRESA, generar
+
+
+def main(pacientes: int):
+    ruta = os.path.join(tempfile.mkdtemp(), "cohorte.db")
+    generar(f"sqlite:///{ruta}", pacientes)
+    engine = create_engine(f"sqlite:///{ruta}")
+
+    tamizaje = tamizar(engine, usar_cache=False)
+    print(
+        f"Vectorizado: {len(tamizaje.pruebas)} pruebas de {len(tamizaje.pacientes)} pacientes en "
+        f"{tamizaje.segundos:.2f} s ({tamizaje.segundos_carga:.2f} s leyendo la BD)"
+    )
+
+    criterios = {
+        (perfil, prueba): CriterioContext(
+            id=0, empresa=EMPRESA, perfil=perfil, tipo_examen="INGRESO", nombre_prueba=prueba,
+            apto=PRUEBAS[prueba]["apto"], observado=PRUEBAS[prueba]["observado"], no_apto=PRUEBAS[prueba]["no_apto"],
+        )
+        for perfil, pruebas in PERFILES.items() for prueba in pruebas
+    }
+
+    inicio = time.perf_counter()
+    for fila in tamizaje.pruebas.itertuples(index=False):
+        evaluar_con_reglas(criterios[(fila.perfil, fila.nombre_prueba)], fila.valor)
+    print(f"Fila por fila: {time.perf_counter() - inicio:.2f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara el tiempo del tamizaje vectorizado con el motor de reglas")
+    parser.add_argument("--pacientes", type=int, default=20000)
+    args = parser.parse_args()
+    main(args.pacientes)
@@ -0,0 +1,96 @@
+"""
+Benchmark: cuanto cuesta una peticion completa (`ainvoke` del grafo sobre una
+base sintetica, con el LLM falso sin latencia) construyendo y compilando el
+grafo en cada peticion frente a reutilizar el grafo compilado al arrancar.
+
+Uso: python -m backend.benchmarks.bench_graph_compile [repeticiones]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# El benchmark nunca debe llegar a OpenAI, y su cache de veredictos va aparte de la real
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark-offline")
+os.environ.setdefault("VERDICT_CACHE_PATH", os.path.join(tempfile.mkdtemp(), "veredictos.db"))
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from backend.app.agents import orchestrator
+from backend.app.agents.cache import verdict_cache
+from backend.app.agents.criteria_index import criteria_index
+from backend.app.agents.specialist import crear_agente_evaluador, crear_evaluador_estructurado
+from .fake_llm import FakeChatModel
+from .synthetic import generar
+
+
+async def medir(evaluar, paciente_ids, repeticiones):
+    """
+    Latencias (ms) de `repeticiones` peticiones; la cache de veredictos se vacia
+    antes de cada una (fuera de la medicion) para que todas hagan el mismo trabajo.
+    """
+    latencias = []
+    for n in range(repeticiones):
+        verdict_cache.clear()
+        inicio = time.perf_counter()
+        await evaluar(paciente_ids[n % len(paciente_ids)])
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    return latencias
+
+
+async def ejecutar(repeticiones: int):
+    ruta_db = os.path.join(tempfile.mkdtemp(), "bench_grafo.db")
+    paciente_ids = generar(f"sqlite:///{ruta_db}", 20)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{ruta_db}")
+    sesiones = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+    fake = FakeChatModel(latencia_ms=0)
+    orchestrator.evaluation_agent_executor = crear_agente_evaluador(fake)
+    orchestrator.structured_evaluator = crear_evaluador_estructurado(fake)
+    async with sesiones() as db:
+        await criteria_index.reload(db)
+
+    async def invocar(graph, paciente_id):
+        async with sesiones() as db:
+            await graph.ainvoke(
+                {"patient_id": paciente_id},
+                config={"configurable": {"db": db, "reutilizar": False}, "max_concurrency": orchestrator.MAX_CONCURRENCY},
+            )
+
+    grafo = orchestrator.build_graph()
+
+    async def reutilizado(paciente_id):
+        await invocar(grafo, paciente_id)
+
+    async def por_peticion(paciente_id):
+        await invocar(orchestrator.build_graph(), paciente_id)
+
+    # Calentamiento: imports perezosos, plantillas del prompt y conexiones de la BD
+    await medir(reutilizado, paciente_ids, 5)
+
+    # Alternando las dos variantes para que el ruido afecte a ambas por igual
+    tiempos = {"por_peticion": [], "reutilizado": []}
+    for _ in range(max(1, repeticiones // 10)):
+        tiempos["por_peticion"] += await medir(por_peticion, paciente_ids, 10)
+        tiempos["reutilizado"] += await medir(reutilizado, paciente_ids, 10)
+    await engine.dispose()
+    return tiempos
+
+
+def main():
+    repeticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    tiempos = asyncio.run(ejecutar(repeticiones))
+
+    por_peticion = statistics.mean(tiempos["por_peticion"])
+    reutilizado = statistics.mean(tiempos["reutilizado"])
+    print(f"Peticiones por variante: {len(tiempos['reutilizado'])}")
+    print(f"Compilar el grafo en cada peticion: {por_peticion:.3f} ms (p50 {statistics.median(tiempos['por_peticion']):.3f} ms)")
+    print(f"Grafo compilado reutilizado:        {reutilizado:.3f} ms (p50 {statistics.median(tiempos['reutilizado']):.3f} ms)")
+    print(f"Ahorro por peticion:                {por_peticion - reutilizado:.3f} ms ({(por_peticion - reutilizado) / por_peticion:.1%})")
+    print(f"Ahorro cada 10.000 peticiones:      {(por_peticion - reutilizado) * 10:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
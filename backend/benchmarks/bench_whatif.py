@@ -0,0 +1,75 @@
+"""
+Compara el tiempo del simulador de criterios con el de aplicar los cambios en
+la BD y volver a tamizar la cohorte completa. Que ambos den los mismos
+veredictos se prueba en tests/test_whatif.py.
+
+Uso: python -m backend.benchmarks.bench_whatif --pacientes 50000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine, delete, insert, update
+
+from backend.app.agents.cohort import tamizar
+from backend.app.agents.whatif import simular
+from backend.app.database.models import Criterio
+from .synthetic import EMPRESA, generar
+
+CAMBIOS = [
+    # Glucosa mas estricta para apto y mas tolerante para no apto
+    {"empresa": EMPRESA, "perfil": "PERFIL B: Conductor", "nombre_prueba": "Glucosa",
+     "apto": "Entre 70 y 99 mg/dl", "observado": "Entre 100 y 140 mg/dl o < 70 mg/dl", "no_apto": "> 140 mg/dl"},
+    # Colesterol con reglas que el motor puede compilar: ya no pasa por el agente
+    {"empresa": EMPRESA, "perfil": "PERFIL B: Conductor", "nombre_prueba": "Colesterol Total",
+     "apto": "< 200 mg/dl", "no_apto": ">= 240 mg/dl"},
+    {"empresa": EMPRESA, "perfil": "PERFIL B: Conductor", "nombre_prueba": "Audiometría", "eliminar": True},
+    # Prueba nueva que ningun paciente tiene: queda como faltante
+    {"empresa": EMPRESA, "perfil": "PERFIL A: Operario", "nombre_prueba": "Hemoglobina",
+     "apto": "Entre 13 y 17 g/dl", "observado": "Entre 11 y 12.9 g/dl", "no_apto": "< 11 g/dl"},
+]
+
+
+def aplicar(engine, cambios):
+    """Aplica los cambios de verdad, para comparar contra un tamizaje completo."""
+    with engine.begin() as conexion:
+        for cambio in cambios:
+            clave = (
+                (Criterio.empresa == cambio["empresa"]) & (Criterio.perfil == cambio["perfil"])
+                & (Criterio.nombre_prueba == cambio["nombre_prueba"])
+            )
+            if cambio.get("eliminar"):
+                conexion.execute(delete(Criterio).where(clave))
+                continue
+            reglas = {campo: cambio[campo] for campo in ("apto", "observado", "no_apto") if campo in cambio}
+            if conexion.execute(update(Criterio).where(clave).values(**reglas)).rowcount == 0:
+                conexion.execute(insert(Criterio).values(
+                    empresa=cambio["empresa"], perfil=cambio["perfil"], nombre_prueba=cambio["nombre_prueba"], **reglas
+                ))
+
+
+def main(pacientes: int):
+    ruta = os.path.join(tempfile.mkdtemp(), "whatif.db")
+    generar(f"sqlite:///{ruta}", pacientes)
+    engine = create_engine(f"sqlite:///{ruta}")
+
+    simulacion = simular(engine, CAMBIOS, usar_cache=False, limite=None)
+    print(
+        f"Simulacion: {simulacion['pacientes_evaluados']} pacientes, {simulacion['pacientes_con_cambio']} con cambio, "
+        f"{simulacion['pruebas_reevaluadas']} pruebas re-evaluadas en {simulacion['segundos']:.2f} s"
+    )
+    print(f"Transiciones: {simulacion['transiciones']}")
+
+    inicio = time.perf_counter()
+    tamizar(engine, EMPRESA, usar_cache=False)
+    aplicar(engine, CAMBIOS)
+    tamizar(engine, EMPRESA, usar_cache=False)
+    print(f"Aplicar los cambios y tamizar antes y despues: {time.perf_counter() - inicio:.2f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara el tiempo del simulador de criterios con un tamizaje completo")
+    parser.add_argument("--pacientes", type=int, default=20000)
+    args = parser.parse_args()
+    main(args.pacientes)
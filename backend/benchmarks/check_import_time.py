@@ -0,0 +1,73 @@
+"""
+Verifica que importar la API sea barato: mide `python -X importtime` en un
+proceso limpio y comprueba que langchain, langgraph, OpenAI y pandas no se
+cargan hasta que se necesitan, y que el LLM no se crea al importar.
+Termina con error si algo falla.
+
+Uso: python -m backend.benchmarks.check_import_time --presupuesto-ms 1500
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Modulos pesados que solo deben cargarse al evaluar (o al simular criterios)
+DIFERIDOS = ("langchain_openai", "openai", "langgraph", "langchain.agents", "pandas", "numpy")
+
+SONDA = """
+import json, sys
+import backend.app.main
+from backend.app.agents import orchestrator
+from backend.app.agents.llm_gateway import obtener_llm
+print(json.dumps({
+    "modulos": sorted(sys.modules),
+    "agente_creado": orchestrator.evaluation_agent_executor is not None,
+    "estructurado_creado": orchestrator.structured_evaluator is not None,
+    "llm_creado": obtener_llm.cache_info().currsize > 0,
+}))
+"""
+
+
+def medir() -> tuple:
+    """Tiempo acumulado de `import backend.app.main` (ms) y lo que quedo en memoria."""
+    entorno = {**os.environ, "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "sk-stub-offline")}
+    proceso = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", SONDA],
+        capture_output=True, text=True, env=entorno, check=True,
+    )
+    # Formato de -X importtime: "import time: self [us] | cumulative | paquete"
+    acumulado = next(
+        int(linea.split("|")[1]) for linea in proceso.stderr.splitlines()
+        if linea.startswith("import time:") and linea.split("|")[-1].strip() == "backend.app.main"
+    )
+    return acumulado / 1000, json.loads(proceso.stdout.strip().splitlines()[-1])
+
+
+def main(presupuesto_ms: float, repeticiones: int) -> int:
+    mediciones = [medir() for _ in range(repeticiones)]
+    ms = min(m[0] for m in mediciones)
+    estado = mediciones[0][1]
+    errores = []
+
+    def verificar(condicion: bool, mensaje: str):
+        print(("OK    " if condicion else "FALLO ") + mensaje)
+        if not condicion:
+            errores.append(mensaje)
+
+    verificar(ms <= presupuesto_ms, f"importar backend.app.main toma {ms:.0f} ms (presupuesto {presupuesto_ms:.0f} ms)")
+    for modulo in DIFERIDOS:
+        verificar(modulo not in estado["modulos"], f"{modulo} no se importa al arrancar")
+    verificar(not estado["llm_creado"], "el cliente del LLM no se crea al importar")
+    verificar(not (estado["agente_creado"] or estado["estructurado_creado"]), "los evaluadores se crean al primer uso")
+
+    print("OK" if not errores else f"FALLO: {len(errores)} verificaciones")
+    return len(errores)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Presupuesto de tiempo de import de la API")
+    parser.add_argument("--presupuesto-ms", type=float, default=1500.0)
+    parser.add_argument("--repeticiones", type=int, default=3, help="Se toma la mejor de N mediciones")
+    args = parser.parse_args()
+    sys.exit(1 if main(args.presupuesto_ms, args.repeticiones) else 0)
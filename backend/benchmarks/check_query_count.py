@@ -0,0 +1,66 @@
+"""
+Verifica cuantas consultas hace el grafo por paciente. Con el contexto
+precargado y el indice de criterios en memoria son 2 lecturas (paciente con
+resultados y ultima evaluacion guardada) y a lo sumo 2 escrituras (la
+evaluacion y sus pruebas), sin importar cuantas pruebas tenga el perfil.
+Termina con error si se supera el limite.
+
+Requiere la BD poblada (init_database.py y seed_datase.py).
+Uso: python -m backend.benchmarks.check_query_count [paciente_id ...]
+"""
+import asyncio
+import sys
+
+from sqlalchemy import event
+
+from backend.app.agents import orchestrator
+from backend.app.agents.criteria_index import criteria_index
+from backend.app.database.database import AsyncSessionLocal, async_engine
+
+MAX_LECTURAS_POR_PACIENTE = 2
+MAX_ESCRITURAS_POR_PACIENTE = 2
+
+
+class AgenteSinLLM:
+    """Sustituye al agente para no llamar al LLM: solo contamos consultas."""
+
+    async def ainvoke(self, input_data, config=None):
+        return {"output": "Apto", "intermediate_steps": []}
+
+
+async def contar_consultas(paciente_ids):
+    consultas = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        consultas.append(statement)
+
+    async with AsyncSessionLocal() as db:
+        await criteria_index.reload(db)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", registrar)
+    orchestrator.evaluation_agent_executor = AgenteSinLLM()
+    graph = orchestrator.build_graph()
+
+    fallos = 0
+    try:
+        for paciente_id in paciente_ids:
+            consultas.clear()
+            async with AsyncSessionLocal() as db:
+                final_state = await graph.ainvoke(
+                    {"patient_id": paciente_id}, config={"configurable": {"db": db}}
+                )
+            pruebas = len(final_state["test_results"])
+            lecturas = sum(c.lstrip().upper().startswith("SELECT") for c in consultas)
+            escrituras = len(consultas) - lecturas
+            ok = lecturas <= MAX_LECTURAS_POR_PACIENTE and escrituras <= MAX_ESCRITURAS_POR_PACIENTE
+            fallos += not ok
+            print(f"{paciente_id}: {pruebas} pruebas, {lecturas} lecturas y {escrituras} escrituras {'OK' if ok else 'FALLO'}")
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", registrar)
+
+    return fallos
+
+
+if __name__ == "__main__":
+    ids = sys.argv[1:] or ["P001", "P002", "P003", "P004"]
+    sys.exit(1 if asyncio.run(contar_consultas(ids)) else 0)
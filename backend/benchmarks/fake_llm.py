@@ -0,0 +1,105 @@
+"""
+Modelo de chat falso y determinista para medir el pipeline sin llamar a OpenAI.
+
+Imita lo necesario de ChatOpenAI: latencia configurable, `usage_metadata`
+con tokens de entrada y salida, respuestas en formato ReAct (con N pasos de
+herramienta antes de la respuesta final) y `bind_tools` para que funcione
+`with_structured_output` en el modo "structured".
+"""
+import asyncio
+import json
+import time
+import uuid
+import zlib
+from typing import Any, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import Field
+
+VEREDICTOS = ("Apto", "Observado", "No Apto")
+# `get_usage_metadata_callback` solo suma los tokens de mensajes con nombre de modelo
+METADATA = {"model_name": "fake-chat-model"}
+
+
+class FakeChatModel(BaseChatModel):
+    latencia_ms: float = 300.0 # Latencia simulada de cada llamada
+    tokens_salida: int = 40 # Tokens de salida reportados por llamada
+    pasos_react: int = 2 # Herramientas que "usa" el agente antes de responder
+    herramientas: Optional[List[dict]] = None
+    # Dict compartido con las copias de `bind_tools`, para contar todas las llamadas
+    contador: dict = Field(default_factory=lambda: {"llamadas": 0, "tokens_entrada": 0})
+
+    @property
+    def llamadas(self) -> int:
+        return self.contador["llamadas"]
+
+    @property
+    def tokens_entrada(self) -> int:
+        return self.contador["tokens_entrada"]
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def bind_tools(self, tools, tool_choice=None, **kwargs):
+        return self.model_copy(update={"herramientas": [convert_to_openai_tool(t) for t in tools]})
+
+    @staticmethod
+    def _veredicto(texto: str) -> str:
+        # Determinista: el mismo caso siempre recibe el mismo veredicto
+        return VEREDICTOS[zlib.crc32(texto.encode("utf-8")) % len(VEREDICTOS)]
+
+    def _responder(self, messages: List[BaseMessage]) -> AIMessage:
+        self.contador["llamadas"] += 1
+        prompt = "\n".join(str(m.content) for m in messages)
+        usage = {
+            "input_tokens": len(prompt) // 4,
+            "output_tokens": self.tokens_salida,
+            "total_tokens": len(prompt) // 4 + self.tokens_salida,
+        }
+        self.contador["tokens_entrada"] += usage["input_tokens"]
+
+        if self.herramientas:
+            # Modo estructurado: respondemos llamando a la "herramienta" del esquema
+            casos = json.loads(prompt[prompt.index("["):prompt.rindex("]") + 1])
+            argumentos = {
+                "evaluaciones": [
+                    {
+                        "prueba": caso["prueba"],
+                        "veredicto": self._veredicto(json.dumps(caso, ensure_ascii=False)),
+                        "razonamiento": "Veredicto simulado",
+                    }
+                    for caso in casos
+                ]
+            }
+            nombre = self.herramientas[0]["function"]["name"]
+            return AIMessage(
+                content="",
+                tool_calls=[{"name": nombre, "args": argumentos, "id": uuid.uuid4().hex, "type": "tool_call"}],
+                usage_metadata=usage,
+                response_metadata=METADATA,
+            )
+
+        # Modo ReAct: contamos las observaciones del scratchpad para saber en que paso vamos
+        caso = prompt.split("Información del caso:")[-1].split("Inicia tu razonamiento:")[0]
+        # Sin los espacios de indentacion: las variantes del prompt reciben el mismo veredicto
+        caso = " ".join(caso.split())
+        if prompt.count("Observation:") - 1 < self.pasos_react:
+            texto = "Thought: Reviso el limite de la regla.\nAction: es_mayor_o_igual_que\nAction Input: 1, 0"
+        else:
+            texto = f"Thought: Ahora sé la respuesta final.\nFinal Answer: {self._veredicto(caso)}"
+        return AIMessage(content=texto, usage_metadata=usage, response_metadata=METADATA)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latencia_ms / 1000)
+        return ChatResult(generations=[ChatGeneration(message=self._responder(messages))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latencia_ms / 1000)
+        return ChatResult(generations=[ChatGeneration(message=self._responder(messages))])
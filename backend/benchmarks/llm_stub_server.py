@@ -0,0 +1,167 @@
+"""
+Servidor local compatible con /v1/chat/completions de OpenAI, para probar el
+gateway del LLM sin salir a internet.
+
+Responde como `FakeChatModel` (veredictos deterministas, en formato ReAct o
+llamando a la herramienta del esquema en el modo "structured") y puede
+simular lo que hace el proveedor real bajo carga: latencia, una cola lenta,
+respuestas 429 con Retry-After, errores 500 y caidas completas.
+
+Uso:
+    python -m backend.benchmarks.llm_stub_server --puerto 8099 --latencia-ms 200 --tasa-429 0.1
+    LLM_BASE_URL=http://127.0.0.1:8099/v1 uvicorn backend.app.main:app
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+VEREDICTOS = ("Apto", "Observado", "No Apto")
+
+
+def configuracion(**cambios) -> dict:
+    config = {
+        "latencia_ms": 50.0, # Latencia de cada respuesta
+        "cola_lenta": 0.0, # Fraccion de respuestas que tardan `latencia_cola_ms` (con 0.2, una de cada cinco)
+        "latencia_cola_ms": 2000.0,
+        "tasa_429": 0.0, # Fraccion de peticiones rechazadas por limite de cuota
+        "rafaga_429": 0, # Las proximas N peticiones reciben 429 (deterministico)
+        "retry_after": None, # Segundos en la cabecera Retry-After de los 429
+        "tasa_500": 0.0, # Fraccion de peticiones con error del servidor
+        "caida": False, # Todas las peticiones fallan con 503
+    }
+    config.update(cambios)
+    return config
+
+
+def veredicto(texto: str) -> str:
+    return VEREDICTOS[zlib.crc32(texto.encode("utf-8")) % len(VEREDICTOS)]
+
+
+def responder(cuerpo: dict) -> dict:
+    """Completion en el formato de OpenAI para la peticion `cuerpo`."""
+    prompt = "\n".join(str(m.get("content") or "") for m in cuerpo.get("messages", []))
+    mensaje = {"role": "assistant", "content": None}
+
+    if cuerpo.get("tools"):
+        casos = json.loads(prompt[prompt.index("["):prompt.rindex("]") + 1])
+        argumentos = {"evaluaciones": [
+            {"prueba": caso["prueba"], "veredicto": veredicto(json.dumps(caso, ensure_ascii=False)),
+             "razonamiento": "Veredicto del servidor stub"}
+            for caso in casos
+        ]}
+        mensaje["tool_calls"] = [{
+            "id": f"call_{uuid.uuid4().hex[:12]}", "type": "function",
+            "function": {"name": cuerpo["tools"][0]["function"]["name"], "arguments": json.dumps(argumentos)},
+        }]
+        fin = "tool_calls"
+    else:
+        caso = prompt.split("Información del caso:")[-1].split("Inicia tu razonamiento:")[0]
+        # Sin los espacios de indentacion: las variantes del prompt reciben el mismo veredicto
+        caso = " ".join(caso.split())
+        mensaje["content"] = f"Thought: Ahora sé la respuesta final.\nFinal Answer: {veredicto(caso)}"
+        fin = "stop"
+
+    tokens_entrada, tokens_salida = len(prompt) // 4, 40
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": cuerpo.get("model", "stub"),
+        "choices": [{"index": 0, "message": mensaje, "finish_reason": fin}],
+        "usage": {"prompt_tokens": tokens_entrada, "completion_tokens": tokens_salida,
+                  "total_tokens": tokens_entrada + tokens_salida},
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _enviar(self, estado: int, cuerpo: dict, cabeceras: dict = None):
+        datos = json.dumps(cuerpo).encode("utf-8")
+        try:
+            self.send_response(estado)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(datos)))
+            for nombre, valor in (cabeceras or {}).items():
+                self.send_header(nombre, valor)
+            self.end_headers()
+            self.wfile.write(datos)
+        except (BrokenPipeError, ConnectionResetError):
+            # El cliente corto la peticion (timeout o hedging): no es un error del stub
+            pass
+
+    def do_POST(self):
+        servidor = self.server
+        cuerpo = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        config = servidor.config
+        with servidor.lock:
+            servidor.peticiones += 1
+            # Las respuestas lentas se reparten de forma regular, asi cada corrida es comparable
+            lenta = int(servidor.peticiones * config["cola_lenta"]) != int((servidor.peticiones - 1) * config["cola_lenta"])
+            rafaga = config["rafaga_429"] > 0
+            if rafaga:
+                config["rafaga_429"] -= 1
+
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._enviar(404, {"error": {"message": "Ruta desconocida"}})
+        if config["caida"]:
+            return self._enviar(503, {"error": {"message": "Servicio no disponible", "type": "server_error"}})
+        if rafaga or random.random() < config["tasa_429"]:
+            cabeceras = {"Retry-After": str(config["retry_after"])} if config["retry_after"] is not None else {}
+            return self._enviar(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}}, cabeceras)
+        if random.random() < config["tasa_500"]:
+            return self._enviar(500, {"error": {"message": "Error interno", "type": "server_error"}})
+
+        time.sleep((config["latencia_cola_ms"] if lenta else config["latencia_ms"]) / 1000)
+        self._enviar(200, responder(cuerpo))
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # La cola por defecto (5) resetea conexiones cuando el cliente abre muchas a la vez
+    request_queue_size = 256
+
+
+def iniciar(puerto: int = 0, **cambios) -> StubServer:
+    """
+    Arranca el stub en un hilo y lo devuelve. `servidor.config` se puede
+    cambiar en caliente; `servidor.url` es la base para el cliente de OpenAI.
+    """
+    servidor = StubServer(("127.0.0.1", puerto), StubHandler)
+    servidor.config = configuracion(**cambios)
+    servidor.lock = threading.Lock()
+    servidor.peticiones = 0
+    servidor.url = f"http://127.0.0.1:{servidor.server_address[1]}/v1"
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor stub compatible con la API de chat de OpenAI")
+    parser.add_argument("--puerto", type=int, default=8099)
+    parser.add_argument("--latencia-ms", type=float, default=50.0)
+    parser.add_argument("--cola-lenta", type=float, default=0.0, help="Fraccion de respuestas lentas")
+    parser.add_argument("--latencia-cola-ms", type=float, default=2000.0)
+    parser.add_argument("--tasa-429", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float)
+    parser.add_argument("--tasa-500", type=float, default=0.0)
+    parser.add_argument("--caida", action="store_true", help="Responder 503 a todo")
+    args = parser.parse_args()
+
+    servidor = iniciar(
+        args.puerto, latencia_ms=args.latencia_ms, cola_lenta=args.cola_lenta, latencia_cola_ms=args.latencia_cola_ms,
+        tasa_429=args.tasa_429, retry_after=args.retry_after, tasa_500=args.tasa_500, caida=args.caida,
+    )
+    print(f"Stub del LLM escuchando en {servidor.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()
@@ -0,0 +1,231 @@
+"""
+Benchmark offline del pipeline completo con un LLM falso.
+
+Genera (o reutiliza) una base sintetica, reemplaza el LLM por `FakeChatModel`
+y evalua todos los pacientes a traves del grafo o del endpoint de FastAPI.
+Reporta latencia p50/p95/p99 por paciente, throughput, consultas a la BD,
+llamadas al LLM y memoria, y guarda todo en JSON para comparar entre commits.
+
+Uso:
+    python -m backend.benchmarks.run_benchmark --pacientes 1000 --via grafo --salida bench.json
+    python -m backend.benchmarks.run_benchmark --pacientes 1000 --via api --comparar bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+# El benchmark nunca debe llegar a OpenAI: el cliente real se reemplaza por el falso
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark-offline")
+
+
+def percentil(valores, p):
+    if len(valores) == 1:
+        return valores[0]
+    return statistics.quantiles(valores, n=100, method="inclusive")[p - 1]
+
+
+def commit_actual():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL, text=True,
+        ).strip()
+    except Exception:
+        return None
+
+
+async def ejecutar(args):
+    from sqlalchemy import event
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    from backend.app.agents import orchestrator
+    from backend.app.agents.cache import verdict_cache
+    from backend.app.agents.criteria_index import criteria_index
+    from backend.app.agents.llm_gateway import crear_gateway
+    from backend.app.agents.specialist import crear_agente_evaluador, crear_evaluador_estructurado
+    from .fake_llm import FakeChatModel
+    from .synthetic import generar
+
+    ruta_db = args.db or os.path.join(tempfile.mkdtemp(), "bench.db")
+    if not (args.db and os.path.exists(args.db)):
+        print(f"Generando {args.pacientes} pacientes sinteticos en {ruta_db}...")
+        paciente_ids = generar(f"sqlite:///{ruta_db}", args.pacientes)
+    else:
+        paciente_ids = [f"S{n + 1:06d}" for n in range(args.pacientes)]
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{ruta_db}")
+    session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+    consultas = [0]
+
+    def contar(conn, cursor, statement, parameters, context, executemany):
+        consultas[0] += 1
+
+    # LLM falso en los dos modos del evaluador, detras del mismo gateway que el real
+    fake = FakeChatModel(latencia_ms=args.latencia_ms, tokens_salida=args.tokens_salida, pasos_react=args.pasos_react)
+    llm = crear_gateway(fake, rpm=args.rpm, tpm=args.tpm)
+    orchestrator.evaluation_agent_executor = crear_agente_evaluador(llm, args.prompt)
+    orchestrator.PROMPT_AGENTE = args.prompt
+    orchestrator.structured_evaluator = crear_evaluador_estructurado(llm)
+    orchestrator.EVALUATOR_MODE = args.modo
+    graph = orchestrator.build_graph(args.modo)
+
+    if not args.con_cache:
+        verdict_cache.clear()
+    async with session_factory() as db:
+        await criteria_index.reload(db)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", contar)
+
+    if args.via == "api":
+        import httpx
+        from backend.app.agents.checkpoints import ejecuciones
+        from backend.app.main import app, get_db
+
+        # Como en la API: el grafo con checkpoints (USAR_CHECKPOINTS=0 para medir sin ellos)
+        ejecuciones.path = os.path.join(os.path.dirname(ruta_db), "bench_checkpoints.db")
+        await ejecuciones.abrir()
+        graph = orchestrator.build_graph(args.modo, checkpointer=ejecuciones.checkpointer)
+
+        async def get_db_benchmark():
+            async with session_factory() as db:
+                yield db
+
+        app.dependency_overrides[get_db] = get_db_benchmark
+        app.state.graph = graph
+        cliente = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark")
+
+        async def evaluar(paciente_id):
+            respuesta = await cliente.post(f"/evaluar-perfil/{paciente_id}")
+            respuesta.raise_for_status()
+    else:
+        async def evaluar(paciente_id):
+            async with session_factory() as db:
+                await graph.ainvoke(
+                    {"patient_id": paciente_id},
+                    config={"configurable": {"db": db}, "max_concurrency": orchestrator.MAX_CONCURRENCY},
+                )
+
+    semaforo = asyncio.Semaphore(args.concurrencia)
+    latencias = []
+    errores = 0
+
+    async def medir(paciente_id):
+        nonlocal errores
+        async with semaforo:
+            inicio = time.perf_counter()
+            try:
+                await evaluar(paciente_id)
+            except Exception as error:
+                errores += 1
+                print(f"{paciente_id}: {error}", file=sys.stderr)
+                return
+            latencias.append((time.perf_counter() - inicio) * 1000)
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    inicio_total = time.perf_counter()
+    await asyncio.gather(*(medir(pid) for pid in paciente_ids))
+    duracion = time.perf_counter() - inicio_total
+    pico_python = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+
+    if args.via == "api":
+        await cliente.aclose()
+        await ejecuciones.cerrar()
+    await engine.dispose()
+
+    latencias.sort()
+    return {
+        "commit": commit_actual(),
+        "fecha": datetime.now(timezone.utc).isoformat(),
+        "parametros": {k: v for k, v in vars(args).items() if k not in ("salida", "comparar")},
+        "resultados": {
+            "pacientes": len(paciente_ids),
+            "errores": errores,
+            "duracion_s": round(duracion, 3),
+            "throughput_pacientes_s": round(len(latencias) / duracion, 2) if duracion else None,
+            "latencia_ms": {
+                "p50": round(percentil(latencias, 50), 2),
+                "p95": round(percentil(latencias, 95), 2),
+                "p99": round(percentil(latencias, 99), 2),
+                "max": round(latencias[-1], 2),
+            } if latencias else None,
+            "consultas_bd": consultas[0],
+            "consultas_bd_por_paciente": round(consultas[0] / len(paciente_ids), 2),
+            "llamadas_llm": fake.llamadas,
+            "llamadas_llm_por_paciente": round(fake.llamadas / len(paciente_ids), 2),
+            "tokens_entrada_por_llamada": round(fake.tokens_entrada / fake.llamadas, 1) if fake.llamadas else None,
+            "cache": verdict_cache.stats(),
+            # ru_maxrss esta en KB en Linux
+            "memoria_max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "memoria_pico_python_mb": round(pico_python / 1024 / 1024, 1) if pico_python is not None else None,
+        },
+    }
+
+
+def comparar(actual, ruta_previa):
+    """Muestra la variacion de las metricas principales contra un resultado anterior."""
+    with open(ruta_previa, encoding="utf-8") as f:
+        previo = json.load(f)
+
+    a, b = previo["resultados"], actual["resultados"]
+    metricas = [
+        ("throughput_pacientes_s", a.get("throughput_pacientes_s"), b.get("throughput_pacientes_s")),
+        ("latencia p50", (a.get("latencia_ms") or {}).get("p50"), (b.get("latencia_ms") or {}).get("p50")),
+        ("latencia p95", (a.get("latencia_ms") or {}).get("p95"), (b.get("latencia_ms") or {}).get("p95")),
+        ("latencia p99", (a.get("latencia_ms") or {}).get("p99"), (b.get("latencia_ms") or {}).get("p99")),
+        ("consultas_bd_por_paciente", a.get("consultas_bd_por_paciente"), b.get("consultas_bd_por_paciente")),
+        ("llamadas_llm_por_paciente", a.get("llamadas_llm_por_paciente"), b.get("llamadas_llm_por_paciente")),
+        ("tokens_entrada_por_llamada", a.get("tokens_entrada_por_llamada"), b.get("tokens_entrada_por_llamada")),
+        ("memoria_max_rss_mb", a.get("memoria_max_rss_mb"), b.get("memoria_max_rss_mb")),
+    ]
+    print(f"\nComparacion contra {previo.get('commit')} ({ruta_previa}):")
+    for nombre, antes, ahora in metricas:
+        if antes is None or ahora is None:
+            continue
+        cambio = f"{(ahora - antes) / antes * 100:+.1f}%" if antes else "n/a"
+        print(f"  {nombre:28} {antes:>12} -> {ahora:>12}  ({cambio})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline del evaluador con un LLM falso")
+    parser.add_argument("--pacientes", type=int, default=100, help="Pacientes sinteticos (10 a 100000)")
+    parser.add_argument("--via", choices=["grafo", "api"], default="grafo", help="Invocar el grafo o el endpoint")
+    parser.add_argument("--modo", choices=["react", "structured"], default="react", help="Modo del evaluador")
+    parser.add_argument("--prompt", choices=["completo", "compacto"], default="completo", help="Variante del prompt del agente ReAct")
+    parser.add_argument("--concurrencia", type=int, default=32, help="Pacientes evaluandose a la vez")
+    parser.add_argument("--latencia-ms", type=float, default=300.0, help="Latencia simulada por llamada al LLM")
+    parser.add_argument("--tokens-salida", type=int, default=40, help="Tokens de salida por llamada al LLM")
+    parser.add_argument("--pasos-react", type=int, default=2, help="Herramientas por prueba antes de responder")
+    parser.add_argument("--rpm", type=int, default=0, help="Limite de peticiones por minuto del gateway (0: sin limite)")
+    parser.add_argument("--tpm", type=int, default=0, help="Limite de tokens por minuto del gateway (0: sin limite)")
+    parser.add_argument("--con-cache", action="store_true", help="No vaciar el cache de veredictos al empezar")
+    parser.add_argument("--tracemalloc", action="store_true", help="Medir el pico de memoria de Python (mas lento)")
+    parser.add_argument("--db", help="Base sintetica a reutilizar (se genera si no existe)")
+    parser.add_argument("--salida", default="benchmark_resultados.json", help="Archivo JSON de resultados")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior para comparar")
+    args = parser.parse_args()
+
+    resultado = asyncio.run(ejecutar(args))
+
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+
+    print(json.dumps(resultado["resultados"], ensure_ascii=False, indent=2))
+    print(f"Resultados guardados en {args.salida}")
+
+    if args.comparar:
+        comparar(resultado, args.comparar)
+
+
+if __name__ == "__main__":
+    main()
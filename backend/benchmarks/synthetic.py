@@ -0,0 +1,104 @@
+"""
+Genera una base SQLite sintetica con N pacientes, sus resultados y los
+criterios de varios perfiles, para medir el pipeline a distintas escalas.
+
+Uso: python -m backend.benchmarks.synthetic --pacientes 10000 --salida bench.db
+"""
+import argparse
+import random
+import time
+
+from sqlalchemy import create_engine, insert
+
+from backend.app.database.models import Base, Criterio, Paciente, Resultado
+from backend.app.database.valores import columnas_valor
+
+EMPRESA = "EMPRESA SINTETICA SAC"
+
+# Mezcla de pruebas que resuelve el motor de reglas y pruebas de texto para el agente
+PRUEBAS = {
+    "Índice de Masa Corporal (IMC)": {
+        "apto": "IMC entre 18.5 y 24.9",
+        "observado": "IMC entre 25.0 y 34.9 o IMC <18.5",
+        "no_apto": "IMC > 35",
+        "valor": lambda r: f"{r.uniform(16, 40):.1f} kg/m²",
+    },
+    "Glucosa": {
+        "apto": "Entre 70 y 110 mg/dl",
+        "observado": "Entre 111 y 125 mg/dl o < 70 mg/dl",
+        "no_apto": "> 125 mg/dl",
+        "valor": lambda r: f"{r.randint(60, 160)} mg/dl",
+    },
+    "Colesterol Total": {
+        "apto": "1) Normal (<200 mg/dl) \n 2) Solo para visitas:< 240 mg/dl sin factores de riesgo concomitante",
+        "observado": "Entre 200 y 239 mg/dl",
+        "no_apto": ">= 240 mg/dl con sintomatología cardiovascular",
+        "valor": lambda r: f"{r.randint(150, 280)} mg/dl",
+    },
+    "Examen Psicológico": {
+        "apto": "Normal",
+        "observado": "Alteraciones psicológicas menores",
+        "no_apto": "Alteraciones psicológicas que influyan significativamente en el puesto",
+        "valor": lambda r: r.choice(["Normal", "Normal", "Normal", "Ansiedad leve", "Baremos en rango leve"]),
+    },
+    "Audiometría": {
+        "apto": "Normal",
+        "observado": "Hipoacusia leve",
+        "no_apto": "Hipoacusia moderada o severa",
+        "valor": lambda r: r.choice(["Normal", "Sin alteraciones", "Hipoacusia leve", "Hipoacusia moderada"]),
+    },
+}
+
+PERFILES = {
+    "PERFIL A: Operario": ["Índice de Masa Corporal (IMC)", "Glucosa", "Examen Psicológico"],
+    "PERFIL B: Conductor": ["Índice de Masa Corporal (IMC)", "Glucosa", "Colesterol Total", "Audiometría"],
+    "PERFIL C: Administrativo": ["Índice de Masa Corporal (IMC)", "Examen Psicológico"],
+}
+
+
+def generar(url: str, pacientes: int, semilla: int = 42, lote: int = 5000):
+    """Crea las tablas y las llena con datos reproducibles (misma semilla, mismos datos)."""
+    azar = random.Random(semilla)
+    engine = create_engine(url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+    with engine.begin() as conexion:
+        conexion.execute(insert(Criterio), [
+            {"empresa": EMPRESA, "perfil": perfil, "nombre_prueba": prueba,
+             "apto": PRUEBAS[prueba]["apto"], "observado": PRUEBAS[prueba]["observado"],
+             "no_apto": PRUEBAS[prueba]["no_apto"]}
+            for perfil, pruebas in PERFILES.items() for prueba in pruebas
+        ])
+
+        perfiles = list(PERFILES)
+        ahora = time.time()
+        for inicio in range(0, pacientes, lote):
+            filas_pacientes = []
+            filas_resultados = []
+            for n in range(inicio, min(inicio + lote, pacientes)):
+                perfil = perfiles[n % len(perfiles)]
+                filas_pacientes.append({
+                    "id": n + 1, "paciente_id": f"S{n + 1:06d}", "empresa": EMPRESA, "perfil": perfil,
+                    "puesto_ocupacional": perfil.split(": ")[1], "sexo": azar.choice(["Masculino", "Femenino"]),
+                    "tipo_examen": "INGRESO", "actualizado_en": ahora,
+                })
+                for prueba in PERFILES[perfil]:
+                    valor = PRUEBAS[prueba]["valor"](azar)
+                    # Las mismas columnas normalizadas que escribe la ingesta
+                    filas_resultados.append({"paciente_id": n + 1, "nombre_prueba": prueba, "valor": valor, **columnas_valor(valor)})
+            conexion.execute(insert(Paciente), filas_pacientes)
+            conexion.execute(insert(Resultado), filas_resultados)
+
+    engine.dispose()
+    return [f"S{n + 1:06d}" for n in range(pacientes)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera datos sinteticos para benchmarks")
+    parser.add_argument("--pacientes", type=int, default=1000)
+    parser.add_argument("--salida", default="bench.db")
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args()
+    generar(f"sqlite:///{args.salida}", args.pacientes, args.semilla)
+    print(f"Base sintetica con {args.pacientes} pacientes en {args.salida}")
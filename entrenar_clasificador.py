@@ -0,0 +1,45 @@
+import argparse
+import json
+
+from dotenv import load_dotenv
+
+# La ruta del modelo y el umbral se leen del entorno al importar los modulos
+load_dotenv()
+
+from backend.app.agents.clasificador import (
+    CLASIFICADOR_MIN_EJEMPLOS, CLASIFICADOR_PATH, CLASIFICADOR_UMBRAL, cargar_ejemplos, entrenar_modelos, guardar_modelos, reporte,
+)
+from backend.app.database.database import engine, init_db
+from backend.app.observability import configurar_logging
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Entrena el clasificador local de hallazgos de texto con los veredictos guardados del agente"
+    )
+    parser.add_argument("--salida", default=CLASIFICADOR_PATH, help="Archivo del modelo que carga la API")
+    parser.add_argument("--umbral", type=float, default=CLASIFICADOR_UMBRAL, help="Confianza minima para decidir sin el agente")
+    parser.add_argument("--min-ejemplos", type=int, default=CLASIFICADOR_MIN_EJEMPLOS, help="Veredictos minimos para generalizar a textos nuevos")
+    parser.add_argument("--pliegues", type=int, default=5, help="Pliegues de la validacion cruzada del reporte")
+    parser.add_argument("--reporte", help="Guardar el reporte de precision y cobertura en este JSON")
+    parser.add_argument("--solo-reporte", action="store_true", help="Medir sin reemplazar el modelo actual")
+    args = parser.parse_args()
+
+    configurar_logging()
+    init_db()
+
+    ejemplos = cargar_ejemplos(engine)
+    if not ejemplos:
+        parser.exit(1, "No hay veredictos del agente para hallazgos de texto: evalue pacientes primero\n")
+
+    resultado = reporte(ejemplos, args.umbral, args.pliegues, args.min_ejemplos)
+    print(json.dumps(resultado, ensure_ascii=False, indent=2))
+    if args.reporte:
+        with open(args.reporte, "w", encoding="utf-8") as archivo:
+            json.dump(resultado, archivo, ensure_ascii=False, indent=2)
+
+    if not args.solo_reporte:
+        modelos = entrenar_modelos(ejemplos)
+        guardar_modelos(modelos, args.salida)
+        print(f"{len(modelos)} modelos entrenados con {len(ejemplos)} veredictos en {args.salida}")
+        print("La API los toma al reiniciar o con POST /clasificador/recargar")
@@ -0,0 +1,60 @@
+import argparse
+import asyncio
+import json
+import sys
+
+from dotenv import load_dotenv
+
+# La configuracion (y la API key del LLM) se lee del entorno al importar los modulos
+load_dotenv()
+
+from backend.app.database.database import AsyncSessionLocal
+from backend.app.agents.batch import cargar_lote, ejecutar_lote
+from backend.app.agents.orchestrator import MAX_CONCURRENCY
+from backend.app.observability import configurar_logging
+
+
+async def evaluar(args):
+    """
+    Evalua un lote de pacientes y escribe un resultado NDJSON por paciente
+    y un archivo de resumen al terminar.
+    """
+    paciente_ids = args.ids.split(",") if args.ids else None
+
+    async with AsyncSessionLocal() as db:
+        lote = await cargar_lote(db, args.empresa, args.perfil, paciente_ids)
+
+    print(f"Evaluando {len(lote.pacientes)} pacientes...", file=sys.stderr)
+
+    salida = open(args.salida, "w", encoding="utf-8") if args.salida else sys.stdout
+    try:
+        async for resultado in ejecutar_lote(lote, args.concurrencia):
+            salida.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+            salida.flush()
+    finally:
+        if salida is not sys.stdout:
+            salida.close()
+
+    with open(args.resumen, "w", encoding="utf-8") as f:
+        json.dump(dict(lote.resumen), f, ensure_ascii=False, indent=2)
+
+    print(f"Resumen guardado en {args.resumen}: {dict(lote.resumen)}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluacion masiva de pacientes")
+    parser.add_argument("--empresa", help="Evaluar todos los pacientes de esta empresa")
+    parser.add_argument("--perfil", help="Evaluar todos los pacientes de este perfil")
+    parser.add_argument("--ids", help="Lista de paciente_id separados por coma (ej: P001,P002)")
+    parser.add_argument("--concurrencia", type=int, default=MAX_CONCURRENCY, help="Evaluaciones simultaneas")
+    parser.add_argument("--salida", help="Archivo NDJSON de resultados (por defecto, la salida estandar)")
+    parser.add_argument("--resumen", default="resumen_lote.json", help="Archivo JSON con el resumen del lote")
+    args = parser.parse_args()
+
+    if not (args.empresa or args.perfil or args.ids):
+        parser.error("Indique --empresa, --perfil o --ids")
+    if args.concurrencia < 1:
+        parser.error("--concurrencia debe ser al menos 1")
+
+    configurar_logging()
+    asyncio.run(evaluar(args))
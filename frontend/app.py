@@ -1,67 +1,218 @@
+import os
 import streamlit as st
 import requests
 import json
 
+API_URL = os.getenv("API_URL", "http://127.0.0.1:8000")
+PACIENTES_POR_PAGINA = 50
+
 st.set_page_config(page_title="Agente Médigo", layout="wide")
 
 st.title("Analizador Médica con agentes de IA")
 
 st.info("Seleccciona un paciente y el Agente evaluará todas sus pruebas")
 
+
+@st.cache_resource
+def respuestas_guardadas():
+    """(ETag, datos) por URL, compartido entre sesiones: para revalidar con If-None-Match."""
+    return {}
+
+
+def get_condicional(ruta, params=None):
+    """GET que reutiliza la respuesta anterior si la API contesta 304 (no cambio)."""
+    clave = ruta + "?" + "&".join(f"{k}={v}" for k, v in sorted((params or {}).items()) if v)
+    guardada = respuestas_guardadas().get(clave)
+    cabeceras = {"If-None-Match": guardada[0]} if guardada else {}
+    response = requests.get(f"{API_URL}{ruta}", params=params, headers=cabeceras, timeout=10)
+    if response.status_code == 304 and guardada:
+        return guardada[1]
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    datos = response.json()
+    if response.headers.get("ETag"):
+        respuestas_guardadas()[clave] = (response.headers["ETag"], datos)
+    return datos
+
+
+# Cada rerun de Streamlit (cualquier clic) vuelve a ejecutar el script: dentro
+# del ttl las paginas salen de memoria y despues se revalidan con el ETag
+@st.cache_data(ttl=30, show_spinner=False)
+def pagina_pacientes(empresa, perfil, tipo_examen, buscar, despues):
+    return get_condicional("/pacientes", {
+        "empresa": empresa, "perfil": perfil, "tipo_examen": tipo_examen,
+        "buscar": buscar, "despues": despues, "limite": PACIENTES_POR_PAGINA,
+    })
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def filtros_pacientes():
+    return get_condicional("/pacientes/filtros") or []
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def evaluacion_guardada(paciente_id):
+    return get_condicional(f"/evaluaciones/{paciente_id}")
+
+
+try:
+    filtros = filtros_pacientes()
+except requests.exceptions.RequestException:
+    st.error("No se puedo conectar con el backend")
+    st.stop()
+
+col_empresa, col_perfil, col_tipo, col_buscar = st.columns(4)
+empresa = col_empresa.selectbox("Empresa", [None] + sorted({f["empresa"] for f in filtros}), format_func=lambda v: v or "Todas")
+perfil = col_perfil.selectbox(
+    "Perfil", [None] + sorted({f["perfil"] for f in filtros if f["empresa"] == empresa or empresa is None}),
+    format_func=lambda v: v or "Todos",
+)
+tipo_examen = col_tipo.selectbox("Tipo de examen", [None] + sorted({f["tipo_examen"] for f in filtros}), format_func=lambda v: v or "Todos")
+buscar = col_buscar.text_input("Buscar por ID", placeholder="P00").strip() or None
+
+# Paginacion por clave: guardamos el cursor (`despues`) de cada pagina visitada
+consulta = (empresa, perfil, tipo_examen, buscar)
+if st.session_state.get("consulta") != consulta:
+    st.session_state.consulta = consulta
+    st.session_state.cursores = [None]
+cursores = st.session_state.cursores
+
+try:
+    pagina = pagina_pacientes(*consulta, cursores[-1])
+except requests.exceptions.RequestException:
+    st.error("No se puedo conectar con el backend")
+    st.stop()
+
+if not pagina["pacientes"]:
+    st.warning("No hay pacientes con esos filtros.")
+    st.stop()
+
+col_anterior, col_pagina, col_siguiente = st.columns([1, 4, 1])
+if col_anterior.button("← Anterior", disabled=len(cursores) == 1):
+    cursores.pop()
+    st.rerun()
+col_pagina.caption(f"Pagina {len(cursores)}: {pagina['pacientes'][0]['paciente_id']} a {pagina['pacientes'][-1]['paciente_id']}")
+if col_siguiente.button("Siguiente →", disabled=pagina["siguiente"] is None):
+    cursores.append(pagina["siguiente"])
+    st.rerun()
+
+pacientes = {p["paciente_id"]: p for p in pagina["pacientes"]}
 paciente_id = st.selectbox(
     "Seleccione un Paciente para una evaluacion completa",
-    ("P001", "P002", "P003", "P004"),
+    list(pacientes),
     index = 0,
+    format_func=lambda p: f"{p} · {pacientes[p]['perfil']} ({pacientes[p]['tipo_examen']})",
     help="El sistema buscará todas las pruebas necesarias para el perfil de este paciente"
 )
 
 
-if st.button(f"Iniciar evaluación para {paciente_id}"):
-    api_url = f"http://127.0.0.1:8000/evaluar-perfil/{paciente_id}"
+ORIGENES = {
+    "rule": "Decidido por reglas", "cache": "Veredicto reutilizado del cache", "missing": "Sin resultado registrado",
+    "classifier": "Decidido por el clasificador local (veredictos anteriores del agente)",
+    "stored": "Sin cambios desde la evaluacion anterior",
+    "fallback": "Evaluador no disponible: requiere revision manual",
+    "error": "Fallo la evaluacion: se reintenta al volver a evaluar",
+}
 
-    with st.spinner(f"El agente esta analizando el paciente {paciente_id}..."):
-        try:
-            response = requests.post(api_url)
 
-            if response.status_code == 200:
-                data = response.json()
-                st.success("Evaluación Completada.")
+def leer_eventos_sse(response):
+    """Convierte el stream de Server-Sent Events en tuplas (evento, datos)."""
+    evento, datos = None, []
+    for linea in response.iter_lines(decode_unicode=True):
+        if linea.startswith("event:"):
+            evento = linea[len("event:"):].strip()
+        elif linea.startswith("data:"):
+            datos.append(linea[len("data:"):].strip())
+        elif not linea and evento:
+            yield evento, json.loads("\n".join(datos))
+            evento, datos = None, []
 
-                veredicto_general = data.get("veredicto_general", "N/A")
-                evaluaciones = data.get("evaluaciones", [])
 
-                st.subheader("Veredicto General")
+def mostrar_veredicto(contenedor, veredicto_general):
+    with contenedor:
+        if "No Apto" in veredicto_general:
+            st.error(f"**{veredicto_general}**")
+        elif "Observado" in veredicto_general:
+            st.warning(f"**{veredicto_general}**")
+        elif "Pendiente" in veredicto_general:
+            st.info(f"**{veredicto_general}**: alguna prueba fallo, vuelva a evaluar para completarla")
+        else:
+            st.success(f"**{veredicto_general}**")
 
-                col1, col2 = st.columns([1, 4])
 
-                with col1:
-                    if "No Apto" in veredicto_general:
-                        st.error(f"**{veredicto_general}**")
-                    elif "Observado" in veredicto_general:
-                        st.warning(f"**{veredicto_general}**")
-                    else:
-                        st.success(f"**{veredicto_general}**")
-                st.subheader("Desglose de Resultado por prueba")
+def mostrar_evaluacion(contenedor, evaluacion):
+    with contenedor.container():
+        st.metric(
+            label = evaluacion.get("prueba", "Prueba Desconocida"),
+            value= evaluacion.get("resultado", "N/A")
+        )
+        st.caption(ORIGENES.get(evaluacion.get("origen"), "Decidido por el agente"))
+        with st.expander("Ver razonamiento del agente"):
+            st.text(evaluacion.get("razonamiento", "No disponible."))
 
-                if not evaluaciones:
-                    st.warning("No se encontrarion evaluaciones individuales.")
-                else:
-                    cols = st.columns(len(evaluaciones))
-                    for i, evaluacion in enumerate(evaluaciones):
-                        with cols[i]:
-                            # resultado = evaluacion.get("resultado", "N/A")
-                            st.metric(
-                                label = evaluacion.get("prueba", "Prueba Desconocida"),
-                                value= evaluacion.get("resultado", "N/A")
-                            )
-                            with st.expander("Ver razonamiento del agente"):
-                                st.text(evaluacion.get("razonamiento", "No disponible."))
-                
-            else:
+
+if st.button(f"Iniciar evaluación para {paciente_id}"):
+    # Recibimos cada prueba apenas termina, en lugar de esperar toda la evaluacion
+    api_url = f"{API_URL}/evaluar-perfil/{paciente_id}/eventos"
+
+    estado = st.empty()
+    estado.info(f"El agente esta analizando el paciente {paciente_id}...")
+
+    try:
+        with requests.get(api_url, stream=True, timeout=(5, None)) as response:
+            if response.status_code != 200:
                 st.error(f"Error en la API: {response.status_code}")
                 try:
                     st.json(response.json())
-                except json.JSONDecoderError:
+                except json.JSONDecodeError:
                     st.text(response.text)
-        except requests.exceptions.ConnectionError:
-            st.error("No se puedo conectar con el backend")
\ No newline at end of file
+            else:
+                st.subheader("Veredicto General")
+                col1, col2 = st.columns([1, 4])
+                veredicto = col1.empty()
+                veredicto.caption("Pendiente...")
+
+                st.subheader("Desglose de Resultado por prueba")
+                progreso = st.progress(0.0)
+                huecos = {}
+                terminadas = set()
+
+                for evento, datos in leer_eventos_sse(response):
+                    if evento == "inicio":
+                        pruebas = datos.get("pruebas", [])
+                        if not pruebas:
+                            st.warning("No se encontrarion evaluaciones individuales.")
+                        else:
+                            cols = st.columns(len(pruebas))
+                            for col, prueba in zip(cols, pruebas):
+                                huecos[prueba] = col.empty()
+                                huecos[prueba].caption(f"{prueba}: evaluando...")
+                    elif evento == "prueba":
+                        terminadas.add(datos.get("prueba"))
+                        hueco = huecos.get(datos.get("prueba")) or st.empty()
+                        mostrar_evaluacion(hueco, datos)
+                        # st.progress solo acepta valores entre 0 y 1
+                        progreso.progress(min(len(terminadas) / max(len(huecos), 1), 1.0))
+                    elif evento == "veredicto":
+                        mostrar_veredicto(veredicto, datos.get("veredicto_general", "N/A"))
+                        estado.success("Evaluación Completada.")
+                        # La evaluacion guardada del paciente cambio
+                        evaluacion_guardada.clear()
+                    elif evento == "error":
+                        estado.error(f"Error en la evaluación: {datos.get('detalle')}")
+    except requests.exceptions.ConnectionError:
+        estado.error("No se puedo conectar con el backend")
+else:
+    # Sin volver a evaluar: la ultima evaluacion guardada (lectura por indice, cacheada)
+    try:
+        guardada = evaluacion_guardada(paciente_id)
+    except requests.exceptions.RequestException:
+        guardada = None
+    if guardada:
+        st.subheader("Ultima evaluación guardada")
+        col1, col2 = st.columns([1, 4])
+        mostrar_veredicto(col1, guardada["veredicto_general"])
+        cols = st.columns(max(len(guardada["evaluaciones"]), 1))
+        for col, evaluacion in zip(cols, guardada["evaluaciones"]):
+            mostrar_evaluacion(col.empty(), evaluacion)
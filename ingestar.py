@@ -0,0 +1,28 @@
+import argparse
+import json
+
+from backend.app.database.database import engine, init_db
+from backend.app.database.ingestion import TAMANO_LOTE, ingestar_criterios, ingestar_pacientes
+from backend.app.observability import configurar_logging
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Carga (o actualiza) pacientes y criterios en la base de datos")
+    parser.add_argument("--pacientes", help="Archivo JSON (arreglo) o NDJSON de pacientes con sus resultados")
+    parser.add_argument("--criterios", help="Archivo JSON de criterios (empresa -> perfil -> tipo de examen -> grupo -> prueba)")
+    parser.add_argument("--lote", type=int, default=TAMANO_LOTE, help="Pacientes por transaccion")
+    parser.add_argument("--completa", action="store_true", help="Reescribir todos los pacientes aunque no hayan cambiado")
+    args = parser.parse_args()
+
+    if not (args.pacientes or args.criterios):
+        parser.error("Indique --pacientes y/o --criterios")
+
+    configurar_logging()
+    init_db()
+
+    if args.criterios:
+        resumen = ingestar_criterios(engine, args.criterios, args.lote)
+        print(f"Criterios: {json.dumps(resumen.as_dict(), ensure_ascii=False)}")
+    if args.pacientes:
+        resumen = ingestar_pacientes(engine, args.pacientes, args.lote, incremental=not args.completa)
+        print(f"Pacientes: {json.dumps(resumen.as_dict(), ensure_ascii=False)}")
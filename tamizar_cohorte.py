@@ -0,0 +1,30 @@
+import argparse
+import json
+
+from backend.app.agents.cohort import tamizar
+from backend.app.database.database import engine
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-evalua con reglas todos los resultados contra los criterios actuales")
+    parser.add_argument("--empresa", help="Solo los pacientes de esta empresa")
+    parser.add_argument("--perfil", help="Solo los pacientes de este perfil")
+    parser.add_argument("--salida", default="tamizaje_pacientes.csv", help="CSV con el veredicto consolidado por paciente")
+    parser.add_argument("--pendientes", default="tamizaje_pendientes.csv", help="CSV con las pruebas que quedan para el agente")
+    parser.add_argument("--sin-cache", action="store_true", help="No completar las pruebas pendientes con el cache de veredictos ni el clasificador local")
+    args = parser.parse_args()
+
+    tamizaje = tamizar(engine, args.empresa, args.perfil, usar_cache=not args.sin_cache)
+    tamizaje.pacientes.to_csv(args.salida, index=False)
+    tamizaje.pendientes.to_csv(args.pendientes, index=False)
+
+    resumen = {
+        "pacientes": len(tamizaje.pacientes),
+        "pruebas": len(tamizaje.pruebas),
+        "segundos": round(tamizaje.segundos, 3),
+        "segundos_carga": round(tamizaje.segundos_carga, 3),
+        "veredictos": tamizaje.pacientes["veredicto_general"].value_counts(dropna=False).to_dict(),
+        "origenes": tamizaje.pruebas["origen"].value_counts().to_dict(),
+    }
+    print(json.dumps(resumen, ensure_ascii=False, indent=2, default=str))
+    print(f"Veredictos por paciente en {args.salida}, pruebas pendientes en {args.pendientes}")
@@ -0,0 +1,26 @@
+import os
+import tempfile
+
+import pytest
+
+# Las pruebas nunca llegan a OpenAI, y su cache de veredictos va aparte de la real
+os.environ.setdefault("OPENAI_API_KEY", "sk-test-offline")
+os.environ.setdefault("VERDICT_CACHE_PATH", os.path.join(tempfile.mkdtemp(), "veredictos.db"))
+
+from backend.benchmarks.synthetic import generar
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="module")
+def base_sintetica(tmp_path_factory):
+    """
+    Crea una base sintetica con `pacientes` pacientes; devuelve su ruta y los ids.
+    """
+    def crear(pacientes: int):
+        ruta = str(tmp_path_factory.mktemp("bd") / "sintetica.db")
+        return ruta, generar(f"sqlite:///{ruta}", pacientes)
+    return crear
@@ -0,0 +1,11 @@
+from backend.app.agents.batch import SIN_RESULTADO, clave_valor
+
+
+def test_clave_valor_usa_el_token_de_la_ingesta():
+    assert clave_valor("  24,5 Kg/m² ", "24.5 kg/m2") == "24.5 kg/m2"
+
+
+def test_clave_valor_sin_token_no_se_mezcla_con_las_pruebas_sin_resultado():
+    sin_token = clave_valor("Hipoacusia leve", None)
+    assert sin_token == clave_valor("hipoacusia   LEVE", None)
+    assert sin_token != clave_valor(None, None) == SIN_RESULTADO
@@ -0,0 +1,89 @@
+import time
+
+import pytest
+from sqlalchemy import create_engine, text, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from backend.app.agents.catalogo import listar_pacientes
+from backend.app.database.models import Paciente
+from backend.benchmarks.synthetic import EMPRESA, PERFILES
+
+pytestmark = pytest.mark.anyio
+
+LIMITE = 50
+
+
+@pytest.fixture
+def catalogo(base_sintetica):
+    ruta, ids = base_sintetica(400)
+    return create_engine(f"sqlite:///{ruta}"), ruta, ids
+
+
+@pytest.fixture
+async def sesiones(catalogo):
+    _, ruta, _ = catalogo
+    engine = create_async_engine(f"sqlite+aiosqlite:///{ruta}")
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
+
+
+async def recorrer(sesiones, **filtros):
+    ids, despues = [], None
+    async with sesiones() as db:
+        while True:
+            pagina = await listar_pacientes(db, despues=despues, limite=LIMITE, **filtros)
+            ids.extend(p["paciente_id"] for p in pagina.pacientes)
+            if pagina.siguiente is None:
+                return ids
+            despues = pagina.siguiente
+
+
+def plan(engine, sql: str) -> str:
+    with engine.connect() as conexion:
+        return " | ".join(fila[-1] for fila in conexion.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+
+
+async def test_recorrer_el_catalogo_devuelve_cada_paciente_una_vez_y_en_orden(catalogo, sesiones):
+    _, _, ids = catalogo
+    assert await recorrer(sesiones) == sorted(ids)
+
+
+async def test_con_filtro_de_empresa_y_perfil_salen_solo_sus_pacientes(catalogo, sesiones):
+    _, _, ids = catalogo
+    perfil = next(iter(PERFILES))
+    esperados = [i for n, i in enumerate(ids) if n % len(PERFILES) == 0]
+    assert await recorrer(sesiones, empresa=EMPRESA, perfil=perfil) == esperados
+
+
+def test_las_paginas_usan_los_indices_del_catalogo_sin_ordenar_en_memoria(catalogo):
+    engine, _, ids = catalogo
+    perfil = next(iter(PERFILES))
+    consulta = plan(engine, (
+        f"SELECT paciente_id FROM pacientes WHERE empresa = '{EMPRESA}' AND perfil = '{perfil}' "
+        f"AND paciente_id > '{ids[-LIMITE]}' ORDER BY paciente_id LIMIT {LIMITE + 1}"
+    ))
+    assert "ix_paciente_catalogo" in consulta and "TEMP B-TREE" not in consulta, consulta
+    consulta = plan(engine, (
+        f"SELECT paciente_id FROM pacientes WHERE empresa = '{EMPRESA}' AND paciente_id > '{ids[-LIMITE]}' "
+        f"ORDER BY paciente_id LIMIT {LIMITE + 1}"
+    ))
+    assert "ix_paciente_empresa" in consulta and "TEMP B-TREE" not in consulta, consulta
+
+
+async def test_el_etag_solo_cambia_en_la_pagina_del_paciente_que_cambio(catalogo, sesiones):
+    engine, _, ids = catalogo
+    async with sesiones() as db:
+        pagina_1 = await listar_pacientes(db, limite=LIMITE)
+        pagina_2 = await listar_pacientes(db, limite=LIMITE, despues=pagina_1.siguiente)
+        assert pagina_1.etag == (await listar_pacientes(db, limite=LIMITE)).etag
+
+    with engine.begin() as conexion:
+        conexion.execute(
+            update(Paciente).where(Paciente.paciente_id == ids[0]).values(huella_datos="cambiada", actualizado_en=time.time() + 60)
+        )
+    async with sesiones() as db:
+        nueva_1 = await listar_pacientes(db, limite=LIMITE)
+        nueva_2 = await listar_pacientes(db, limite=LIMITE, despues=nueva_1.siguiente)
+    assert nueva_1.etag != pagina_1.etag
+    assert nueva_1.ultima_modificacion > pagina_1.ultima_modificacion
+    assert nueva_2.etag == pagina_2.etag
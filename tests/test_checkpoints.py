@@ -0,0 +1,135 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from backend.app.agents import orchestrator
+from backend.app.agents.checkpoints import COMPLETADA, INTERRUMPIDA, PARCIAL, EjecucionEnCurso, Ejecuciones
+from backend.benchmarks.synthetic import PERFILES, PRUEBAS
+
+pytestmark = pytest.mark.anyio
+
+PACIENTE, PRUEBAS_PACIENTE = "S000002", PERFILES["PERFIL B: Conductor"]
+
+
+class Corte(BaseException):
+    """Simula que el proceso muere a mitad de la evaluacion (no lo atrapa ningun `except Exception`)."""
+
+
+class AgenteDePrueba:
+    """Sustituye al agente: cuenta llamadas por prueba y falla o corta en las pruebas indicadas."""
+
+    def __init__(self, criterios: dict):
+        self.prueba_de = {json.dumps({"apto": c["apto"], "observado": c["observado"], "no_apto": c["no_apto"]}): p for p, c in criterios.items()}
+        self.llamadas = []
+        self.fallar, self.cortar = set(), set()
+
+    async def ainvoke(self, input_data, config=None):
+        prueba = self.prueba_de[input_data["criterios_json"]]
+        self.llamadas.append(prueba)
+        if prueba in self.cortar:
+            # Las demas ramas terminan antes del corte
+            await asyncio.sleep(0.2)
+            raise Corte(prueba)
+        await asyncio.sleep(0.01)
+        if prueba in self.fallar:
+            raise TimeoutError(f"El LLM no respondio para {prueba}")
+        return {"output": "Apto", "intermediate_steps": []}
+
+
+@pytest.fixture
+async def entorno(base_sintetica, tmp_path, monkeypatch):
+    # Todas las pruebas van al agente (sin reglas, cache ni clasificador) y no se reutiliza la evaluacion guardada
+    ruta, _ = base_sintetica(3)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{ruta}")
+    sesiones = async_sessionmaker(engine, expire_on_commit=False)
+    agente = AgenteDePrueba({p: PRUEBAS[p] for p in PRUEBAS_PACIENTE})
+    monkeypatch.setattr(orchestrator, "evaluation_agent_executor", agente)
+    monkeypatch.setattr(orchestrator, "quick_verdict", lambda *args, **kwargs: None)
+
+    ejecuciones = Ejecuciones(str(tmp_path / "checkpoints.db"))
+    await ejecuciones.abrir()
+    graph = orchestrator.build_graph("react", checkpointer=ejecuciones.checkpointer)
+
+    async def evaluar(**kwargs):
+        agente.llamadas.clear()
+        async with sesiones() as db:
+            config = {"configurable": {"db": db, "reutilizar": False}}
+            return await ejecuciones.ejecutar(graph, PACIENTE, config, **kwargs)
+
+    yield SimpleNamespace(agente=agente, ejecuciones=ejecuciones, graph=graph, sesiones=sesiones, evaluar=evaluar)
+    await ejecuciones.cerrar()
+    await engine.dispose()
+
+
+async def test_una_prueba_que_falla_no_corta_la_evaluacion_y_es_la_unica_que_se_repite(entorno):
+    entorno.agente.fallar = {"Audiometría"}
+    ejecucion, estado = await entorno.evaluar(nueva=True)
+    resultado = estado["test_results"]
+    assert len(resultado) == len(PRUEBAS_PACIENTE)
+    assert resultado["Audiometría"]["verdict"] == "Pendiente" and resultado["Audiometría"]["source"] == "error"
+    assert estado["final_veredict"] == "Pendiente"
+    registro = await entorno.ejecuciones.obtener(PACIENTE, ejecucion)
+    assert registro["estado"] == PARCIAL and registro["pruebas_fallidas"] == ["Audiometría"]
+
+    entorno.agente.fallar = set()
+    reanudada, estado = await entorno.evaluar()
+    assert reanudada == ejecucion
+    assert entorno.agente.llamadas == ["Audiometría"]
+    assert estado["final_veredict"] == "Apto"
+    registro = await entorno.ejecuciones.obtener(PACIENTE, ejecucion)
+    assert registro["estado"] == COMPLETADA and registro["intentos"] == 2
+    # Al completarse su checkpoint se borra
+    snapshot = await entorno.graph.aget_state({"configurable": {"thread_id": registro["thread_id"]}})
+    assert not snapshot.values
+
+
+async def test_una_ejecucion_cortada_se_reanuda_sin_repetir_las_ramas_que_terminaron(entorno):
+    entorno.agente.cortar = {"Colesterol Total"}
+    with pytest.raises(Corte):
+        await entorno.evaluar(nueva=True)
+    ejecucion = (await entorno.ejecuciones.listar(PACIENTE, 1))[0]["ejecucion"]
+    estado = await entorno.ejecuciones.estado(entorno.graph, PACIENTE, ejecucion)
+    assert estado["estado"] == INTERRUMPIDA
+    assert sorted(estado["test_results"]) == sorted(p for p in PRUEBAS_PACIENTE if p != "Colesterol Total")
+    assert estado["siguientes_pasos"] == ["run_agent"]
+
+    entorno.agente.cortar = set()
+    reanudada, estado = await entorno.evaluar()
+    assert reanudada == ejecucion
+    assert entorno.agente.llamadas == ["Colesterol Total"]
+    assert estado["final_veredict"] == "Apto" and len(estado["test_results"]) == len(PRUEBAS_PACIENTE)
+
+
+async def test_una_ejecucion_nueva_evalua_todas_las_pruebas(entorno):
+    entorno.agente.fallar = {"Audiometría"}
+    await entorno.evaluar(nueva=True)
+    entorno.agente.fallar = set()
+    await entorno.evaluar(nueva=True)
+    assert len(entorno.agente.llamadas) == len(PRUEBAS_PACIENTE)
+
+
+async def test_dos_pedidos_a_la_vez_no_retoman_la_misma_ejecucion_pendiente(entorno):
+    entorno.agente.fallar = {"Audiometría"}
+    pendiente, _ = await entorno.evaluar(nueva=True)
+    entorno.agente.fallar = set()
+    elegidas = [ejecucion for ejecucion, _ in await asyncio.gather(entorno.evaluar(), entorno.evaluar())]
+    assert pendiente in elegidas and len(set(elegidas)) == 2
+
+
+async def test_una_ejecucion_en_curso_no_se_puede_reclamar_dos_veces(entorno):
+    en_curso, _, _ = await entorno.ejecuciones.preparar(entorno.graph, PACIENTE, {}, nueva=True)
+    with pytest.raises(EjecucionEnCurso):
+        await entorno.ejecuciones.preparar(entorno.graph, PACIENTE, {}, ejecucion=en_curso)
+    await entorno.ejecuciones.terminar(PACIENTE, en_curso, error=RuntimeError("fin de la prueba"))
+
+
+async def test_sin_checkpointer_la_prueba_fallida_tambien_queda_registrada(entorno):
+    entorno.agente.fallar = {"Glucosa"}
+    async with entorno.sesiones() as db:
+        estado = await orchestrator.build_graph("react").ainvoke(
+            {"patient_id": PACIENTE}, config={"configurable": {"db": db, "reutilizar": False}}
+        )
+    assert estado["test_results"]["Glucosa"]["source"] == "error"
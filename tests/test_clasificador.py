@@ -0,0 +1,105 @@
+import time
+
+import pytest
+from sqlalchemy import create_engine, insert, select
+
+from backend.app.agents import orchestrator
+from backend.app.agents.cache import hash_criterio
+from backend.app.agents.clasificador import (
+    ClasificadorLocal, cargar_ejemplos, entrenar_modelos, guardar_modelos, reporte,
+)
+from backend.app.agents.context import CriterioContext
+from backend.app.agents.history import hash_valor
+from backend.app.database.models import Criterio, Evaluacion, EvaluacionPrueba, Paciente, Resultado
+from backend.benchmarks.bench_clasificador import CRITERIO, ejemplos
+
+
+@pytest.fixture(scope="module")
+def modelos():
+    return entrenar_modelos(ejemplos(600))
+
+
+@pytest.fixture
+def local(modelos):
+    clasificador = ClasificadorLocal(path="", umbral=0.9, min_ejemplos=5)
+    clasificador.usar(modelos)
+    return clasificador
+
+
+def test_decide_sin_el_agente_la_mayoria_de_los_hallazgos_que_nunca_vio_y_acierta():
+    resultado = reporte(ejemplos(600), umbral=0.9)
+    assert resultado["precision"] >= 0.95
+    assert resultado["cobertura"] >= 0.5
+
+
+def test_decide_un_hallazgo_conocido_con_otras_palabras_alrededor(local):
+    resultado = local.predecir(CRITERIO, CRITERIO.nombre_prueba, "Hipoacusia moderada oído izquierdo")
+    assert resultado is not None and resultado["verdict"] == "No Apto"
+
+
+@pytest.mark.parametrize("valor", ["Otoscopia con tapón de cerumen", "35 dB"])
+def test_los_hallazgos_sin_palabras_conocidas_y_los_numeros_van_al_agente(local, valor):
+    assert local.predecir(CRITERIO, CRITERIO.nombre_prueba, valor) is None
+
+
+def test_con_el_criterio_editado_el_modelo_deja_de_usarse(local):
+    editado = CriterioContext(**{**CRITERIO.__dict__, "observado": "Hipoacusia leve o moderada"})
+    assert local.predecir(editado, editado.nombre_prueba, "Hipoacusia leve") is None
+
+
+def test_quick_verdict_usa_el_clasificador_antes_del_agente(modelos):
+    anterior = orchestrator.clasificador._modelos
+    orchestrator.clasificador.usar(modelos)
+    try:
+        rapido = orchestrator.quick_verdict(CRITERIO, CRITERIO.nombre_prueba, "Audición normal en ambos oídos")
+    finally:
+        orchestrator.clasificador.usar(anterior)
+    assert rapido is not None and rapido["source"] == "classifier" and rapido["verdict"] == "Apto"
+
+
+def test_el_entrenamiento_lee_solo_los_veredictos_vigentes_del_agente(base_sintetica, tmp_path):
+    ruta, _ = base_sintetica(300)
+    engine = create_engine(f"sqlite:///{ruta}")
+    with engine.begin() as conexion:
+        criterios = {(c.perfil, c.nombre_prueba): c for c in conexion.execute(select(Criterio)).all()}
+        filas = conexion.execute(
+            select(Paciente.paciente_id, Paciente.perfil, Resultado.nombre_prueba, Resultado.valor)
+            .join(Resultado, Resultado.paciente_id == Paciente.id)
+            .where(Resultado.nombre_prueba.in_(["Audiometría", "Examen Psicológico"]))
+        ).all()
+
+        esperados = 0
+        for n, fila in enumerate(filas):
+            criterio = criterios[(fila.perfil, fila.nombre_prueba)]
+            evaluacion_id = conexion.execute(
+                insert(Evaluacion).values(paciente_id=fila.paciente_id, veredicto_general="Apto", creado_en=time.time())
+            ).inserted_primary_key[0]
+            prueba = {
+                "evaluacion_id": evaluacion_id, "nombre_prueba": fila.nombre_prueba, "criterio_id": criterio.id,
+                "version_criterio": hash_criterio(criterio), "hash_valor": hash_valor(fila.valor),
+                "veredicto": "Apto" if fila.valor in ("Normal", "Sin alteraciones") else "Observado",
+                "origen": "agent", "reutilizada": False,
+            }
+            # Solo cuentan los veredictos del agente, con el criterio y el valor vigentes
+            variante = n % 5
+            if variante == 1:
+                prueba["reutilizada"] = True
+            elif variante == 2:
+                prueba["origen"] = "cache"
+            elif variante == 3:
+                prueba["version_criterio"] = "criterio-anterior"
+            else:
+                esperados += 1
+            conexion.execute(insert(EvaluacionPrueba).values(**prueba))
+
+    leidos = cargar_ejemplos(engine)
+    assert len(leidos) == esperados
+
+    # El modelo guardado se carga y decide igual
+    archivo = str(tmp_path / "modelo.json")
+    guardar_modelos(entrenar_modelos(leidos), archivo)
+    local = ClasificadorLocal(path=archivo, umbral=0.9, min_ejemplos=5)
+    local.recargar()
+    criterio = next(c for (_, prueba), c in criterios.items() if prueba == "Audiometría")
+    resultado = local.predecir(CriterioContext.from_model(criterio), "Audiometría", "Sin alteraciones")
+    assert resultado is not None and resultado["verdict"] == "Apto"
@@ -0,0 +1,48 @@
+from sqlalchemy import create_engine, update
+
+from backend.app.agents.cohort import tamizar
+from backend.app.agents.context import CriterioContext
+from backend.app.agents.rules import evaluar_con_reglas
+from backend.app.database.models import Resultado
+from backend.app.database.valores import columnas_valor
+from backend.benchmarks.synthetic import EMPRESA, PERFILES, PRUEBAS
+
+CRITERIOS = {
+    (perfil, prueba): CriterioContext(
+        id=0, empresa=EMPRESA, perfil=perfil, tipo_examen="INGRESO", nombre_prueba=prueba,
+        apto=PRUEBAS[prueba]["apto"], observado=PRUEBAS[prueba]["observado"], no_apto=PRUEBAS[prueba]["no_apto"],
+    )
+    for perfil, pruebas in PERFILES.items() for prueba in pruebas
+}
+
+
+def diferencias(tamizaje):
+    """Filas en las que el tamizaje vectorizado no da el veredicto del motor de reglas."""
+    distintas = []
+    for fila in tamizaje.pruebas.itertuples(index=False):
+        esperado = (evaluar_con_reglas(CRITERIOS[(fila.perfil, fila.nombre_prueba)], fila.valor) or {}).get("verdict")
+        obtenido = fila.veredicto if fila.origen == "rule" else None
+        if esperado != obtenido:
+            distintas.append((fila.paciente_id, fila.nombre_prueba, fila.valor, esperado, obtenido))
+    return distintas
+
+
+def test_el_tamizaje_vectorizado_da_los_veredictos_del_motor_de_reglas(base_sintetica):
+    ruta, _ = base_sintetica(2000)
+    tamizaje = tamizar(create_engine(f"sqlite:///{ruta}"), usar_cache=False)
+    assert len(tamizaje.pruebas) > 0
+    assert diferencias(tamizaje)[:10] == []
+
+
+def test_un_resultado_en_otra_unidad_que_la_del_criterio_queda_para_el_agente(base_sintetica):
+    ruta, _ = base_sintetica(50)
+    engine = create_engine(f"sqlite:///{ruta}")
+    with engine.begin() as conexion:
+        conexion.execute(
+            update(Resultado).where(Resultado.nombre_prueba == "Glucosa").values(valor="1.2 g/dl", **columnas_valor("1.2 g/dl"))
+        )
+
+    tamizaje = tamizar(engine, usar_cache=False)
+    glucosa = tamizaje.pruebas[tamizaje.pruebas["nombre_prueba"] == "Glucosa"]
+    assert len(glucosa) > 0 and (glucosa["origen"] == "pending").all()
+    assert diferencias(tamizaje)[:10] == []
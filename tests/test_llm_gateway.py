@@ -0,0 +1,126 @@
+import asyncio
+import json
+import statistics
+import time
+
+import pytest
+from langchain_core.messages import HumanMessage
+from langchain_openai import ChatOpenAI
+
+from backend.app.agents import orchestrator
+from backend.app.agents.cache import verdict_cache
+from backend.app.agents.context import CriterioContext
+from backend.app.agents.llm_gateway import (
+    ABIERTO, CERRADO, CircuitoAbierto, LLMNoDisponible, Planificador, Politica, crear_gateway,
+)
+from backend.app.agents.specialist import crear_agente_evaluador, crear_evaluador_estructurado
+from backend.benchmarks.llm_stub_server import iniciar
+
+pytestmark = pytest.mark.anyio
+
+MENSAJE = [HumanMessage("Información del caso:\nvalor 5\nInicia tu razonamiento:")]
+CRITERIO = CriterioContext(
+    id=0, empresa="STUB", perfil="STUB", tipo_examen="INGRESO", nombre_prueba="Examen de prueba",
+    apto="Sin hallazgos", observado="Hallazgos leves", no_apto="Hallazgos graves",
+)
+
+
+@pytest.fixture
+def servidor():
+    servidor = iniciar(latencia_ms=30)
+    yield servidor
+    servidor.shutdown()
+
+
+def gateway(servidor, rpm: int = 0, tpm: int = 0, **politica):
+    modelo = ChatOpenAI(model="stub", temperature=0, base_url=servidor.url, api_key="x", max_retries=0, timeout=10)
+    return crear_gateway(modelo, Politica(**{"backoff_base_s": 0.05, "backoff_max_s": 0.2, **politica}), rpm=rpm, tpm=tpm)
+
+
+async def latencias(llm, llamadas: int):
+    duraciones = []
+    for _ in range(llamadas):
+        inicio = time.perf_counter()
+        await llm.ainvoke(MENSAJE)
+        duraciones.append(time.perf_counter() - inicio)
+    return duraciones
+
+
+async def test_una_rafaga_de_429_se_reintenta_respetando_el_retry_after(servidor):
+    servidor.config.update(rafaga_429=3, retry_after=0.1)
+    inicio = time.perf_counter()
+    respuesta = await gateway(servidor).ainvoke(MENSAJE)
+    assert "Final Answer" in respuesta.content
+    # 3 rechazos + 1 exito
+    assert servidor.peticiones == 4
+    assert time.perf_counter() - inicio >= 0.3
+
+
+async def test_la_salida_estructurada_pasa_por_el_gateway(servidor):
+    evaluador = crear_evaluador_estructurado(gateway(servidor))
+    casos = [{"prueba": "Glucosa", "valor_paciente": "250 mg/dl", "criterios": {"apto": "< 100"}}]
+    respuesta = await evaluador.ainvoke({"casos_json": json.dumps(casos)})
+    parsed = respuesta.get("parsed")
+    assert parsed is not None and parsed.evaluaciones[0].prueba == "Glucosa"
+
+
+async def test_un_proveedor_lento_agota_el_plazo_total(servidor):
+    servidor.config.update(latencia_ms=2000)
+    inicio = time.perf_counter()
+    with pytest.raises(LLMNoDisponible):
+        await gateway(servidor, timeout_s=0.3, deadline_s=1.0).ainvoke(MENSAJE)
+    assert time.perf_counter() - inicio < 1.5
+
+
+async def test_el_hedging_recorta_la_cola_lenta(servidor):
+    # Una de cada cinco respuestas tarda 600 ms; la copia lanzada a los 100 ms llega antes
+    servidor.config.update(latencia_ms=20, cola_lenta=0.2, latencia_cola_ms=600)
+    sin = await latencias(gateway(servidor), 30)
+    con = await latencias(gateway(servidor, hedge_ms=100), 30)
+    assert statistics.quantiles(con, n=10)[-1] < statistics.quantiles(sin, n=10)[-1] / 2
+
+
+async def test_el_circuito_se_abre_con_el_proveedor_caido_y_la_prueba_queda_pendiente(servidor, monkeypatch):
+    servidor.config.update(caida=True)
+    llm = gateway(servidor, max_reintentos=10)
+    llm.circuito.fallos, llm.circuito.enfriamiento_s = 3, 0.5
+    with pytest.raises(CircuitoAbierto):
+        await llm.ainvoke(MENSAJE)
+    assert llm.circuito.estado == ABIERTO
+    assert servidor.peticiones == 3
+
+    # Con el circuito abierto la llamada falla de inmediato
+    inicio = time.perf_counter()
+    with pytest.raises(CircuitoAbierto):
+        await llm.ainvoke(MENSAJE)
+    assert time.perf_counter() - inicio < 0.05
+
+    verdict_cache.clear()
+    monkeypatch.setattr(orchestrator, "evaluation_agent_executor", crear_agente_evaluador(llm))
+    resultado = await orchestrator.evaluate_test(CRITERIO, CRITERIO.nombre_prueba, "Hallazgos leves en la placa")
+    assert resultado["source"] == "fallback" and resultado["verdict"] == "Pendiente"
+    # El respaldo no entra al cache
+    assert verdict_cache.get(CRITERIO, CRITERIO.nombre_prueba, "Hallazgos leves en la placa") is None
+
+    servidor.config.update(caida=False)
+    await asyncio.sleep(0.6)
+    respuesta = await llm.ainvoke(MENSAJE)
+    assert "Final Answer" in respuesta.content and llm.circuito.estado == CERRADO
+
+
+def test_el_limite_de_peticiones_por_minuto_espacia_las_llamadas():
+    planificador = Planificador(rpm=60, tpm=0)
+    esperas = [planificador.reservar(100) for _ in range(62)]
+    assert max(esperas[:60]) == 0
+    assert 0.9 < esperas[60] < 1.1 and 1.9 < esperas[61] < 2.1
+
+
+def test_el_limite_de_tokens_frena_las_llamadas_grandes_y_devuelve_lo_reservado_de_mas():
+    planificador = Planificador(rpm=0, tpm=1000)
+    planificador.reservar(800)
+    assert planificador.reservar(800) > 30
+
+    planificador = Planificador(rpm=0, tpm=1000)
+    planificador.reservar(800)
+    planificador.ajustar_tokens(800, 100)
+    assert planificador.reservar(800) == 0
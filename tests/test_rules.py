@@ -0,0 +1,70 @@
+import pytest
+
+from backend.app.agents.context import CriterioContext
+from backend.app.agents.rules import evaluar_con_reglas, normalizar_veredicto, numero_comparable
+
+GLUCOSA = CriterioContext(
+    id=1, empresa="E", perfil="P", tipo_examen="INGRESO", nombre_prueba="Glucosa",
+    apto="Entre 70 y 110 mg/dl", observado="Entre 111 y 125 mg/dl o < 70 mg/dl", no_apto="> 125 mg/dl",
+)
+IMC = CriterioContext(
+    id=2, empresa="E", perfil="P", tipo_examen="INGRESO", nombre_prueba="IMC",
+    apto="IMC entre 18.5 y 24.9", observado="IMC entre 25.0 y 34.9 o IMC <18.5", no_apto="IMC > 35",
+)
+
+
+@pytest.mark.parametrize("salida, esperado", [
+    ("Apto", "Apto"),
+    ("'No Apto'.", "No Apto"),
+    ("**Observado**", "Observado"),
+    ("El paciente es Apto", "Apto"),
+    ("Apto, sin alteraciones", "Apto"),
+    ("Apto. El valor no supera el limite", "Apto"),
+    ("NO  APTO", "No Apto"),
+])
+def test_normalizar_veredicto_reconoce_el_veredicto(salida, esperado):
+    assert normalizar_veredicto(salida) == esperado
+
+
+@pytest.mark.parametrize("salida", [
+    "El paciente no es apto",
+    "Ni apto ni observado",
+    "Apto u Observado",
+    "Agent stopped due to iteration limit or time limit.",
+    "Error",
+    "",
+    None,
+])
+def test_normalizar_veredicto_rechaza_respuestas_dudosas(salida):
+    assert normalizar_veredicto(salida) is None
+
+
+@pytest.mark.parametrize("criterio, valor, esperado", [
+    (GLUCOSA, "95 mg/dl", "Apto"),
+    (GLUCOSA, "130 MG/DL", "No Apto"),
+    (GLUCOSA, "95", "Apto"),
+    # El criterio no escribe la unidad: el numero se compara tal cual
+    (IMC, "24.5 kg/m²", "Apto"),
+])
+def test_evaluar_con_reglas_decide_en_la_unidad_del_criterio(criterio, valor, esperado):
+    assert evaluar_con_reglas(criterio, valor)["verdict"] == esperado
+
+
+@pytest.mark.parametrize("valor", ["1.2 g/dl", "95 mg", "95 mg/dl x"])
+def test_evaluar_con_reglas_deja_al_agente_otra_unidad(valor):
+    assert evaluar_con_reglas(GLUCOSA, valor) is None
+
+
+def test_numero_comparable_usa_la_unidad_de_la_ingesta():
+    assert numero_comparable(GLUCOSA, "95 mg/dl", 95.0, "mg/dl") == 95.0
+    assert numero_comparable(GLUCOSA, "1.2 g/dl", 1.2, "g/dl") is None
+    assert numero_comparable(GLUCOSA, "Normal") is None
+    assert numero_comparable(GLUCOSA, None) is None
+
+
+def test_las_formas_de_escribir_una_unidad_se_consideran_la_misma():
+    frecuencia = CriterioContext(
+        id=3, empresa="E", perfil="P", tipo_examen="INGRESO", nombre_prueba="Frecuencia cardiaca",
+        apto="Entre 60 y 100 lpm", observado="Entre 50 y 59 lpm o entre 101 y 120 lpm", no_apto="> 120 lpm o < 50 lpm",
+    )
+    assert evaluar_con_reglas(frecuencia, "72 bpm")["verdict"] == "Apto"
@@ -0,0 +1,28 @@
+from sqlalchemy import create_engine
+
+from backend.app.agents.cohort import tamizar
+from backend.app.agents.whatif import simular
+from backend.benchmarks.bench_whatif import CAMBIOS, aplicar
+from backend.benchmarks.synthetic import EMPRESA
+
+
+def test_el_simulador_da_los_veredictos_de_un_tamizaje_con_los_criterios_cambiados(base_sintetica):
+    ruta, _ = base_sintetica(2000)
+    engine = create_engine(f"sqlite:///{ruta}")
+
+    simulacion = simular(engine, CAMBIOS, usar_cache=False, limite=None)
+    antes = tamizar(engine, EMPRESA, usar_cache=False).pacientes
+    aplicar(engine, CAMBIOS)
+    despues = tamizar(engine, EMPRESA, usar_cache=False).pacientes
+
+    general = antes[["paciente_id", "veredicto_general"]].merge(
+        despues[["paciente_id", "veredicto_general"]], on="paciente_id", suffixes=("_antes", "_despues")
+    )
+    esperados = {
+        fila.paciente_id: (fila.veredicto_general_antes, fila.veredicto_general_despues)
+        for fila in general.itertuples(index=False)
+        if fila.veredicto_general_antes != fila.veredicto_general_despues
+    }
+    # Si los cambios no movieran ningun veredicto la comparacion no probaria nada
+    assert esperados
+    assert {p["paciente_id"]: (p["antes"], p["despues"]) for p in simulacion["pacientes"]} == esperados